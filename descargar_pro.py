@@ -9,18 +9,55 @@ Descargador Automático de Datos Históricos
 import subprocess
 import sys
 import os
+import sqlite3
+import time
 from datetime import datetime, timedelta
 
 # pandas se importará después si es necesario
 
 class DataDownloader:
-    def __init__(self):
+    def __init__(self, sesion=None, cache_crudo=None):
         self.fecha_inicio = None
         self.fecha_fin = None
         self.tipo_descarga = None  # 'forex' o 'indices'
         self.instrumentos = []
         self.temporalidad = None
         self.ruta_guardado = None
+        self.esquema_compacto = None  # None, 'float32' o 'int32'
+        self.archivar_ticks = False   # Guardar ticks en archivo comprimido .dtk
+        self.barras_alternativas = None  # (tipo, umbral) de barras construidas desde los ticks
+        self.serie_spread = None      # Temporalidad de la serie mid/spread derivada de los ticks
+        self.sintetizar_cruces = False  # Cruces calculados desde los majors USD en vez de descargarlos
+        self.particionado = False     # Estructura source=/symbol=/timeframe=/year=/month=
+        self.modo_actualizar = False  # Agregar solo filas nuevas a series existentes
+        self.dias_revision = 3        # Días recientes que se revisan por correcciones al actualizar
+        
+        # Presupuestos opcionales (rechazan trabajos que los superen)
+        self.limite_bytes = None
+        self.limite_segundos = None
+        self.progreso = None
+        # (simbolo, temporalidad) -> entrada registrada en el catálogo en esta
+        # ejecución; la cola la usa para unir después las ventanas de un símbolo
+        self.registradas = {}
+        # (simbolo, temporalidad) -> primera barra escrita al anexar a una serie
+        # existente; el demonio republica en Arrow solo desde ahí
+        self.anexadas = {}
+        
+        # Carpeta local de wheels para instalar sin red (ver construir_wheelhouse)
+        self.wheelhouse = os.environ.get('DESCARGAR_WHEELHOUSE')
+        
+        # Clientes propios de Yahoo y Dukascopy (sin yfinance/duka) y, con
+        # ellos, la caché opcional de respuestas crudas con los payloads originales.
+        # La cola pasa la sesión y la caché de su worker para no abrirlas por tarea.
+        self.directo = os.environ.get('DESCARGAR_DIRECTO') == '1'
+        limite_cache = os.environ.get('DESCARGAR_CACHE_CRUDO_GB')
+        if cache_crudo is None and limite_cache:
+            cache_crudo = CacheCrudo(limite_bytes=float(limite_cache) * 1024**3)
+        self.cache_crudo = cache_crudo
+        self.sesion = sesion or SesionHTTP()
+        
+        # Zona canónica de los archivos de salida (None = la de cada proveedor)
+        self.zona_canonica = os.environ.get('DESCARGAR_ZONA') or None
         
         # Temporalidades para Forex
         self.timeframes_forex = {
@@ -47,10 +84,12 @@ class DataDownloader:
         }
         
     def instalar_dependencias(self):
-        """Instala duka y yfinance automáticamente"""
+        """Instala duka y yfinance automáticamente (desde el wheelhouse si está configurado)"""
         print("\n" + "="*60)
         print("VERIFICANDO E INSTALANDO DEPENDENCIAS")
         print("="*60)
+        if self.wheelhouse:
+            print(f"📦 Modo sin red: instalando desde {self.wheelhouse}")
         
         dependencias_instaladas = True
         
@@ -61,7 +100,7 @@ class DataDownloader:
         except ImportError:
             print("Instalando pandas...")
             try:
-                subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'pandas'])
+                instalar_paquetes(['pandas'], self.wheelhouse)
                 print("✓ pandas instalado correctamente")
             except Exception as e:
                 print(f"✗ Error al instalar pandas: {e}")
@@ -69,37 +108,16 @@ class DataDownloader:
         
         # Verificar/Instalar duka (SIN GIT)
         try:
-            result = subprocess.run(['pip', 'show', 'duka'], 
-                                  capture_output=True, text=True)
-            if result.returncode == 0:
+            if paquete_instalado('duka'):
                 print("✓ Duka ya está instalado")
+            elif self.wheelhouse:
+                print("Instalando duka desde el wheelhouse...")
+                instalar_paquetes(['duka'], self.wheelhouse)
+                print("✓ Duka instalado correctamente (sin red)")
             else:
                 print("Instalando duka (descarga directa, sin Git)...")
-                # Descargar ZIP del repositorio directamente
-                import urllib.request
-                import zipfile
-                import tempfile
-                import shutil
-                
-                # URL del ZIP del repositorio
-                zip_url = "https://github.com/giuse88/duka/archive/refs/heads/master.zip"
-                
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    zip_path = os.path.join(tmpdir, "duka.zip")
-                    
-                    # Descargar
-                    print("  Descargando duka...")
-                    urllib.request.urlretrieve(zip_url, zip_path)
-                    
-                    # Extraer
-                    print("  Extrayendo archivos...")
-                    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                        zip_ref.extractall(tmpdir)
-                    
-                    # Instalar
-                    print("  Instalando duka...")
-                    duka_dir = os.path.join(tmpdir, "duka-master")
-                    subprocess.check_call([sys.executable, '-m', 'pip', 'install', duka_dir])
+                # El ZIP y el wheel quedan en la caché del usuario para otros venvs
+                instalar_paquetes([obtener_wheel_duka()])
                 
                 print("✓ Duka instalado correctamente (sin Git)")
         except Exception as e:
@@ -109,15 +127,11 @@ class DataDownloader:
         
         # Verificar/Instalar yfinance
         try:
-            result = subprocess.run(['pip', 'show', 'yfinance'], 
-                                  capture_output=True, text=True)
-            if result.returncode == 0:
+            if paquete_instalado('yfinance'):
                 print("✓ yfinance ya está instalado")
             else:
                 print("Instalando yfinance...")
-                subprocess.check_call([
-                    sys.executable, '-m', 'pip', 'install', 'yfinance'
-                ])
+                instalar_paquetes(['yfinance'], self.wheelhouse)
                 print("✓ yfinance instalado correctamente")
         except Exception as e:
             print(f"✗ Error al instalar yfinance: {e}")
@@ -261,12 +275,19 @@ class DataDownloader:
             mapeo[idx] = simbolo
             idx += 1
         
+        universos = listar_universos()
+        if universos:
+            print("\n🌐 UNIVERSOS (carpeta universos/):")
+            print(f"  {', '.join('@' + u for u in universos)}")
+        
         print("\n⚠️ IMPORTANTE: Para otros instrumentos, use los símbolos de Yahoo Finance")
         print("   Ejemplo: BTC-USD (Bitcoin), GC=F (Oro), CL=F (Petróleo)")
         
         print("\nOpciones:")
         print("  - Ingrese números separados por comas (ej: 1,2,3)")
         print("  - Ingrese símbolos manualmente (ej: ^GSPC,AAPL,MSFT)")
+        if universos:
+            print("  - Ingrese un universo con @, solo o junto a símbolos (ej: @sp500,^VIX)")
         
         seleccion = input("\nSu selección: ").strip().upper()
         
@@ -274,9 +295,16 @@ class DataDownloader:
             indices = [int(x.strip()) for x in seleccion.split(',')]
             self.instrumentos = [mapeo[i] for i in indices if i in mapeo]
         else:
-            self.instrumentos = [s.strip() for s in seleccion.split(',')]
+            try:
+                self.instrumentos = resolver_instrumentos(seleccion.split(','))
+            except Exception as e:
+                print(f"✗ No se pudo leer el universo: {e}")
+                self.instrumentos = []
         
-        print(f"\n✓ Instrumentos seleccionados: {', '.join(self.instrumentos)}")
+        print(f"\n✓ Instrumentos seleccionados: {resumir_lista(self.instrumentos)}")
+        if len(self.instrumentos) > 200:
+            print("💡 Para miles de símbolos conviene la cola: \"universo\" y \"lote\" en un manifiesto "
+                  "y varios workers (ver README)")
     
     def validar_temporalidad_periodo(self):
         """Valida que la temporalidad sea compatible con el período seleccionado"""
@@ -381,6 +409,68 @@ class DataDownloader:
         # Crear el directorio si no existe
         os.makedirs(self.ruta_guardado, exist_ok=True)
         print(f"✓ Los datos se guardarán en: {self.ruta_guardado}")
+        
+        print("\nFormato de los archivos:")
+        print("  1. CSV estándar")
+        print("  2. Compacto - timestamps epoch-ms, precios float32, volúmenes uint32")
+        print("  3. Compacto - precios enteros escalados por tamaño de punto (int32)")
+        if self.tipo_descarga == 'forex' and self.temporalidad == 'tick':
+            print("  4. Archivo de ticks .dtk - delta + zstd/LZMA con índice de bloques")
+        opcion = input("Seleccione (Enter = 1): ").strip()
+        self.esquema_compacto = {'2': 'float32', '3': 'int32'}.get(opcion)
+        self.archivar_ticks = opcion == '4' and self.temporalidad == 'tick'
+        if self.esquema_compacto:
+            print(f"✓ Formato compacto ({self.esquema_compacto}) activado")
+        elif self.archivar_ticks:
+            print("✓ Los ticks se guardarán en archivos .dtk")
+        
+        if self.tipo_descarga == 'forex' and self.temporalidad == 'tick':
+            print("\n¿Construir también barras alternativas desde los ticks?")
+            print("  1. Ticks (cada N ticks)      2. Volumen (cada N lotes)")
+            print("  3. Dólar (cada N de valor)   4. Rango (alto - bajo >= N)")
+            print("  5. Renko (ladrillos de N)")
+            tipo = {'1': 'tick', '2': 'volumen', '3': 'dolar', '4': 'rango', '5': 'renko'}.get(
+                input("Seleccione (Enter = no): ").strip())
+            if tipo:
+                while True:
+                    try:
+                        umbral = float(input(f"Umbral N para barras de {tipo}: ").strip())
+                        if umbral > 0:
+                            break
+                    except ValueError:
+                        pass
+                    print("✗ Ingrese un número positivo")
+                self.barras_alternativas = (tipo, umbral)
+                print(f"✓ Se construirán barras de {tipo} ({umbral:g})")
+            
+            print("\n¿Guardar también la serie de mid y spread (ask - bid) por barra?")
+            print("  (OHLC del mid, spread medio/mín/máx y ponderado por tiempo, para modelar costos)")
+            while True:
+                temporalidad = input("Temporalidad M1, M5, M15, M30, H1, H4, D1 (Enter = no): ").strip().upper()
+                if not temporalidad or FRECUENCIAS_PANDAS.get(temporalidad):
+                    break
+                print("✗ Temporalidad no válida")
+            if temporalidad:
+                self.serie_spread = temporalidad
+                print(f"✓ Se guardará la serie de spread en {temporalidad}")
+        
+        if self.tipo_descarga == 'forex' and any(patas_cruce(p) for p in self.instrumentos):
+            print("\n¿Sintetizar los cruces (EURGBP, EURJPY...) desde los majors USD?")
+            print("  (menos descargas; si ya hay un cruce nativo guardado se marcan las diferencias)")
+            self.sintetizar_cruces = input("Sintetizar (s/N): ").strip().upper() == 'S'
+            if self.sintetizar_cruces:
+                print("✓ Los cruces se calcularán desde los majors")
+        
+        print("\n¿Organizar los datos en carpetas particionadas?")
+        print("  (source=/symbol=/timeframe=/year=/month=, lectura por rangos sin abrir todo)")
+        self.particionado = input("Particionar (s/N): ").strip().upper() == 'S'
+        if self.particionado:
+            print("✓ Estructura particionada activada")
+        
+        if self.tipo_descarga == 'indices':
+            print("\n¿Actualizar las series que ya existen en la carpeta?")
+            print("  (solo se agregan las filas posteriores al último dato guardado)")
+            self.modo_actualizar = input("Actualizar (s/N): ").strip().upper() == 'S'
     
     def mostrar_resumen(self):
         """Muestra un resumen de la configuración"""
@@ -391,9 +481,25 @@ class DataDownloader:
         print(f"Fecha inicio:    {self.fecha_inicio.strftime('%Y-%m-%d')}")
         print(f"Fecha fin:       {self.fecha_fin.strftime('%Y-%m-%d')}")
         print(f"Período:         {(self.fecha_fin - self.fecha_inicio).days} días")
-        print(f"Instrumentos:    {', '.join(self.instrumentos)}")
+        print(f"Instrumentos:    {resumir_lista(self.instrumentos)}")
         print(f"Temporalidad:    {self.temporalidad}")
         print(f"Guardar en:      {self.ruta_guardado}")
+        if self.archivar_ticks:
+            print(f"Formato:         Archivo de ticks .dtk")
+        else:
+            print(f"Formato:         {'Compacto (' + self.esquema_compacto + ')' if self.esquema_compacto else 'CSV estándar'}")
+        if self.barras_alternativas:
+            print(f"Barras extra:    {self.barras_alternativas[0]} ({self.barras_alternativas[1]:g})")
+        if self.serie_spread:
+            print(f"Spread:          Mid y spread por barra de {self.serie_spread}")
+        if self.zona_canonica:
+            print(f"Zona horaria:    {self.zona_canonica} (barras diarias alineadas a su sesión)")
+        if self.sintetizar_cruces:
+            print(f"Cruces:          Sintetizados desde los majors USD")
+        if self.particionado:
+            print(f"Estructura:      Particionada (source=/symbol=/timeframe=/year=/month=)")
+        if self.modo_actualizar:
+            print(f"Modo:            Actualizar series existentes (solo filas nuevas)")
         
         # Advertencias específicas para índices
         if self.tipo_descarga == 'indices':
@@ -411,11 +517,101 @@ class DataDownloader:
                     print(adv)
                 print("💡 Recomendación: Usa temporalidad '1d' (diaria)")
         
+        if not self.mostrar_estimacion():
+            print("="*60)
+            print("✗ La descarga supera el presupuesto configurado. Reduzca el período o los instrumentos.")
+            return False
+        
         print("="*60)
         
         confirmar = input("\n¿Desea proceder con la descarga? (S/n): ").strip().upper()
         return confirmar != 'N'
     
+    def factor_disco(self):
+        """
+        Proporción del tamaño en disco respecto al CSV estándar según el formato
+        elegido: la medida en conversiones anteriores o un valor típico.
+        """
+        if self.archivar_ticks:
+            return HistorialRendimiento().factor('dtk', 0.086)
+        if self.esquema_compacto:
+            return HistorialRendimiento().factor(f"compacto_{self.esquema_compacto}", 0.6)
+        return 1.0
+    
+    def estimar(self):
+        """Estimación de peticiones, filas, bytes y tiempo para la configuración actual"""
+        return estimar_descarga(self.tipo_descarga, self.instrumentos, self.temporalidad,
+                                self.fecha_inicio, self.fecha_fin, factor_disco=self.factor_disco())
+    
+    def mostrar_estimacion(self):
+        """Imprime la estimación por instrumento. Devuelve False si excede los presupuestos"""
+        try:
+            estimacion = self.estimar()
+        except Exception as e:
+            print(f"⚠️ No se pudo estimar la descarga: {e}")
+            return True
+        
+        total = estimacion['total']
+        origen = "historial" if any(e['medido'] for e in estimacion['instrumentos']) else "valores típicos"
+        print("="*60)
+        print(f"ESTIMACIÓN (según {origen})")
+        print(f"  {'Instrumento':12s} {'Peticiones':>10s} {'Filas':>12s} {'Disco':>10s} {'Tiempo':>9s}")
+        for e in estimacion['instrumentos'][:20]:
+            print(f"  {e['instrumento']:12s} {e['peticiones']:10,d} {e['filas']:12,d} "
+                  f"{formatear_bytes(e['bytes']):>10s} {formatear_duracion(e['segundos']):>9s}")
+        if len(estimacion['instrumentos']) > 20:
+            print(f"  ... y {len(estimacion['instrumentos']) - 20} instrumentos más")
+        print(f"  {'TOTAL':12s} {total['peticiones']:10,d} {total['filas']:12,d} "
+              f"{formatear_bytes(total['bytes']):>10s} {formatear_duracion(total['segundos']):>9s}")
+        
+        dentro = True
+        if self.limite_bytes is not None and total['bytes'] > self.limite_bytes:
+            print(f"✗ Disco estimado {formatear_bytes(total['bytes'])} > límite {formatear_bytes(self.limite_bytes)}")
+            dentro = False
+        if self.limite_segundos is not None and total['segundos'] > self.limite_segundos:
+            print(f"✗ Tiempo estimado {formatear_duracion(total['segundos'])} > límite "
+                  f"{formatear_duracion(self.limite_segundos)}")
+            dentro = False
+        return dentro
+    
+    def registrar_rendimiento(self, ruta_archivo, segundos, filas=None, fecha_inicio=None, csv_estandar=False,
+                              simbolo=None):
+        """
+        Guarda el rendimiento real de una descarga para afinar estimaciones futuras.
+        Devuelve (filas, bytes) del archivo.
+        """
+        try:
+            if not ruta_archivo or not os.path.isfile(ruta_archivo):
+                return 0, 0
+            bytes_disco = os.path.getsize(ruta_archivo)
+            if filas is None:
+                with open(ruta_archivo, 'rb') as f:
+                    filas = max(sum(bloque.count(b'\n') for bloque in iter(lambda: f.read(1 << 20), b'')) - 1, 0)
+            inicio = fecha_inicio or self.fecha_inicio
+            simbolo = simbolo or (self.instrumentos[0] if self.instrumentos else None)
+            dias = dias_mercado(self.tipo_descarga, inicio, self.fecha_fin, simbolo)
+            if self.tipo_descarga == 'forex':
+                rangos = planificar_rangos('forex', simbolo, inicio, self.fecha_fin + timedelta(days=1))
+                peticiones = max(peticiones_forex(rangos), 1)
+            else:
+                peticiones = 1
+            HistorialRendimiento().registrar(self.tipo_descarga, self.temporalidad, dias, filas,
+                                             bytes_disco / (1.0 if csv_estandar else self.factor_disco()),
+                                             segundos, peticiones)
+            return filas, bytes_disco
+        except Exception as e:
+            # El historial es solo una ayuda para estimar; nunca detiene la descarga
+            print(f"  ⚠️ No se pudo registrar el rendimiento de {os.path.basename(ruta_archivo or '')}: {e}")
+            return 0, 0
+    
+    def registrar_factor(self, formato, bytes_formato, bytes_csv):
+        """Guarda cuánto ocupa un formato respecto al CSV estándar del que salió"""
+        try:
+            if bytes_csv > 0:
+                HistorialRendimiento().registrar_factor(formato, bytes_formato / bytes_csv)
+        except Exception as e:
+            print(f"  ⚠️ No se pudo registrar el tamaño del formato {formato}: {e}")
+    
     def descargar_forex(self):
         """
         Descarga Forex con duka. 
@@ -432,81 +628,696 @@ class DataDownloader:
             self.fecha_fin = self.fecha_fin - timedelta(days=1)
             print(f"   -> Fecha fin ajustada a ayer: {self.fecha_fin.strftime('%Y-%m-%d')}")
 
-        total = len(self.instrumentos)
+        cruces, pares = self.planificar_cruces() if self.sintetizar_cruces else ([], self.instrumentos)
+        total = len(pares)
+        exitosos = 0
+        with ReporteProgreso(total, "Forex") as self.progreso:
+            for idx, par in self.progreso.recorrer(pares):
+                proveedor = 'Dukascopy (cliente directo)' if self.directo else 'Duka'
+                print(f"\n[{idx}/{total}] Intentando descargar {par} con {proveedor}...")
+                inicio_par = time.perf_counter()
+                
+                # Solo se piden días con mercado abierto (sin el fin de semana en los extremos).
+                # duka incluye el día final, por eso el rango se planifica hasta fin + 1.
+                rangos = planificar_rangos('forex', par, self.fecha_inicio, self.fecha_fin + timedelta(days=1))
+                if not rangos:
+                    print("  ✗ El rango no tiene sesiones de mercado (fin de semana)")
+                    continue
+                
+                try:
+                    if self.directo:
+                        self.descargar_dukascopy_directo(par, rangos)
+                        completo = True
+                    else:
+                        completo = self.ejecutar_duka(par, rangos)
+                    
+                    # 2. VERIFICACIÓN DE ARCHIVO 0KB
+                    # Buscamos el archivo más reciente creado en la carpeta
+                    archivos = [os.path.join(self.ruta_guardado, f) for f in os.listdir(self.ruta_guardado)
+                                if f.startswith(f"{par}-") and f.endswith('.csv')] if completo else []
+                    descarga_exitosa = False
+                    archivo_primario = None
+                    archivo_final = None
+                    fuente = 'dukascopy'
+                    temporalidad_final = self.temporalidad
+                    reporte = None
+                    
+                    if archivos:
+                        archivo_reciente = max(archivos, key=os.path.getctime)
+                        tamano = os.path.getsize(archivo_reciente)
+                        
+                        if tamano > 0:
+                            print(f"  ✓ ÉXITO: {par} descargado ({tamano/1024:.2f} KB)")
+                            descarga_exitosa = True
+                            filas, bytes_disco = self.registrar_rendimiento(
+                                archivo_reciente, time.perf_counter() - inicio_par, csv_estandar=True, simbolo=par)
+                            self.progreso.avanzar(filas, bytes_disco)
+                            archivo_primario = archivo_reciente
+                            if self.zona_canonica and self.temporalidad != 'tick':
+                                self.guardar_datos(self.normalizar_salida(leer_datos(archivo_reciente)),
+                                                   archivo_reciente, par)
+                                if self.temporalidad == 'D1' and self.zona_canonica != 'UTC' and not self.directo:
+                                    print("  💡 Las velas D1 de duka cortan el día a medianoche UTC; con --directo "
+                                          "se arman desde los ticks al cierre de la sesión canónica")
+                            elif self.esquema_compacto:
+                                self.guardar_datos(leer_datos(archivo_reciente), archivo_reciente, par)
+                                self.registrar_factor(f"compacto_{self.esquema_compacto}",
+                                                      os.path.getsize(archivo_reciente), tamano)
+                            reporte = self.validar_archivo(archivo_reciente, simbolo=par)
+                            if self.archivar_ticks and self.temporalidad == 'tick':
+                                archivo_primario = self.archivar_ticks_dtk(archivo_reciente, par)
+                            archivo_final = archivo_primario
+                        else:
+                            print(f"  ✗ FALLO: El archivo se creó pero está vacío (0 KB).")
+                            print("    Posible causa: Duka no tiene datos para este rango o bloqueó la IP.")
+                            try:
+                                os.remove(archivo_reciente) # Borrar archivo basura
+                            except: pass
+                    
+                    # 3. PLAN B: USAR YFINANCE SI DUKA FALLA
+                    if not descarga_exitosa:
+                        print(f"\n  ⚠️ ACTIVANDO PLAN B: Intentando descargar {par} desde Yahoo Finance...")
+                        ruta_respaldo = self.descargar_forex_backup_yfinance(par)
+                        descarga_exitosa = ruta_respaldo is not None
+                        archivo_final, fuente = ruta_respaldo, 'yahoo'
+                        temporalidad_final = MAPA_DUKA_YAHOO.get(self.temporalidad, '1d')
+                        if descarga_exitosa and self.temporalidad != 'tick':
+                            consolidado = self.consolidar_forex(par, None, ruta_respaldo)
+                            if consolidado:
+                                archivo_final, temporalidad_final = consolidado, self.temporalidad
+                    
+                    # 4. HUECOS PARCIALES: completar solo lo que le falta a duka
+                    elif self.temporalidad != 'tick' and reporte and reporte.get('barras_faltantes'):
+                        desde, hasta = (datetime.fromisoformat(t) for t in reporte['rango_faltante'])
+                        desde = max(desde.replace(tzinfo=None), self.fecha_inicio)
+                        hasta = min(hasta.replace(tzinfo=None) + timedelta(days=1), self.fecha_fin)
+                        print(f"  ⚠️ Completando {reporte['barras_faltantes']:,} barras faltantes con Yahoo Finance "
+                              f"({desde.strftime('%Y-%m-%d')} -> {hasta.strftime('%Y-%m-%d')})...")
+                        ruta_respaldo = self.descargar_forex_backup_yfinance(par, desde, hasta)
+                        if ruta_respaldo is not None:
+                            consolidado = self.consolidar_forex(par, archivo_primario, ruta_respaldo)
+                            if consolidado:
+                                archivo_final, fuente = consolidado, 'consolidado'
+                    
+                    if descarga_exitosa:
+                        self.progreso.marcar_exito()
+                        if par in self.instrumentos:
+                            exitosos += 1
+                        if self.barras_alternativas and fuente == 'dukascopy' and self.temporalidad == 'tick':
+                            self.generar_barras_alternativas(archivo_final, par)
+                        if self.serie_spread and fuente == 'dukascopy' and self.temporalidad == 'tick':
+                            self.generar_serie_spread(archivo_final, par)
+                        if self.particionado and archivo_final:
+                            self.publicar_particionado(archivo_final, fuente, par, temporalidad_final)
+                        elif archivo_final:
+                            fin = leer_ultimo_timestamp(archivo_final) if archivo_final.endswith('.csv') else None
+                            self.registrar_serie(par, archivo_final, fuente, self.fecha_inicio, fin, None,
+                                                 temporalidad=temporalidad_final)
+
+                except Exception as e:
+                    print(f"  ✗ Error crítico: {e}")
         
-        for idx, par in enumerate(self.instrumentos, 1):
-            print(f"\n[{idx}/{total}] Intentando descargar {par} con Duka...")
-            
-            fecha_inicio_str = self.fecha_inicio.strftime("%Y-%m-%d")
-            fecha_fin_str = self.fecha_fin.strftime("%Y-%m-%d")
-            
-            # Construcción del comando duka corregido
-            cmd = [
-                'duka', par, '-s', fecha_inicio_str, '-e', fecha_fin_str,
-                '--folder', self.ruta_guardado
-            ]
-            
-            if self.temporalidad != 'tick':
-                cmd.extend(['-c', self.temporalidad]) # -c para velas (candles)
-            
+        if cruces:
+            exitosos += self.sintetizar_cruces_forex(cruces)
+        return exitosos
+    
+    def planificar_cruces(self):
+        """
+        Separa los cruces sintetizables de la selección. Devuelve (cruces, pares
+        a descargar): lo pedido que no es cruce más los majors que necesitan y
+        que no estén ya guardados para todo el rango.
+        """
+        cruces = [p for p in self.instrumentos if patas_cruce(p)]
+        necesarios = [p for p in self.instrumentos if p not in cruces]
+        for cruce in cruces:
+            necesarios.extend(par for par, _ in patas_cruce(cruce))
+        pares = [p for p in dict.fromkeys(necesarios) if p in self.instrumentos or not self.serie_cubierta(p)]
+        
+        print(f"\n🔀 Cruces sintéticos: {resumir_lista(cruces)}")
+        print(f"   {len(pares)} descargas en lugar de {len(self.instrumentos)}"
+              + (f" (majors: {', '.join(p for p in pares if p not in self.instrumentos)})"
+                 if any(p not in self.instrumentos for p in pares) else ""))
+        return cruces, pares
+    
+    def serie_cubierta(self, par):
+        """True si el catálogo ya tiene la serie del par para todo el rango pedido"""
+        entrada = Catalogo(self.ruta_guardado).obtener(par, self.temporalidad)
+        if not entrada or not entrada.get('inicio') or not entrada.get('fin') or not os.path.exists(entrada['ruta']):
+            return False
+        # El último dato puede caer antes del fin pedido por fin de semana o feriado
+        return (_a_utc(entrada['inicio']) <= _a_utc(self.fecha_inicio)
+                and _a_utc(entrada['fin']) >= _a_utc(self.fecha_fin - timedelta(days=3)))
+    
+    def sintetizar_cruces_forex(self, cruces):
+        """
+        Construye cada cruce desde sus majors guardados, lo compara con el cruce
+        nativo si ya hay uno en la carpeta y lo guarda. Devuelve los exitosos.
+        """
+        import json
+        
+        print("\n" + "="*60)
+        print("SINTETIZANDO CRUCES DESDE LOS MAJORS USD")
+        print("="*60)
+        
+        cliente = ClienteDatos([self.ruta_guardado], sesion=self.sesion, cache_crudo=self.cache_crudo)
+        inicio, fin = self.fecha_inicio, self.fecha_fin + timedelta(days=1)
+        temporalidades = list(dict.fromkeys([self.temporalidad, MAPA_DUKA_YAHOO.get(self.temporalidad)]))
+        exitosos = 0
+        
+        for cruce in cruces:
             try:
-                subprocess.run(cmd, capture_output=True, text=True)
+                inicio_cruce = time.perf_counter()
+                patas = {}
+                for par, _ in patas_cruce(cruce):
+                    temporalidad = next((t for t in temporalidades if t and cliente.buscar(par, t)[1]), None)
+                    if temporalidad is None:
+                        raise ValueError(f"falta la serie de {par}")
+                    patas[par] = cliente.obtener(par, temporalidad, inicio, fin, ajuste='ninguno')
+                
+                df = sintetizar_cruce(cruce, patas, tolerancia='5min' if self.temporalidad == 'tick' else None)
+                if df.empty:
+                    print(f"  ✗ {cruce}: las patas no se solapan en el rango")
+                    continue
                 
-                # 2. VERIFICACIÓN DE ARCHIVO 0KB
-                # Buscamos el archivo más reciente creado en la carpeta
-                archivos = [os.path.join(self.ruta_guardado, f) for f in os.listdir(self.ruta_guardado) if par in f]
-                descarga_exitosa = False
+                # Un cruce nativo ya guardado sirve de control
+                reporte = None
+                _, entrada = cliente.buscar(cruce, self.temporalidad)
+                if entrada and entrada.get('fuente') != 'sintetico':
+                    nativo = cliente.obtener(cruce, self.temporalidad, inicio, fin, ajuste='ninguno')
+                    reporte, diferencias = comparar_con_nativo(df, nativo, cruce)
+                    if 'close' in df.columns:
+                        df['diferencia_puntos'] = diferencias.reindex(df.index)
                 
-                if archivos:
-                    archivo_reciente = max(archivos, key=os.path.getctime)
-                    tamano = os.path.getsize(archivo_reciente)
-                    
-                    if tamano > 0:
-                        print(f"  ✓ ÉXITO: {par} descargado ({tamano/1024:.2f} KB)")
-                        descarga_exitosa = True
-                    else:
-                        print(f"  ✗ FALLO: El archivo se creó pero está vacío (0 KB).")
-                        print("    Posible causa: Duka no tiene datos para este rango o bloqueó la IP.")
-                        try:
-                            os.remove(archivo_reciente) # Borrar archivo basura
-                        except: pass
+                nombre = (f"{cruce}_SINTETICO_{self.temporalidad}_{self.fecha_inicio.strftime('%Y-%m-%d')}"
+                          f"_to_{self.fecha_fin.strftime('%Y-%m-%d')}.csv")
+                ruta = os.path.join(self.ruta_guardado, nombre)
+                self.guardar_datos(df, ruta, cruce)
+                (par_base, inv_base), (par_cotizada, inv_cotizada) = patas_cruce(cruce)
+                formula = f"{'1/' if inv_base else ''}{par_base} {'×' if inv_cotizada else '/'} {par_cotizada}"
+                print(f"  ✓ {cruce} = {formula}: "
+                      f"{len(df):,} filas en {nombre} ({time.perf_counter() - inicio_cruce:.2f}s)")
                 
-                # 3. PLAN B: USAR YFINANCE SI DUKA FALLA
-                if not descarga_exitosa:
-                    print(f"\n  ⚠️ ACTIVANDO PLAN B: Intentando descargar {par} desde Yahoo Finance...")
-                    self.descargar_forex_backup_yfinance(par)
-
+                if reporte is not None:
+                    with open(os.path.splitext(ruta)[0] + '.sintetico.json', 'w', encoding='utf-8') as f:
+                        json.dump(reporte, f, indent=2, ensure_ascii=False)
+                    simbolo_aviso = "⚠️" if reporte['marcadas'] else "🔎"
+                    print(f"  {simbolo_aviso} Contra el nativo: {reporte['comparadas']:,} comparadas, "
+                          f"media {reporte['diferencia_media_puntos'] or 0:.2f} pts, "
+                          f"máx {reporte['diferencia_max_puntos'] or 0:.1f} pts, "
+                          f"{reporte['marcadas']:,} sobre {reporte['umbral_puntos']:g} pts")
+                
+                if reporte is not None:
+                    pass  # El nativo sigue siendo la serie del catálogo; el sintético queda como control
+                elif self.particionado:
+                    self.publicar_particionado(ruta, 'sintetico', cruce)
+                else:
+                    self.registrar_serie(cruce, ruta, 'sintetico', df.index[0], df.index[-1], len(df))
+                exitosos += 1
             except Exception as e:
-                print(f"  ✗ Error crítico: {e}")
+                print(f"  ✗ No se pudo sintetizar {cruce}: {e}")
+        
+        return exitosos
 
-    def descargar_forex_backup_yfinance(self, par):
-        """Método de respaldo para bajar Forex si Duka falla"""
+    def comando_duka(self, par, desde, hasta, carpeta):
+        """Comando duka para el rango [desde, hasta] (ambos incluidos)"""
+        cmd = [
+            'duka', par, '-s', desde.strftime("%Y-%m-%d"), '-e', hasta.strftime("%Y-%m-%d"),
+            '--folder', carpeta
+        ]
+        
+        if self.temporalidad != 'tick':
+            cmd.extend(['-c', self.temporalidad]) # -c para velas (candles)
+        return cmd
+    
+    def ejecutar_duka(self, par, rangos):
+        """
+        Ejecuta duka sobre los bloques de días con mercado abierto en una
+        carpeta temporal y deja en la carpeta de guardado un único CSV
+        {par}-{inicio}-{fin}.csv (uniendo las partes si hay más de un bloque).
+        Devuelve False si duka terminó con error: no se deja ningún archivo
+        parcial y actúa el plan B.
+        """
+        import shutil
+        
+        carpeta_temporal = os.path.join(self.ruta_guardado, f".duka_{par}_{os.getpid()}")
+        os.makedirs(carpeta_temporal, exist_ok=True)
+        try:
+            for desde, hasta in rangos:
+                resultado = subprocess.run(self.comando_duka(par, desde, hasta - timedelta(days=1), carpeta_temporal),
+                                           capture_output=True, text=True)
+                if resultado.returncode != 0:
+                    detalle = (resultado.stderr or resultado.stdout or '').strip().splitlines()
+                    print(f"  ✗ duka terminó con código {resultado.returncode} en "
+                          f"{desde.strftime('%Y-%m-%d')}..{(hasta - timedelta(days=1)).strftime('%Y-%m-%d')}"
+                          f"{': ' + detalle[-1] if detalle else ''}")
+                    return False
+            
+            partes = sorted(os.path.join(carpeta_temporal, f) for f in os.listdir(carpeta_temporal)
+                            if f.startswith(f"{par}-") and f.endswith('.csv'))
+            if len(partes) == 1:
+                os.replace(partes[0], os.path.join(self.ruta_guardado, os.path.basename(partes[0])))
+                return True
+            
+            inicio, fin = rangos[0][0], rangos[-1][1] - timedelta(days=1)
+            ruta_final = os.path.join(self.ruta_guardado,
+                                      f"{par}-{inicio.strftime('%Y_%m_%d')}-{fin.strftime('%Y_%m_%d')}.csv")
+            
+            with open(ruta_final, 'wb') as salida:
+                largo_cabecera = 0
+                for parte in partes:
+                    with open(parte, 'rb') as entrada:
+                        cabecera = entrada.readline()
+                        if not cabecera:
+                            continue
+                        if not largo_cabecera:
+                            salida.write(cabecera)
+                            largo_cabecera = len(cabecera)
+                        shutil.copyfileobj(entrada, salida, 1 << 20)
+                # Sin filas de datos se deja en 0 KB para que actúe el plan B
+                if salida.tell() <= largo_cabecera:
+                    salida.truncate(0)
+            return True
+        finally:
+            shutil.rmtree(carpeta_temporal, ignore_errors=True)
+    
+    def descargar_dukascopy_directo(self, par, rangos):
+        """
+        Alternativa a duka con la caché de respuestas crudas: baja los .bi5
+        de las horas abiertas y escribe el mismo {par}-{inicio}-{fin}.csv.
+        """
+        import pandas as pd
+        
+        partes = [ticks_dukascopy(par, desde, hasta, cache=self.cache_crudo, sesion=self.sesion)
+                  for desde, hasta in rangos]
+        ticks = pd.concat(partes) if partes else pd.DataFrame()
+        if ticks.empty:
+            return None
+        
+        if self.temporalidad == 'tick':
+            df = ticks
+        else:
+            # Velas sobre el bid, igual que las de duka, más el spread de los mismos ticks
+            df = ticks['bid'].resample(FRECUENCIAS_PANDAS[self.temporalidad], label='left', closed='left').ohlc()
+            df = df.dropna(subset=['close'])
+            acumulador = AcumuladorSpread(self.temporalidad)
+            spread = pd.concat([acumulador.agregar(ticks), acumulador.cerrar()])
+            df = df.join(spread[['spread_medio', 'spread_min', 'spread_max', 'spread_ponderado']])
+            if self.zona_canonica and self.temporalidad == 'D1':
+                # Con los ticks a mano el día se corta en el cierre de la sesión canónica
+                horas = ticks['bid'].resample('1h', label='left', closed='left').ohlc().dropna(subset=['close'])
+                df = agregar_sesiones(horas, self.zona_canonica)
+        
+        inicio, fin = rangos[0][0], rangos[-1][1] - timedelta(days=1)
+        ruta = os.path.join(self.ruta_guardado, f"{par}-{inicio:%Y_%m_%d}-{fin:%Y_%m_%d}.csv")
+        df.to_csv(ruta)
+        if self.cache_crudo is not None:
+            resumen = self.cache_crudo.resumen()
+            print(f"  📦 Caché cruda: {resumen['aciertos']:,} aciertos, {resumen['fallos']:,} descargas "
+                  f"({formatear_bytes(resumen['bytes'])} en disco)")
+        return ruta
+    
+    def descargar_forex_backup_yfinance(self, par, fecha_inicio=None, fecha_fin=None):
+        """
+        Método de respaldo para bajar Forex si Duka falla.
+        Devuelve la ruta del archivo guardado o None si Yahoo no tiene datos.
+        """
         try:
-            import yfinance as yf
             # Convertir formato EURUSD -> EURUSD=X
             simbolo_yahoo = f"{par}=X"
             
-            # Mapeo de temporalidades duka -> yahoo
-            mapa_temp = {
-                'M1': '1m', 'M5': '5m', 'M15': '15m', 'M30': '30m',
-                'H1': '1h', 'D1': '1d'
-            }
-            intervalo = mapa_temp.get(self.temporalidad, '1d')
+            intervalo = MAPA_DUKA_YAHOO.get(self.temporalidad, '1d')
             
             print(f"    -> Conectando a Yahoo Finance ({simbolo_yahoo})...")
-            ticker = yf.Ticker(simbolo_yahoo)
-            df = ticker.history(start=self.fecha_inicio, end=self.fecha_fin, interval=intervalo)
+            if self.directo:
+                df = historial_yahoo(simbolo_yahoo, fecha_inicio or self.fecha_inicio, fecha_fin or self.fecha_fin,
+                                     intervalo, cache=self.cache_crudo, sesion=self.sesion)
+            else:
+                import yfinance as yf
+                ticker = yf.Ticker(simbolo_yahoo)
+                df = ticker.history(start=fecha_inicio or self.fecha_inicio,
+                                    end=fecha_fin or self.fecha_fin, interval=intervalo)
             
             if not df.empty:
+                df = self.normalizar_salida(df, intervalo)
                 nombre_archivo = f"{par}_BACKUP_{intervalo}.csv"
                 ruta_final = os.path.join(self.ruta_guardado, nombre_archivo)
-                df.to_csv(ruta_final)
+                self.guardar_datos(df, ruta_final, par)
                 print(f"    ✓ RECUPERADO: Datos guardados en {nombre_archivo}")
+                self.validar_archivo(ruta_final, intervalo, simbolo=par)
+                return ruta_final
             else:
                 print("    ✗ Yahoo tampoco tiene datos para este rango.")
                 
         except Exception as e:
             print(f"    ✗ Falló el respaldo: {e}")
+        
+        return None
+    
+    def consolidar_forex(self, par, ruta_primaria, ruta_respaldo):
+        """Une el archivo de duka con el respaldo de Yahoo en un único CSV"""
+        try:
+            primario = leer_datos(ruta_primaria) if ruta_primaria else None
+            respaldo = leer_datos(ruta_respaldo)
+            df = fusionar_con_respaldo(primario, respaldo, self.temporalidad, self.zona_canonica)
+            
+            fecha_inicio_str = self.fecha_inicio.strftime("%Y-%m-%d")
+            fecha_fin_str = self.fecha_fin.strftime("%Y-%m-%d")
+            nombre_archivo = f"{par}_CONSOLIDADO_{self.temporalidad}_{fecha_inicio_str}_to_{fecha_fin_str}.csv"
+            ruta_final = os.path.join(self.ruta_guardado, nombre_archivo)
+            self.guardar_datos(df, ruta_final, par)
+            
+            n_respaldo = int((df['fuente'] == 'yahoo').sum())
+            print(f"    ✓ CONSOLIDADO: {len(df):,} barras ({n_respaldo:,} de Yahoo) en {nombre_archivo}")
+            return ruta_final
+        except Exception as e:
+            print(f"    ✗ No se pudo consolidar {par}: {e}")
+            return None
+    
+    def normalizar_salida(self, df, temporalidad=None):
+        """Pasa un DataFrame a la zona canónica elegida (sin cambios si no hay ninguna)"""
+        if not self.zona_canonica or df.empty:
+            return df
+        return normalizar_zona(df, self.zona_canonica, temporalidad or self.temporalidad)
+    
+    def guardar_datos(self, df, ruta_archivo, simbolo):
+        """Guarda un DataFrame como CSV estándar o en el esquema compacto elegido"""
+        if self.esquema_compacto:
+            guardar_compacto(df, ruta_archivo, simbolo, precios=self.esquema_compacto)
+        else:
+            df.to_csv(ruta_archivo)
+        return ruta_archivo
+    
+    def archivar_ticks_dtk(self, ruta_csv, par):
+        """Convierte el CSV de ticks de duka en un archivo .dtk y borra el CSV"""
+        try:
+            ruta_dtk = os.path.splitext(ruta_csv)[0] + '.dtk'
+            tamano_csv = os.path.getsize(ruta_csv)
+            bloques = escribir_archivo_ticks(leer_datos(ruta_csv), ruta_dtk, par)
+            tamano_dtk = os.path.getsize(ruta_dtk)
+            os.remove(ruta_csv)
+            self.registrar_factor('dtk', tamano_dtk, tamano_csv)
+            print(f"  🗜️ Archivado en {os.path.basename(ruta_dtk)}: {tamano_dtk/1024:.2f} KB "
+                  f"({tamano_csv / max(tamano_dtk, 1):.1f}x menor, {bloques} bloques)")
+            return ruta_dtk
+        except Exception as e:
+            print(f"  ⚠️ No se pudo archivar {os.path.basename(ruta_csv)}: {e}")
+            return ruta_csv
+    
+    def generar_barras_alternativas(self, ruta_ticks, par):
+        """Construye las barras elegidas desde el archivo de ticks y las guarda junto a él"""
+        try:
+            tipo, umbral = self.barras_alternativas
+            inicio = time.perf_counter()
+            barras = construir_barras(ruta_ticks, tipo, umbral, incluir_ultima=True)
+            duracion = time.perf_counter() - inicio
+            if barras.empty:
+                print(f"  ⚠️ No se formó ninguna barra de {tipo} con umbral {umbral:g}")
+                return None
+            
+            etiqueta = f"{tipo}{umbral:g}"
+            nombre = (f"{par}_{etiqueta}_{self.fecha_inicio.strftime('%Y-%m-%d')}"
+                      f"_to_{self.fecha_fin.strftime('%Y-%m-%d')}.csv")
+            ruta = os.path.join(self.ruta_guardado, nombre)
+            self.guardar_datos(barras, ruta, par)
+            ticks = int(barras['ticks'].sum())
+            print(f"  📊 {len(barras):,} barras de {tipo} en {nombre} "
+                  f"({ticks / max(duracion, 1e-9) / 1e6:.1f} M ticks/s)")
+            self.registrar_serie(par, ruta, 'dukascopy', barras.index[0], barras.index[-1], len(barras),
+                                 temporalidad=etiqueta)
+            return ruta
+        except Exception as e:
+            print(f"  ⚠️ No se pudieron construir las barras de {par}: {e}")
+            return None
+    
+    def generar_serie_spread(self, ruta_ticks, par):
+        """Guarda junto a los ticks la serie de mid y spread por barra de tiempo"""
+        try:
+            inicio = time.perf_counter()
+            serie = series_spread(ruta_ticks, self.serie_spread)
+            duracion = time.perf_counter() - inicio
+            if serie.empty:
+                print(f"  ⚠️ No hay ticks para la serie de spread de {par}")
+                return None
+            
+            etiqueta = f"spread_{self.serie_spread}"
+            nombre = (f"{par}_SPREAD_{self.serie_spread}_{self.fecha_inicio.strftime('%Y-%m-%d')}"
+                      f"_to_{self.fecha_fin.strftime('%Y-%m-%d')}.csv")
+            ruta = os.path.join(self.ruta_guardado, nombre)
+            serie.to_csv(ruta)
+            ticks = int(serie['ticks'].sum())
+            print(f"  📈 {len(serie):,} barras de mid/spread en {nombre} "
+                  f"(spread medio {serie['spread_ponderado'].mean():.6g}, "
+                  f"{ticks / max(duracion, 1e-9) / 1e6:.1f} M ticks/s)")
+            self.registrar_serie(par, ruta, 'dukascopy', serie.index[0], serie.index[-1], len(serie),
+                                 temporalidad=etiqueta)
+            return ruta
+        except Exception as e:
+            print(f"  ⚠️ No se pudo construir la serie de spread de {par}: {e}")
+            return None
+    
+    def publicar_particionado(self, ruta_archivo, fuente, simbolo, temporalidad=None, **extra):
+        """Mueve un archivo descargado a la estructura particionada (extra va al catálogo)"""
+        try:
+            if ruta_archivo.endswith('.dtk'):
+                formato = 'dtk'
+            elif ruta_archivo.endswith('.parquet'):
+                formato = 'parquet'
+            else:
+                formato = 'csv'
+            df = leer_datos(ruta_archivo)
+            escritos = escribir_particionado(df, self.ruta_guardado, fuente, simbolo,
+                                             temporalidad or self.temporalidad, formato, self.esquema_compacto)
+            
+            # El reporte de calidad queda junto a la serie; el archivo plano se elimina
+            base = os.path.splitext(ruta_archivo)[0]
+            if escritos and os.path.exists(base + '.calidad.json'):
+                carpeta_serie = os.path.dirname(os.path.dirname(os.path.dirname(escritos[0])))
+                os.replace(base + '.calidad.json', os.path.join(carpeta_serie, '_calidad.json'))
+            for ruta in (ruta_archivo, base + '.esquema.json'):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            print(f"  🗂️ Particionado: {len(escritos)} particiones mes a mes en source={fuente}/symbol={simbolo}")
+            if escritos:
+                carpeta_serie = os.path.dirname(os.path.dirname(os.path.dirname(escritos[0])))
+                self.registrar_serie(simbolo, carpeta_serie, fuente, df.index[0], df.index[-1], len(df),
+                                     temporalidad=temporalidad, particionado=True, **extra)
+            return escritos
+        except Exception as e:
+            print(f"  ⚠️ No se pudo particionar {os.path.basename(ruta_archivo)}: {e}")
+            return []
+    
+    def registrar_serie(self, simbolo, ruta, fuente, inicio, fin, filas, temporalidad=None,
+                        anexado=False, **extra):
+        """Registra una serie guardada en el catálogo de la carpeta"""
+        try:
+            catalogo = Catalogo(self.ruta_guardado)
+            temporalidad = temporalidad or self.temporalidad
+            anterior = catalogo.obtener(simbolo, temporalidad) or {}
+            datos = {'fuente': fuente, **extra}
+            if self.zona_canonica and temporalidad != 'tick':
+                # Los formatos compactos y las particiones guardan epoch UTC: la zona
+                # queda en el catálogo para devolverla al leer
+                datos.setdefault('zona', self.zona_canonica)
+            if inicio is not None:
+                datos['inicio'] = anterior.get('inicio', str(inicio)) if anexado else str(inicio)
+            if fin is not None:
+                datos['fin'] = str(fin)
+            if filas is not None:
+                datos['filas'] = filas + (anterior.get('filas', 0) if anexado else 0)
+            if os.path.isfile(ruta):
+                datos['bytes'] = os.path.getsize(ruta)
+            self.registradas[(simbolo, temporalidad)] = dict(datos, simbolo=simbolo, temporalidad=temporalidad,
+                                                             ruta=os.path.abspath(ruta))
+            return catalogo.registrar(simbolo, temporalidad, ruta, **datos)
+        except Exception as e:
+            print(f"  ⚠️ No se pudo actualizar el catálogo: {e}")
+            return None
+    
+    def buscar_serie_existente(self, simbolo):
+        """
+        Busca la serie ya guardada de un símbolo/temporalidad (catálogo primero,
+        luego archivos con el patrón de nombre). Devuelve dict con ruta, primer
+        y último timestamp y si está guardada sin ajustar ('crudo', según el catálogo).
+        """
+        import glob
+        
+        entrada = Catalogo(self.ruta_guardado).obtener(simbolo, self.temporalidad)
+        crudo = serie_cruda(entrada)
+        if entrada and entrada.get('particionado') and os.path.isdir(entrada['ruta']):
+            if entrada.get('fin'):
+                return {'ruta': entrada['ruta'], 'particionado': True, 'ultimo': _a_utc(entrada['fin']),
+                        'primero': _a_utc(entrada['inicio']) if entrada.get('inicio') else None, 'crudo': crudo}
+            return None
+        
+        if entrada and os.path.isfile(entrada['ruta']):
+            candidatos = [entrada['ruta']]
+        else:
+            patron = f"{glob.escape(simbolo.replace('^', ''))}_{glob.escape(self.temporalidad)}_*_to_*.csv"
+            candidatos = sorted(glob.glob(os.path.join(self.ruta_guardado, patron)), key=os.path.getmtime)
+        
+        for ruta in reversed(candidatos):
+            ultimo = leer_ultimo_timestamp(ruta)
+            if ultimo is not None:
+                del_catalogo = bool(entrada) and ruta == entrada['ruta']
+                primero = _a_utc(entrada['inicio']) if del_catalogo and entrada.get('inicio') else None
+                return {'ruta': ruta, 'particionado': False, 'ultimo': ultimo,
+                        'primero': primero or leer_primer_timestamp(ruta), 'crudo': crudo and del_catalogo}
+        return None
+    
+    def cubre_inicio(self, existente, simbolo):
+        """
+        True si la serie guardada empieza a más tardar en la primera sesión
+        del rango pedido; si empieza después, actualizarla dejaría sin bajar
+        la historia anterior.
+        """
+        rangos = planificar_rangos('indices', simbolo, self.fecha_inicio, self.fecha_fin)
+        if not rangos:
+            return True
+        primero = existente.get('primero')
+        return primero is not None and primero.tz_convert(None).date() <= rangos[0][0].date()
+    
+    def refrescar_serie(self, df, existente, simbolo, frescura, registro=None):
+        """
+        Compara la ventana reciente descargada con la huella guardada de cada
+        día (y, en los días cuya huella falta o cambió, con lo guardado en
+        disco): solo escribe barras nuevas o corregidas (desde la primera
+        corregida) y no toca el archivo si nada cambió. Las huellas quedan en
+        `registro` (un RegistroFrescura que se guarda una vez por ejecución;
+        sin él se guarda enseguida). Devuelve filas escritas.
+        """
+        import numpy as np
+        
+        normal = normalizar_datos(df)
+        viejas = normal.index <= existente['ultimo']
+        dias = _tiempos_ns(normal.index) // 86_400_000_000_000
+        anteriores = frescura.get('dias', {})
+        distintos = [int(d) for d, h in huellas_dias(normal[viejas]).items() if anteriores.get(d) != h]
+        revisar = viejas & np.isin(dias, distintos)
+        corregidas = np.zeros(len(normal), dtype=bool)
+        if revisar.any():
+            desde = normal.index[revisar][0]
+            if existente['particionado']:
+                guardado = leer_particionado(self.ruta_guardado, 'yahoo', simbolo, self.temporalidad,
+                                             desde, existente['ultimo'])
+            else:
+                guardado = leer_cola_csv(existente['ruta'], desde)
+            corregidas = revisar & barras_distintas(normal, guardado)
+        nuevas = ~viejas
+        
+        escritas = 0
+        if corregidas.any():
+            desde = normal.index[corregidas][0]
+            reescribir = df[normal.index >= desde]
+            if existente['particionado']:
+                reemplazadas = int(np.count_nonzero(viejas & (normal.index >= desde)))
+            else:
+                reemplazadas = recortar_csv_desde(existente['ruta'], desde)
+            print(f"  ↻ {int(corregidas.sum())} barras corregidas por el proveedor desde {desde:%Y-%m-%d %H:%M}")
+            self.anexar_serie(reescribir, existente, simbolo, filas_reemplazadas=reemplazadas)
+            escritas = len(reescribir)
+        elif nuevas.any():
+            self.anexar_serie(df[nuevas], existente, simbolo)
+            escritas = int(nuevas.sum())
+        else:
+            print(f"  ✓ {simbolo} sin cambios en la ventana reciente, no se reescribe nada")
+        
+        frescura.pop('huellas', None)  # Formato anterior: una huella por barra
+        frescura.update({
+            'dias': huellas_dias(normal),
+            'ventana': [str(normal.index[0]), str(normal.index[-1])] if len(normal) else None,
+            'sin_cambios': 0 if escritas else frescura.get('sin_cambios', 0) + 1,
+        })
+        if registro is None:
+            registro = RegistroFrescura(self.ruta_guardado)
+            registro.actualizar(simbolo, self.temporalidad, **frescura)
+            registro.guardar()
+        else:
+            registro.actualizar(simbolo, self.temporalidad, **frescura)
+        return escritas
+    
+    def anexar_serie(self, df, existente, simbolo, filas_reemplazadas=0):
+        """Agrega solo las filas nuevas a la serie existente y actualiza nombre y catálogo"""
+        reporte = validar_calidad(normalizar_datos(df), self.temporalidad, self.tipo_descarga,
+                                  simbolo=simbolo, zona=self.zona_canonica)
+        self.anexadas[(simbolo, self.temporalidad)] = _a_utc(df.index[0])
+        
+        if existente['particionado']:
+            escribir_particionado(df, self.ruta_guardado, 'yahoo', simbolo, self.temporalidad,
+                                  esquema_compacto=self.esquema_compacto)
+            ruta_final = existente['ruta']
+            self.registrar_serie(simbolo, ruta_final, 'yahoo', df.index[0], df.index[-1],
+                                 len(df) - filas_reemplazadas, anexado=True, particionado=True)
+        else:
+            ruta_final = existente['ruta']
+            anexar_csv(df, ruta_final, simbolo)
+            
+            # El nombre {inicio}_to_{fin} refleja el nuevo final de la serie
+            nombre = os.path.basename(ruta_final)
+            if '_to_' in nombre:
+                nuevo_nombre = f"{nombre.rsplit('_to_', 1)[0]}_to_{self.fecha_fin.strftime('%Y-%m-%d')}.csv"
+                nueva_ruta = os.path.join(os.path.dirname(ruta_final), nuevo_nombre)
+                if nueva_ruta != ruta_final:
+                    base_anterior, base_nueva = os.path.splitext(ruta_final)[0], os.path.splitext(nueva_ruta)[0]
+                    os.replace(ruta_final, nueva_ruta)
+                    for sufijo in ('.esquema.json', '.calidad.json'):
+                        if os.path.exists(base_anterior + sufijo):
+                            os.replace(base_anterior + sufijo, base_nueva + sufijo)
+                    ruta_final = nueva_ruta
+            self.registrar_serie(simbolo, ruta_final, 'yahoo', df.index[0], df.index[-1],
+                                 len(df) - filas_reemplazadas, anexado=True)
+        
+        if filas_reemplazadas:
+            print(f"  ✓ {simbolo}: {len(df) - filas_reemplazadas:,} filas nuevas y {filas_reemplazadas:,} "
+                  f"reescritas en {os.path.basename(ruta_final)}")
+        else:
+            print(f"  ✓ {simbolo}: {len(df):,} filas nuevas agregadas a {os.path.basename(ruta_final)}")
+        if not reporte['ok']:
+            print(f"  🔎 Calidad (filas nuevas): {'; '.join(reporte['problemas'])}")
+        return ruta_final
+    
+    def validar_archivo(self, ruta_archivo, temporalidad=None, simbolo=None, crudo=False):
+        """Valida la calidad de un archivo descargado y guarda su reporte"""
+        try:
+            inicio = time.perf_counter()
+            df = leer_datos(ruta_archivo)
+            if self.tipo_descarga == 'indices' and simbolo and crudo:
+                # Los splits no son saltos de precio reales
+                df = ajustar_precios(df, leer_acciones(self.ruta_guardado, simbolo), 'splits')
+            reporte = validar_calidad(df, temporalidad or self.temporalidad, self.tipo_descarga,
+                                      simbolo=simbolo, zona=self.zona_canonica)
+            reporte['archivo'] = os.path.basename(ruta_archivo)
+            guardar_reporte_calidad(ruta_archivo, reporte)
+            duracion = time.perf_counter() - inicio
+            
+            if reporte['ok']:
+                print(f"  🔎 Calidad: OK ({reporte['filas']:,} filas, {duracion:.2f}s)")
+            else:
+                print(f"  🔎 Calidad: {'; '.join(reporte['problemas'])}")
+            return reporte
+        except Exception as e:
+            print(f"  ⚠️ No se pudo validar {os.path.basename(ruta_archivo)}: {e}")
+            return None
+    
+    def separar_acciones(self, df, ticker, simbolo, fin_descarga):
+        """Guarda la tabla de acciones de una descarga con acciones y devuelve el OHLCV sin ajustar"""
+        posteriores = 1.0
+        if fin_descarga < datetime.now() - timedelta(days=1):
+            # Yahoo ajusta también por los splits posteriores al rango pedido
+            if self.directo:
+                eventos = historial_yahoo(simbolo, fin_descarga, datetime.now(), '1mo', cache=self.cache_crudo,
+                                          sesion=self.sesion, ajustar=False, acciones=True)
+            else:
+                eventos = ticker.history(start=fin_descarga, interval='1mo', auto_adjust=False, actions=True)
+            if eventos is not None and 'Stock Splits' in eventos.columns:
+                splits = eventos['Stock Splits'].to_numpy(dtype='float64')
+                posteriores = float(splits[splits > 0].prod())
+        
+        crudo, acciones = separar_acciones(df, posteriores)
+        guardar_acciones(self.ruta_guardado, simbolo, acciones)
+        if len(acciones):
+            print(f"  🏷️ {int((acciones['dividendo'] > 0).sum())} dividendos y {int((acciones['split'] != 1).sum())} "
+                  f"splits en la tabla de acciones (precios guardados sin ajustar)")
+        return crudo
     
     def descargar_indices(self):
         """Descarga datos de Índices/Acciones usando yfinance"""
@@ -524,63 +1335,142 @@ class DataDownloader:
         total = len(self.instrumentos)
         exitosos = 0
         fallidos = 0
-        
-        for idx, simbolo in enumerate(self.instrumentos, 1):
-            print(f"\n[{idx}/{total}] Descargando {simbolo}...")
-            
-            try:
-                ticker = yf.Ticker(simbolo)
+        registro = None  # RegistroFrescura: se lee con la primera serie a actualizar
+        with ReporteProgreso(total, "Índices/Acciones") as self.progreso:
+            for idx, simbolo in self.progreso.recorrer(self.instrumentos):
+                print(f"\n[{idx}/{total}] Descargando {simbolo}...")
+                inicio_simbolo = time.perf_counter()
                 
-                # Descargar datos con manejo de errores mejorado
                 try:
-                    df = ticker.history(
-                        start=self.fecha_inicio,
-                        end=self.fecha_fin,
-                        interval=self.temporalidad,
-                        auto_adjust=True,
-                        actions=False
-                    )
-                except Exception as download_error:
-                    error_msg = str(download_error)
-                    if "1m data not available" in error_msg:
-                        print(f"  ✗ Yahoo Finance solo permite 1m para los últimos 7 días")
-                        print(f"  💡 Solución: Usa temporalidad '1d' (diaria) para este período")
-                    elif "5m data not available" in error_msg:
-                        print(f"  ✗ Yahoo Finance solo permite 5m para los últimos 60 días")
-                        print(f"  💡 Solución: Usa temporalidad '1d' (diaria) o reduce el período")
+                    ticker = yf.Ticker(simbolo)
+                    
+                    # Modo actualización: continuar desde el último dato guardado
+                    existente = self.buscar_serie_existente(simbolo) if self.modo_actualizar else None
+                    if existente and not self.cubre_inicio(existente, simbolo):
+                        desde_guardado = (f"empieza el {existente['primero']:%Y-%m-%d}" if existente['primero']
+                                          else "no tiene fecha de inicio conocida")
+                        print(f"  ⚠️ La serie guardada {desde_guardado}, después del inicio pedido: "
+                              f"se descarga completa")
+                        existente = None
+                    inicio_descarga = self.fecha_inicio
+                    frescura = None
+                    if existente:
+                        ultimo = existente['ultimo'].tz_convert(None).to_pydatetime()
+                        ultimo_dia = ultimo.replace(hour=0, minute=0, second=0, microsecond=0)
+                        if ultimo_dia >= self.fecha_fin:
+                            print(f"  ✓ {simbolo} ya está al día")
+                            exitosos += 1
+                            self.progreso.marcar_exito()
+                            continue
+                        # Los últimos días se vuelven a pedir porque Yahoo puede corregirlos
+                        inicio_descarga = max(self.fecha_inicio, ultimo_dia - timedelta(days=self.dias_revision))
+                        if registro is None:
+                            registro = RegistroFrescura(self.ruta_guardado)
+                        frescura = registro.obtener(simbolo, self.temporalidad)
+                        print(f"  ↻ Serie existente hasta {existente['ultimo'].strftime('%Y-%m-%d %H:%M')} UTC, "
+                              f"revisando desde {inicio_descarga.strftime('%Y-%m-%d')}")
+                    
+                    # Recortar fines de semana y feriados en los extremos del rango
+                    rangos = planificar_rangos('indices', simbolo, inicio_descarga, self.fecha_fin)
+                    if not rangos:
+                        if existente:
+                            print(f"  ✓ {simbolo} ya está al día (sin sesiones nuevas)")
+                            exitosos += 1
+                            self.progreso.marcar_exito()
+                        else:
+                            print(f"  ✗ El rango no tiene sesiones de {mercado_de(simbolo)} (fin de semana o feriado)")
+                            fallidos += 1
+                        continue
+                    inicio_descarga, fin_descarga = rangos[0][0], rangos[-1][1]
+                    
+                    # Las series nuevas se guardan sin ajustar con su tabla de acciones;
+                    # las ya guardadas ajustadas siguen como estaban. La tabla es por
+                    # símbolo, así que lo que decide es el catálogo de cada serie
+                    crudo = not existente or existente['crudo']
+                    
+                    # Descargar datos con manejo de errores mejorado
+                    try:
+                        if self.directo:
+                            df = historial_yahoo(simbolo, inicio_descarga, fin_descarga, self.temporalidad,
+                                                 cache=self.cache_crudo, sesion=self.sesion, frescura=frescura,
+                                                 ajustar=not crudo, acciones=crudo)
+                        else:
+                            df = ticker.history(
+                                start=inicio_descarga,
+                                end=fin_descarga,
+                                interval=self.temporalidad,
+                                auto_adjust=not crudo,
+                                actions=crudo
+                            )
+                        if crudo and df is not None and not df.empty:
+                            df = self.separar_acciones(df, ticker, simbolo, fin_descarga)
+                    except Exception as download_error:
+                        error_msg = str(download_error)
+                        if "1m data not available" in error_msg:
+                            print(f"  ✗ Yahoo Finance solo permite 1m para los últimos 7 días")
+                            print(f"  💡 Solución: Usa temporalidad '1d' (diaria) para este período")
+                        elif "5m data not available" in error_msg:
+                            print(f"  ✗ Yahoo Finance solo permite 5m para los últimos 60 días")
+                            print(f"  💡 Solución: Usa temporalidad '1d' (diaria) o reduce el período")
+                        else:
+                            print(f"  ✗ Error de descarga: {error_msg}")
+                        fallidos += 1
+                        continue
+                    
+                    if df is not None:
+                        df = self.normalizar_salida(df)
+                    
+                    if existente:
+                        if df is None:
+                            print(f"  ✓ {simbolo} sin cambios (HTTP 304), no se reescribe nada")
+                        else:
+                            self.progreso.avanzar(self.refrescar_serie(df, existente, simbolo, frescura, registro))
+                        exitosos += 1
+                        self.progreso.marcar_exito()
+                        continue
+                    
+                    if df.empty:
+                        print(f"  ✗ No se encontraron datos para {simbolo}")
+                        print(f"  💡 Verifica que el símbolo sea correcto")
+                        fallidos += 1
+                        continue
+                    
+                    # Guardar a CSV
+                    fecha_inicio_str = self.fecha_inicio.strftime("%Y-%m-%d")
+                    fecha_fin_str = self.fecha_fin.strftime("%Y-%m-%d")
+                    nombre_archivo = f"{simbolo.replace('^', '')}_{self.temporalidad}_{fecha_inicio_str}_to_{fecha_fin_str}.csv"
+                    ruta_archivo = os.path.join(self.ruta_guardado, nombre_archivo)
+                    
+                    self.guardar_datos(df, ruta_archivo, simbolo)
+                    self.registrar_rendimiento(ruta_archivo, time.perf_counter() - inicio_simbolo, len(df),
+                                               simbolo=simbolo)
+                    self.progreso.avanzar(len(df), os.path.getsize(ruta_archivo))
+                    
+                    tamaño = os.path.getsize(ruta_archivo) / 1024
+                    print(f"  ✓ {simbolo} descargado correctamente")
+                    print(f"  📊 Registros: {len(df):,}")
+                    print(f"  💾 Tamaño: {tamaño:.2f} KB")
+                    print(f"  📁 Archivo: {nombre_archivo}")
+                    
+                    # Mostrar primeras y últimas fechas
+                    print(f"  📅 Desde: {df.index[0].strftime('%Y-%m-%d %H:%M')}")
+                    print(f"  📅 Hasta: {df.index[-1].strftime('%Y-%m-%d %H:%M')}")
+                    self.validar_archivo(ruta_archivo, simbolo=simbolo, crudo=crudo)
+                    if self.particionado:
+                        self.publicar_particionado(ruta_archivo, 'yahoo', simbolo, ajuste='crudo')
                     else:
-                        print(f"  ✗ Error de descarga: {error_msg}")
-                    fallidos += 1
-                    continue
-                
-                if df.empty:
-                    print(f"  ✗ No se encontraron datos para {simbolo}")
-                    print(f"  💡 Verifica que el símbolo sea correcto")
+                        self.registrar_serie(simbolo, ruta_archivo, 'yahoo', df.index[0], df.index[-1], len(df),
+                                             ajuste='crudo')
+                    exitosos += 1
+                    self.progreso.marcar_exito()
+                    
+                except Exception as e:
+                    print(f"  ✗ Error inesperado al descargar {simbolo}: {e}")
                     fallidos += 1
-                    continue
-                
-                # Guardar a CSV
-                fecha_inicio_str = self.fecha_inicio.strftime("%Y-%m-%d")
-                fecha_fin_str = self.fecha_fin.strftime("%Y-%m-%d")
-                nombre_archivo = f"{simbolo.replace('^', '')}_{self.temporalidad}_{fecha_inicio_str}_to_{fecha_fin_str}.csv"
-                ruta_archivo = os.path.join(self.ruta_guardado, nombre_archivo)
-                
-                df.to_csv(ruta_archivo)
-                
-                tamaño = os.path.getsize(ruta_archivo) / 1024
-                print(f"  ✓ {simbolo} descargado correctamente")
-                print(f"  📊 Registros: {len(df):,}")
-                print(f"  💾 Tamaño: {tamaño:.2f} KB")
-                print(f"  📁 Archivo: {nombre_archivo}")
-                
-                # Mostrar primeras y últimas fechas
-                print(f"  📅 Desde: {df.index[0].strftime('%Y-%m-%d %H:%M')}")
-                print(f"  📅 Hasta: {df.index[-1].strftime('%Y-%m-%d %H:%M')}")
-                exitosos += 1
-                
-            except Exception as e:
-                print(f"  ✗ Error inesperado al descargar {simbolo}: {e}")
-                fallidos += 1
+        
+        if registro is not None:
+            # Una sola escritura de frescura.json por ejecución, no una por símbolo
+            registro.guardar()
         
         # Resumen final
         print(f"\n{'='*60}")
@@ -590,6 +1480,8 @@ class DataDownloader:
         if fallidos > 0:
             print(f"✗ Fallidos:  {fallidos}/{total}")
             print(f"\n💡 TIP: Para períodos largos (>60 días), usa temporalidad '1d' (diaria)")
+        
+        return exitosos
     
     def ejecutar(self):
         """Ejecuta el flujo completo del programa"""
@@ -626,9 +1518,5044 @@ class DataDownloader:
         else:
             print("\n✗ Descarga cancelada por el usuario")
 
-def main():
-    try:
+# Frecuencia pandas de cada temporalidad (None = sin rejilla fija)
+FRECUENCIAS_PANDAS = {
+    'tick': None,
+    'M1': '1min', 'M5': '5min', 'M15': '15min', 'M30': '30min',
+    'H1': '1h', 'H4': '4h', 'D1': '1D',
+    '1m': '1min', '5m': '5min', '15m': '15min', '30m': '30min',
+    '1h': '1h', '1d': '1D', '1wk': None, '1mo': None
+}
+
+# Columnas que se compactan como precios o como volúmenes
+COLUMNAS_PRECIO = ('open', 'high', 'low', 'close', 'ask', 'bid', 'mid')
+COLUMNAS_VOLUMEN = ('volume', 'ask_volume', 'bid_volume')
+
+# Tamaños de punto que no siguen la regla general (1e-5, 1e-3 para JPY, 1e-2 resto)
+TAMANOS_PUNTO = {
+    'XAUUSD': 1e-3,
+    'XAGUSD': 1e-3,
+    'BTC-USD': 1e-2,
+}
+
+# Mapeo de temporalidades duka -> yahoo (H4 se reconstruye desde 1h)
+MAPA_DUKA_YAHOO = {
+    'M1': '1m', 'M5': '5m', 'M15': '15m', 'M30': '30m',
+    'H1': '1h', 'H4': '1h', 'D1': '1d'
+}
+
+# Ventana de cierre semanal de Forex en minutos desde el lunes 00:00 UTC.
+# El mercado cierra el viernes a las 17:00 de Nueva York (21:00 o 22:00 UTC
+# según el horario de verano), por eso se toma la ventana más amplia.
+CIERRE_FOREX_INICIO = 4 * 1440 + 21 * 60   # viernes 21:00 UTC
+CIERRE_FOREX_FIN = 6 * 1440 + 22 * 60      # domingo 22:00 UTC
+
+
+def normalizar_datos(df, unidad_tiempo='ms'):
+    """
+    Normaliza un DataFrame de duka o de Yahoo Finance: índice 'timestamp' en UTC
+    y columnas en minúsculas (open, high, low, close, volume / ask, bid...).
+    """
+    import pandas as pd
+    
+    df = df.copy()
+    df.columns = [str(c).strip().lower().replace(' ', '_') for c in df.columns]
+    
+    if isinstance(df.index, pd.DatetimeIndex):
+        indice = df.index.tz_localize('UTC') if df.index.tz is None else df.index.tz_convert('UTC')
+    else:
+        col_tiempo = next((c for c in ('timestamp', 'time', 'datetime', 'date') if c in df.columns), df.columns[0])
+        tiempos = df.pop(col_tiempo)
+        if pd.api.types.is_numeric_dtype(tiempos):
+            indice = pd.to_datetime(tiempos, unit=unidad_tiempo, utc=True)
+        else:
+            indice = pd.to_datetime(tiempos, utc=True, format='mixed')
+    df.index = pd.DatetimeIndex(indice, name='timestamp')
+    
+    # duka guarda las velas como time, open, close, high, low
+    orden = [c for c in ('open', 'high', 'low', 'close', 'volume') if c in df.columns]
+    if orden:
+        df = df[orden + [c for c in df.columns if c not in orden]]
+    return df
+
+
+# Zonas canónicas de salida: zona del índice y hora local de cierre de la
+# sesión diaria (NY17 = cierre Forex de Nueva York a las 17:00)
+ZONAS_CANONICAS = {
+    'UTC': ('UTC', 0),
+    'NY17': ('America/New_York', 17),
+}
+TEMPORALIDADES_DIARIAS = ('D1', '1d', '1wk', '1mo')
+
+
+def dia_sesion(indice, zona='UTC'):
+    """
+    Fecha (sin zona, a medianoche) de la sesión a la que pertenece cada
+    timestamp. Con NY17 la sesión del día D va de las 17:00 de D-1 a las
+    17:00 de D en hora de Nueva York, con el horario de verano de cada fecha.
+    """
+    import pandas as pd
+    
+    tz, cierre = ZONAS_CANONICAS[zona]
+    indice = pd.DatetimeIndex(indice)
+    indice = indice.tz_localize('UTC') if indice.tz is None else indice
+    local = indice.tz_convert(tz).tz_localize(None)
+    if cierre:
+        local = local + pd.Timedelta(hours=24 - cierre)
+    return local.floor('D')
+
+
+def normalizar_zona(df, zona='UTC', temporalidad=None):
+    """
+    Lleva el índice a la zona canónica. Las barras diarias (o mayores) se
+    reetiquetan con la fecha de su sesión a medianoche de esa zona: las de
+    Yahoo vienen a medianoche de la bolsa y las de duka a medianoche UTC, y
+    sin esto el mismo día queda en instantes distintos según el proveedor.
+    """
+    import pandas as pd
+    
+    tz = ZONAS_CANONICAS[zona][0]
+    if not isinstance(df.index, pd.DatetimeIndex):
+        df = normalizar_datos(df)
+    indice = df.index
+    
+    if temporalidad in TEMPORALIDADES_DIARIAS:
+        local = indice if indice.tz is None else indice.tz_localize(None)
+        # Etiquetas a medianoche: ya son fechas de sesión del proveedor
+        fechas = local.normalize() if (local == local.normalize()).all() else dia_sesion(indice, zona)
+        nuevo = fechas.tz_localize(tz)
+    else:
+        nuevo = (indice.tz_localize('UTC') if indice.tz is None else indice).tz_convert(tz)
+    
+    df = df.copy(deep=False)
+    df.index = pd.DatetimeIndex(nuevo, name=indice.name)
+    return df
+
+
+def agregar_sesiones(df, zona='UTC'):
+    """Agrega barras intradía OHLC en barras diarias alineadas a la sesión de la zona"""
+    import pandas as pd
+    
+    tz = ZONAS_CANONICAS[zona][0]
+    fechas = dia_sesion(df.index, zona)
+    reglas = {c: 'last' for c in df.columns}
+    reglas.update({c: regla for c, regla in (('open', 'first'), ('high', 'max'), ('low', 'min'),
+                                             ('close', 'last'), ('volume', 'sum')) if c in df.columns})
+    diario = df.groupby(fechas, sort=True).agg(reglas)
+    diario.index = pd.DatetimeIndex(diario.index.tz_localize(tz), name=df.index.name)
+    return diario
+
+
+# Mercado (calendario de feriados) de los índices conocidos y sufijos de Yahoo
+MERCADO_POR_SIMBOLO = {
+    '^GSPC': 'NYSE', '^DJI': 'NYSE', '^IXIC': 'NYSE', '^RUT': 'NYSE', '^VIX': 'NYSE',
+    '^FTSE': 'LSE', '^GDAXI': 'XETRA', '^N225': 'TSE',
+}
+MERCADO_POR_SUFIJO = {'.L': 'LSE', '.DE': 'XETRA', '.F': 'XETRA', '.T': 'TSE'}
+
+
+def mercado_de(simbolo, tipo='indices'):
+    """Calendario que aplica a un símbolo: FOREX, NYSE, LSE, XETRA o TSE"""
+    if tipo == 'forex':
+        return 'FOREX'
+    simbolo = simbolo.upper()
+    if simbolo in MERCADO_POR_SIMBOLO:
+        return MERCADO_POR_SIMBOLO[simbolo]
+    for sufijo, mercado in MERCADO_POR_SUFIJO.items():
+        if simbolo.endswith(sufijo):
+            return mercado
+    return 'NYSE'
+
+
+# Sufijos de bolsa de Yahoo (el punto antes de otra cosa es una clase de acción)
+SUFIJOS_YAHOO = {
+    'L', 'DE', 'F', 'T', 'PA', 'AS', 'MI', 'MC', 'BR', 'LS', 'IR', 'SW', 'VI', 'ST', 'CO', 'OL', 'HE',
+    'WA', 'PR', 'AT', 'IS', 'TO', 'V', 'NE', 'CN', 'SA', 'MX', 'HK', 'AX', 'NZ', 'SI', 'KS', 'KQ',
+    'SS', 'SZ', 'TW', 'TWO', 'NS', 'BO', 'JK', 'BK', 'KL', 'TA', 'JO',
+}
+
+# Códigos de bolsa estilo Bloomberg ("VOD LN") -> sufijo de Yahoo
+BOLSAS_BLOOMBERG = {
+    'US': '', 'UN': '', 'UW': '', 'UQ': '', 'UA': '', 'UP': '',
+    'LN': '.L', 'GY': '.DE', 'GR': '.DE', 'JP': '.T', 'JT': '.T', 'FP': '.PA', 'NA': '.AS',
+    'IM': '.MI', 'SM': '.MC', 'SW': '.SW', 'SE': '.SW', 'CN': '.TO', 'CT': '.TO', 'HK': '.HK',
+    'AU': '.AX', 'AT': '.AX',
+}
+
+# Encabezados reconocidos como columna de símbolos en los CSV de universos
+COLUMNAS_SIMBOLO = ('symbol', 'simbolo', 'símbolo', 'ticker', 'code', 'codigo', 'código')
+
+
+def normalizar_simbolo_yahoo(simbolo):
+    """
+    Lleva un símbolo a la convención de Yahoo: mayúsculas, clases de acción
+    con guion (BRK.B, BF/B, BRK B -> BRK-B) y bolsa como sufijo (VOD LN -> VOD.L).
+    Índices (^GSPC), pares (EURUSD=X) y futuros (GC=F) quedan como están.
+    """
+    simbolo = simbolo.strip().upper()
+    if simbolo.endswith(' EQUITY'):
+        simbolo = simbolo[:-len(' EQUITY')].strip()
+    if not simbolo or simbolo.startswith('^') or '=' in simbolo:
+        return simbolo
+    
+    partes = simbolo.split()
+    if len(partes) == 2 and partes[1] in BOLSAS_BLOOMBERG:
+        simbolo = partes[0] + BOLSAS_BLOOMBERG[partes[1]]
+    else:
+        simbolo = '-'.join(partes)
+    
+    base, punto, sufijo = simbolo.rpartition('.')
+    if punto and sufijo not in SUFIJOS_YAHOO:
+        simbolo = f"{base.replace('.', '-')}-{sufijo}"
+    elif punto:
+        simbolo = f"{base.replace('.', '-')}.{sufijo}"
+    return simbolo.replace('/', '-')
+
+
+def carpetas_universos():
+    """Carpetas donde se buscan los universos: ./universos y la del script"""
+    carpetas = [os.path.join(os.getcwd(), 'universos'),
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'universos')]
+    return [c for i, c in enumerate(carpetas) if os.path.isdir(c) and c not in carpetas[:i]]
+
+
+def listar_universos():
+    """Nombre (archivo sin extensión, en minúsculas) -> ruta de cada universo disponible"""
+    universos = {}
+    for carpeta in carpetas_universos():
+        for nombre in sorted(os.listdir(carpeta)):
+            base, extension = os.path.splitext(nombre)
+            if extension.lower() in ('.csv', '.txt'):
+                universos.setdefault(base.lower(), os.path.join(carpeta, nombre))
+    return universos
+
+
+def leer_universo(nombre):
+    """
+    Símbolos de un universo (nombre o ruta de un .csv/.txt), normalizados y sin
+    repetir, en el orden del archivo. TXT: uno por línea o separados por comas,
+    con comentarios '#'. CSV: la columna symbol/ticker/simbolo o la primera.
+    """
+    import csv
+    
+    ruta = nombre if os.path.isfile(nombre) else listar_universos().get(nombre.lower().lstrip('@'))
+    if ruta is None:
+        raise ValueError(f"Universo desconocido: {nombre}")
+    
+    simbolos = []
+    with open(ruta, encoding='utf-8-sig', newline='') as f:
+        if ruta.lower().endswith('.csv'):
+            filas = [fila for fila in csv.reader(f) if fila and not fila[0].strip().startswith('#')]
+            encabezado = [c.strip().lower() for c in filas[0]] if filas else []
+            columna = next((encabezado.index(c) for c in COLUMNAS_SIMBOLO if c in encabezado), None)
+            if columna is not None:
+                filas = filas[1:]
+            simbolos = [fila[columna or 0] for fila in filas if len(fila) > (columna or 0)]
+        else:
+            for linea in f:
+                simbolos.extend(linea.split('#', 1)[0].split(','))
+    
+    simbolos = (normalizar_simbolo_yahoo(s) for s in simbolos)
+    return list(dict.fromkeys(s for s in simbolos if s))
+
+
+def resolver_instrumentos(entradas):
+    """
+    Expande una lista de símbolos y universos ('@nombre') en símbolos
+    normalizados, sin repetir y en orden de aparición. Sin '@' todo es un
+    símbolo, aunque coincida con el nombre de un universo (TECH, ARKK...).
+    """
+    simbolos = []
+    for entrada in entradas:
+        entrada = entrada.strip()
+        if not entrada:
+            continue
+        if entrada.startswith('@'):
+            simbolos.extend(leer_universo(entrada))
+        else:
+            simbolos.append(normalizar_simbolo_yahoo(entrada))
+    return list(dict.fromkeys(simbolos))
+
+
+def resumir_lista(elementos, maximo=10):
+    """Primeros elementos de una lista larga seguidos de cuántos faltan"""
+    if len(elementos) <= maximo:
+        return ', '.join(elementos)
+    return f"{', '.join(elementos[:maximo])}... (+{len(elementos) - maximo:,} más, {len(elementos):,} en total)"
+
+
+def pascua(anio):
+    """Domingo de Pascua (algoritmo gregoriano anónimo)"""
+    from datetime import date
+    
+    a, b, c = anio % 19, anio // 100, anio % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes = (h + l - 7 * m + 114) // 31
+    dia = (h + l - 7 * m + 114) % 31 + 1
+    return date(anio, mes, dia)
+
+
+def _enesimo_dia_semana(anio, mes, dia_semana, n):
+    """n-ésimo día de la semana (0 = lunes) del mes; n = -1 para el último"""
+    from datetime import date
+    
+    if n > 0:
+        primero = date(anio, mes, 1)
+        return primero + timedelta(days=(dia_semana - primero.weekday()) % 7 + 7 * (n - 1))
+    siguiente = date(anio + (mes == 12), mes % 12 + 1, 1)
+    ultimo = siguiente - timedelta(days=1)
+    return ultimo - timedelta(days=(ultimo.weekday() - dia_semana) % 7)
+
+
+def _observado(fecha, sabado_a_viernes=True):
+    """Feriado trasladado cuando cae en fin de semana (sáb -> vie, dom -> lun)"""
+    if fecha.weekday() == 5:
+        return fecha - timedelta(days=1) if sabado_a_viernes else None
+    if fecha.weekday() == 6:
+        return fecha + timedelta(days=1)
+    return fecha
+
+
+def feriados_mercado(mercado, anio):
+    """Feriados principales (días sin sesión) de un mercado en un año"""
+    from datetime import date
+    
+    semana_santa = pascua(anio)
+    viernes_santo = semana_santa - timedelta(days=2)
+    lunes_pascua = semana_santa + timedelta(days=1)
+    feriados = set()
+    
+    if mercado == 'FOREX':
+        # Dukascopy sirve ticks también el 1 de enero y el 25 de diciembre
+        # (con poca liquidez): Forex no tiene días feriados, solo la pausa
+        # del fin de semana
+        return set()
+    
+    elif mercado == 'NYSE':
+        feriados = {
+            _observado(date(anio, 1, 1), sabado_a_viernes=False),
+            _enesimo_dia_semana(anio, 1, 0, 3),    # Martin Luther King
+            _enesimo_dia_semana(anio, 2, 0, 3),    # Presidents' Day
+            viernes_santo,
+            _enesimo_dia_semana(anio, 5, 0, -1),   # Memorial Day
+            _observado(date(anio, 7, 4)),
+            _enesimo_dia_semana(anio, 9, 0, 1),    # Labor Day
+            _enesimo_dia_semana(anio, 11, 3, 4),   # Thanksgiving
+            _observado(date(anio, 12, 25)),
+        }
+        if anio >= 2022:
+            feriados.add(_observado(date(anio, 6, 19)))  # Juneteenth
+    
+    elif mercado == 'LSE':
+        navidad, boxing = date(anio, 12, 25), date(anio, 12, 26)
+        if navidad.weekday() >= 5:
+            navidad, boxing = date(anio, 12, 27), date(anio, 12, 28)
+        elif boxing.weekday() >= 5:
+            boxing = date(anio, 12, 28)
+        feriados = {
+            _observado(date(anio, 1, 1), sabado_a_viernes=False) if date(anio, 1, 1).weekday() != 5
+            else date(anio, 1, 3),
+            viernes_santo, lunes_pascua,
+            _enesimo_dia_semana(anio, 5, 0, 1),    # Early May bank holiday
+            _enesimo_dia_semana(anio, 5, 0, -1),   # Spring bank holiday
+            _enesimo_dia_semana(anio, 8, 0, -1),   # Summer bank holiday
+            navidad, boxing,
+        }
+    
+    elif mercado == 'XETRA':
+        feriados = {
+            date(anio, 1, 1), viernes_santo, lunes_pascua, date(anio, 5, 1),
+            date(anio, 12, 24), date(anio, 12, 25), date(anio, 12, 26), date(anio, 12, 31),
+        }
+    
+    elif mercado == 'TSE':
+        y = anio - 1980
+        equinoccio_primavera = date(anio, 3, int(20.8431 + 0.242194 * y - y // 4))
+        equinoccio_otono = date(anio, 9, int(23.2488 + 0.242194 * y - y // 4))
+        fijos = [
+            date(anio, 2, 11), date(anio, 4, 29), date(anio, 5, 3), date(anio, 5, 4), date(anio, 5, 5),
+            date(anio, 11, 3), date(anio, 11, 23), equinoccio_primavera, equinoccio_otono,
+        ]
+        if anio >= 2020:
+            fijos.append(date(anio, 2, 23))        # Cumpleaños del Emperador
+        feriados = {date(anio, 1, 1), date(anio, 1, 2), date(anio, 1, 3), date(anio, 12, 31),
+                    _enesimo_dia_semana(anio, 1, 0, 2),   # Día de la Mayoría de Edad
+                    _enesimo_dia_semana(anio, 7, 0, 3),   # Día del Mar
+                    _enesimo_dia_semana(anio, 9, 0, 3),   # Día del Respeto a los Mayores
+                    _enesimo_dia_semana(anio, 10, 0, 2)}  # Día del Deporte
+        for fecha in fijos:
+            feriados.add(fecha)
+            if fecha.weekday() == 6:
+                # Feriado sustituto: el siguiente día hábil que no sea feriado
+                sustituto = fecha + timedelta(days=1)
+                while sustituto in feriados or sustituto in fijos:
+                    sustituto += timedelta(days=1)
+                feriados.add(sustituto)
+    
+    return {f for f in feriados if f is not None and f.weekday() < 5}
+
+
+def calendario_habil(mercado, fecha_inicio, fecha_fin):
+    """np.busdaycalendar (lunes a viernes) con los feriados del mercado en el rango"""
+    import numpy as np
+    
+    feriados = set()
+    for anio in range(fecha_inicio.year, fecha_fin.year + 1):
+        feriados |= feriados_mercado(mercado, anio)
+    return np.busdaycalendar(holidays=sorted(feriados))
+
+
+def dias_habiles(mercado, fecha_inicio, fecha_fin):
+    """Fechas con sesión en [inicio, fin) como array datetime64[D]"""
+    import numpy as np
+    
+    dias = np.arange(np.datetime64(fecha_inicio.date(), 'D'), np.datetime64(fecha_fin.date(), 'D'))
+    return dias[np.is_busday(dias, busdaycal=calendario_habil(mercado, fecha_inicio, fecha_fin))]
+
+
+def horas_forex_abiertas(fecha_inicio, fecha_fin):
+    """
+    Horas UTC con mercado Forex abierto en [inicio, fin) como datetime64[h]:
+    todas salvo la pausa de fin de semana.
+    """
+    import numpy as np
+    
+    horas = np.arange(np.datetime64(fecha_inicio, 'h'), np.datetime64(fecha_fin, 'h'))
+    ns = horas.astype('datetime64[ns]').astype('int64')
+    return horas[_slots_forex_abiertos(ns, 3_600_000_000_000)]
+
+
+def peticiones_forex(rangos):
+    """Archivos horarios de Dukascopy que cubren los rangos (uno por hora abierta)"""
+    return sum(len(horas_forex_abiertas(desde, hasta)) for desde, hasta in rangos)
+
+
+def planificar_rangos(tipo, simbolo, fecha_inicio, fecha_fin):
+    """
+    Divide [inicio, fin) en bloques contiguos de días con mercado abierto para
+    no pedir fines de semana ni feriados. Devuelve [(desde, hasta)] con hasta
+    exclusivo; lista vacía si no hay ninguna sesión en el rango.
+    """
+    import numpy as np
+    
+    if tipo == 'forex':
+        # El domingo abre a las 22:00 UTC; el sábado nunca tiene datos, pero
+        # un sábado solo no corta el bloque: duka lo recorre sin costo y así
+        # alcanza un proceso para todo el rango
+        dias = np.unique(horas_forex_abiertas(fecha_inicio, fecha_fin).astype('datetime64[D]'))
+        hueco = np.timedelta64(2, 'D')
+    else:
+        dias = dias_habiles(mercado_de(simbolo, tipo), fecha_inicio, fecha_fin)
+        hueco = np.timedelta64(1, 'D')
+    if len(dias) == 0:
+        return []
+    
+    cortes = np.flatnonzero(np.diff(dias) > hueco) + 1
+    rangos = []
+    for bloque in np.split(dias, cortes):
+        desde = datetime.combine(bloque[0].astype(object), datetime.min.time())
+        hasta = datetime.combine(bloque[-1].astype(object), datetime.min.time()) + timedelta(days=1)
+        rangos.append((max(desde, fecha_inicio), min(hasta, fecha_fin)))
+    return rangos
+
+
+
+def leer_datos(ruta_archivo):
+    """Lee un archivo descargado (CSV normal, compacto o .dtk) y lo devuelve normalizado"""
+    import pandas as pd
+    
+    if ruta_archivo.endswith('.dtk'):
+        return ArchivoTicks(ruta_archivo).leer()
+    if ruta_archivo.endswith('.parquet'):
+        return normalizar_datos(pd.read_parquet(ruta_archivo))
+    esquema = leer_esquema(ruta_archivo)
+    df = pd.read_csv(ruta_archivo)
+    if esquema is None:
+        return normalizar_datos(df)
+    return expandir_tipos(df, esquema)
+
+
+def tamano_punto(simbolo):
+    """Tamaño de punto (tick mínimo) usado para escalar precios a enteros"""
+    simbolo = simbolo.upper().replace('=X', '')
+    if simbolo in TAMANOS_PUNTO:
+        return TAMANOS_PUNTO[simbolo]
+    if len(simbolo) == 6 and simbolo.isalpha():
+        return 1e-3 if 'JPY' in simbolo else 1e-5
+    return 1e-2
+
+
+def compactar_tipos(df, simbolo, precios='float32', unidad_tiempo='ms'):
+    """
+    Convierte una serie normalizada al esquema compacto: timestamp int64 epoch
+    (ms o ns), precios float32 o int32 escalados por el tamaño de punto y
+    volúmenes uint32 (float32 si no son enteros). Devuelve (df, esquema).
+    """
+    import numpy as np
+    import pandas as pd
+    
+    if precios not in ('float32', 'int32'):
+        raise ValueError(f"Tipo de precio compacto inválido: {precios}")
+    if unidad_tiempo not in ('ms', 'ns'):
+        raise ValueError(f"Unidad de tiempo inválida: {unidad_tiempo}")
+    
+    divisor = 1_000_000 if unidad_tiempo == 'ms' else 1
+    punto = tamano_punto(simbolo)
+    compacto = pd.DataFrame({'timestamp': _tiempos_ns(df.index) // divisor})
+    esquema = {'version': 1, 'simbolo': simbolo, 'unidad_tiempo': unidad_tiempo,
+               'precios': precios, 'punto': punto, 'columnas': {}}
+    
+    for columna in df.columns:
+        valores = df[columna].to_numpy()
+        if columna in COLUMNAS_PRECIO:
+            if precios == 'int32':
+                valores = np.rint(valores.astype('float64') / punto).astype('int32')
+            else:
+                valores = valores.astype('float32')
+        elif columna in COLUMNAS_VOLUMEN:
+            enteros = np.rint(valores.astype('float64'))
+            if np.array_equal(enteros, valores) and enteros.min(initial=0) >= 0 and enteros.max(initial=0) < 2**32:
+                valores = enteros.astype('uint32')
+            else:
+                valores = valores.astype('float32')
+        elif not pd.api.types.is_numeric_dtype(valores):
+            esquema['columnas'][columna] = 'texto'
+            compacto[columna] = valores
+            continue
+        esquema['columnas'][columna] = str(valores.dtype)
+        compacto[columna] = valores
+    return compacto, esquema
+
+
+def expandir_tipos(df, esquema):
+    """Reconstruye la serie normalizada (índice UTC, precios reales) desde el esquema compacto"""
+    import pandas as pd
+    
+    df = df.copy()
+    indice = pd.to_datetime(df.pop('timestamp').to_numpy(dtype='int64'), unit=esquema['unidad_tiempo'], utc=True)
+    df.index = pd.DatetimeIndex(indice, name='timestamp')
+    for columna, tipo in esquema['columnas'].items():
+        if columna not in df.columns or tipo == 'texto':
+            continue
+        if columna in COLUMNAS_PRECIO and esquema['precios'] == 'int32':
+            # Precio entero escalado -> precio real
+            df[columna] = df[columna].to_numpy(dtype='int32') * esquema['punto']
+        else:
+            df[columna] = df[columna].astype(tipo)
+    return df
+
+
+def _ruta_esquema(ruta_archivo):
+    """Ruta del archivo de esquema que acompaña a un CSV compacto"""
+    return os.path.splitext(ruta_archivo)[0] + '.esquema.json'
+
+
+def leer_esquema(ruta_archivo):
+    """Devuelve el esquema compacto de un archivo o None si es un CSV normal"""
+    import json
+    
+    ruta = _ruta_esquema(ruta_archivo)
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def guardar_compacto(df, ruta_archivo, simbolo, precios='float32', unidad_tiempo='ms'):
+    """Guarda una serie en formato compacto junto con su archivo de esquema"""
+    import json
+    
+    compacto, esquema = compactar_tipos(normalizar_datos(df), simbolo, precios, unidad_tiempo)
+    compacto.to_csv(ruta_archivo, index=False)
+    with open(_ruta_esquema(ruta_archivo), 'w', encoding='utf-8') as f:
+        json.dump(esquema, f, ensure_ascii=False, separators=(',', ':'))
+    return ruta_archivo
+
+
+def _tiempos_ns(indice):
+    """Timestamps de un DatetimeIndex como int64 en nanosegundos"""
+    if hasattr(indice, 'as_unit'):
+        indice = indice.as_unit('ns')
+    return indice.asi8
+
+
+def _minutos_semana(tiempos_ns):
+    """Minutos transcurridos desde el lunes 00:00 UTC para timestamps en ns (vectorizado)"""
+    minutos = tiempos_ns // 60_000_000_000
+    # 1970-01-01 fue jueves: se desplaza 3 días para que el lunes sea 0
+    return (minutos + 3 * 1440) % (7 * 1440)
+
+
+def _slots_forex_abiertos(slots_ns, paso_ns):
+    """Máscara de slots [t, t+paso) que tocan horario de mercado Forex"""
+    minutos = _minutos_semana(slots_ns)
+    paso_min = paso_ns // 60_000_000_000
+    return (minutos < CIERRE_FOREX_INICIO) | (minutos + paso_min > CIERRE_FOREX_FIN)
+
+
+def validar_calidad(df, temporalidad, tipo='forex', umbral_outlier=12.0, simbolo=None, zona=None):
+    """
+    Revisa una serie ya normalizada con leer_datos y devuelve un reporte compacto:
+    duplicados, orden temporal, precios no positivos, saltos atípicos y
+    barras faltantes respecto al calendario del mercado. Todo vectorizado.
+    Con zona (clave de ZONAS_CANONICAS) las velas diarias se leen como
+    reetiquetadas por normalizar_zona; sin ella, como las fecha el proveedor.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    reporte = {
+        'filas': int(len(df)),
+        'temporalidad': temporalidad,
+        'tipo': tipo,
+    }
+    if len(df) == 0:
+        reporte['ok'] = False
+        reporte['problemas'] = ['sin datos']
+        return reporte
+    
+    tiempos = _tiempos_ns(df.index)
+    reporte['inicio'] = str(df.index.min())
+    reporte['fin'] = str(df.index.max())
+    
+    # Orden y duplicados
+    dif = np.diff(tiempos)
+    reporte['no_monotonicos'] = int(np.count_nonzero(dif < 0))
+    ordenados = np.sort(tiempos) if reporte['no_monotonicos'] else tiempos
+    reporte['duplicados'] = int(np.count_nonzero(np.diff(ordenados) == 0))
+    unicos = np.unique(ordenados) if reporte['duplicados'] else ordenados
+    
+    # Precios
+    columnas_precio = [c for c in ('open', 'high', 'low', 'close', 'ask', 'bid') if c in df.columns]
+    precios = df[columnas_precio].to_numpy(dtype='float64')
+    reporte['precios_invalidos'] = int(np.count_nonzero(~(precios > 0)))
+    
+    if {'open', 'high', 'low', 'close'} <= set(df.columns):
+        o, h, l, c = (df[k].to_numpy(dtype='float64') for k in ('open', 'high', 'low', 'close'))
+        reporte['ohlc_inconsistentes'] = int(np.count_nonzero((h < np.maximum(o, c)) | (l > np.minimum(o, c))))
+        serie = c
+    elif {'ask', 'bid'} <= set(df.columns):
+        serie = (df['ask'].to_numpy(dtype='float64') + df['bid'].to_numpy(dtype='float64')) / 2
+    else:
+        serie = precios[:, 0] if precios.size else np.empty(0)
+    
+    # Saltos atípicos: retorno logarítmico con z-score robusto (mediana/MAD)
+    reporte['outliers'] = 0
+    if len(serie) > 2:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            retornos = np.diff(np.log(serie))
+        retornos = retornos[np.isfinite(retornos)]
+        if len(retornos):
+            mediana = np.median(retornos)
+            mad = np.median(np.abs(retornos - mediana)) * 1.4826
+            if mad > 0:
+                reporte['outliers'] = int(np.count_nonzero(np.abs(retornos - mediana) > umbral_outlier * mad))
+    
+    # Barras faltantes respecto al calendario
+    frecuencia = FRECUENCIAS_PANDAS.get(temporalidad)
+    huecos = []
+    dia = 86_400_000_000_000
+    mercado = mercado_de(simbolo or '', tipo)
+    if len(unicos) > 1:
+        primero, ultimo = (pd.Timestamp(t, tz='UTC').to_pydatetime() for t in (unicos[0], unicos[-1]))
+        calendario = calendario_habil(mercado, primero, ultimo)
+    if frecuencia is not None and len(unicos) > 1:
+        paso = pd.Timedelta(frecuencia).value
+        if paso >= dia:
+            # Velas diarias: se comparan fechas de sesión. Yahoo las fecha a
+            # medianoche de la bolsa (22:00 UTC del día anterior en Fráncfort,
+            # 15:00 en Tokio), duka a medianoche UTC y normalizar_zona a
+            # medianoche de la zona canónica
+            indice = pd.to_datetime(unicos, utc=True)
+            if zona:
+                fechas = dia_sesion(indice, zona)
+            else:
+                tz = SESIONES_MERCADO[mercado][0] if mercado in SESIONES_MERCADO else 'UTC'
+                fechas = indice.tz_convert(tz).tz_localize(None).normalize()
+            dias_obs = np.unique(_tiempos_ns(fechas) // dia)
+            esperados = np.arange(dias_obs[0], dias_obs[-1] + 1, dtype='int64')
+            esperados = esperados[np.is_busday(esperados.astype('datetime64[D]'), busdaycal=calendario)]
+            faltantes = np.setdiff1d(esperados, dias_obs, assume_unique=True) * dia
+            reporte['barras_esperadas'] = int(len(esperados))
+        elif tipo == 'forex':
+            esperados = unicos[0] + np.arange((unicos[-1] - unicos[0]) // paso + 1, dtype='int64') * paso
+            abiertos = _slots_forex_abiertos(esperados, paso)
+            abiertos &= ~np.isin(esperados // dia, calendario.holidays.astype('int64'))
+            esperados = esperados[abiertos]
+            faltantes = np.setdiff1d(esperados, unicos, assume_unique=True)
+            reporte['barras_esperadas'] = int(len(esperados))
+        else:
+            faltantes = None
+        
+        if faltantes is not None:
+            reporte['barras_faltantes'] = int(len(faltantes))
+            if len(faltantes):
+                reporte['rango_faltante'] = [str(pd.Timestamp(faltantes[0], tz='UTC')),
+                                             str(pd.Timestamp(faltantes[-1], tz='UTC'))]
+                # Agrupar faltantes consecutivos en huecos
+                paso_hueco = min(paso, dia)
+                cortes = np.flatnonzero(np.diff(faltantes) != paso_hueco) + 1
+                inicios = faltantes[np.r_[0, cortes]]
+                largos = np.diff(np.r_[0, cortes, len(faltantes)])
+                for i in np.argsort(largos)[::-1][:5]:
+                    huecos.append((inicios[i], inicios[i] + (largos[i] - 1) * paso_hueco, int(largos[i])))
+        else:
+            # Intradía de bolsa: solo se revisa dentro de cada sesión observada
+            dif_unicos = np.diff(unicos)
+            mismo_dia = (unicos[1:] // dia) == (unicos[:-1] // dia)
+            saltos = np.where(mismo_dia & (dif_unicos > paso), dif_unicos // paso - 1, 0)
+            reporte['barras_faltantes'] = int(saltos.sum())
+            for i in np.argsort(saltos)[::-1][:5]:
+                if saltos[i] > 0:
+                    huecos.append((unicos[i] + paso, unicos[i + 1] - paso, int(saltos[i])))
+    elif temporalidad == 'tick' and len(unicos) > 1:
+        # Ticks: huecos con más de una hora de mercado abierto sin cotizaciones
+        hora = 60
+        dif_min = np.diff(unicos) // 60_000_000_000
+        inicio_min = _minutos_semana(unicos[:-1])
+        fin_min = inicio_min + dif_min
+        cerrado = np.zeros(len(dif_min), dtype='int64')
+        for desplazamiento in (0, 7 * 1440):
+            c0, c1 = CIERRE_FOREX_INICIO + desplazamiento, CIERRE_FOREX_FIN + desplazamiento
+            cerrado += np.maximum(0, np.minimum(fin_min, c1) - np.maximum(inicio_min, c0))
+        abierto = dif_min - cerrado
+        candidatos = np.flatnonzero(abierto > hora)
+        reporte['huecos_tick_1h'] = int(len(candidatos))
+        for i in candidatos[np.argsort(abierto[candidatos])[::-1][:5]]:
+            huecos.append((unicos[i], unicos[i + 1], int(abierto[i])))
+    
+    reporte['huecos_mayores'] = [
+        [str(pd.Timestamp(a, tz='UTC')), str(pd.Timestamp(b, tz='UTC')), n] for a, b, n in huecos
+    ]
+    
+    problemas = []
+    for clave, texto in (('duplicados', 'timestamps duplicados'),
+                         ('no_monotonicos', 'saltos hacia atrás en el tiempo'),
+                         ('precios_invalidos', 'precios cero/negativos'),
+                         ('ohlc_inconsistentes', 'velas OHLC inconsistentes'),
+                         ('outliers', 'saltos atípicos'),
+                         ('barras_faltantes', 'barras faltantes'),
+                         ('huecos_tick_1h', 'huecos de ticks > 1h')):
+        if reporte.get(clave):
+            problemas.append(f"{reporte[clave]:,} {texto}")
+    reporte['problemas'] = problemas
+    reporte['ok'] = not problemas
+    return reporte
+
+
+# Archivo de ticks comprimido (.dtk): bloques con timestamps y precios en
+# delta, comprimidos con zstd (o LZMA, como los .bi5 de Dukascopy) y un
+# índice de bloques al final para leer rangos sin descomprimir todo.
+MAGIA_DTK = b'DTK1'
+MAGIA_INDICE_DTK = b'DTKI'
+COMPRESORES_DTK = {1: 'zstd', 2: 'lzma'}
+INDICE_DTK_DTYPE = [
+    ('ts_inicio', '<i8'), ('ts_fin', '<i8'), ('offset', '<u8'), ('largo', '<u4'), ('n', '<u4'),
+    ('ask_inicio', '<i4'), ('ancho_ts', 'u1'), ('ancho_ask', 'u1'), ('ancho_spread', 'u1'), ('reservado', 'u1')
+]
+
+
+def _compresor_dtk(nombre=None):
+    """Devuelve (id, comprimir, descomprimir) usando zstd si está disponible"""
+    import lzma
+    
+    if nombre in (None, 'zstd'):
+        try:
+            import zstandard
+            compresor = zstandard.ZstdCompressor(level=9)
+            descompresor = zstandard.ZstdDecompressor()
+            return 1, compresor.compress, descompresor.decompress
+        except ImportError:
+            if nombre == 'zstd':
+                raise ImportError("zstandard no está instalado (pip install zstandard)")
+    filtros = [{'id': lzma.FILTER_LZMA2, 'preset': 6}]
+    return (2,
+            lambda datos: lzma.compress(datos, format=lzma.FORMAT_RAW, filters=filtros),
+            lambda datos: lzma.decompress(datos, format=lzma.FORMAT_RAW, filters=filtros))
+
+
+def _entero_minimo(valores, tipos=('<i1', '<i2', '<i4')):
+    """Convierte enteros al tipo con signo más pequeño (de `tipos`) que los contiene"""
+    import numpy as np
+    
+    if len(valores) == 0:
+        return valores.astype('<i1')
+    minimo, maximo = int(valores.min()), int(valores.max())
+    for tipo in tipos:
+        info = np.iinfo(tipo)
+        if info.min <= minimo and maximo <= info.max:
+            return valores.astype(tipo)
+    raise ValueError(f"Delta fuera de rango para {np.dtype(tipos[-1])}: revise el tamaño de punto "
+                     f"o el orden de los ticks")
+
+
+def _tipo_volumen(*columnas):
+    """float32 si representa exactamente todos los volúmenes, si no float64"""
+    import numpy as np
+    
+    for valores in columnas:
+        if not np.array_equal(valores.astype('<f4').astype('float64'), valores, equal_nan=True):
+            return '<f8'
+    return '<f4'
+
+
+def escribir_archivo_ticks(df, ruta_archivo, simbolo, tamano_bloque=65536, compresor=None):
+    """
+    Escribe ticks normalizados (ask, bid, ask_volume, bid_volume) en formato .dtk.
+    Los volúmenes se guardan sin pérdida (float32 solo si los representa
+    exactamente). Devuelve el número de bloques escritos.
+    """
+    import json
+    import struct
+    import numpy as np
+    
+    id_compresor, comprimir, _ = _compresor_dtk(compresor)
+    punto = tamano_punto(simbolo)
+    
+    df = df.sort_index(kind='stable')
+    ts = _tiempos_ns(df.index) // 1_000_000
+    ask = np.rint(df['ask'].to_numpy(dtype='float64') / punto).astype('int64')
+    spread = np.rint(df['bid'].to_numpy(dtype='float64') / punto).astype('int64')
+    spread = ask - spread
+    ask_vol, bid_vol = (df[c].to_numpy(dtype='float64') if c in df.columns else np.zeros(len(df))
+                        for c in ('ask_volume', 'bid_volume'))
+    tipo_volumen = _tipo_volumen(ask_vol, bid_vol)
+    ask_vol, bid_vol = ask_vol.astype(tipo_volumen), bid_vol.astype(tipo_volumen)
+    
+    meta = json.dumps({'simbolo': simbolo, 'punto': punto, 'unidad_tiempo': 'ms',
+                       'filas': int(len(df)), 'volumen': tipo_volumen[1:]}).encode('utf-8')
+    indice = []
+    
+    with open(ruta_archivo, 'wb') as f:
+        f.write(MAGIA_DTK + struct.pack('<BI', id_compresor, len(meta)) + meta)
+        for desde in range(0, len(df), tamano_bloque):
+            hasta = min(desde + tamano_bloque, len(df))
+            # Un hueco de más de 24,8 días no entra en int32 ms
+            d_ts = _entero_minimo(np.diff(ts[desde:hasta]), ('<i1', '<i2', '<i4', '<i8'))
+            d_ask = _entero_minimo(np.diff(ask[desde:hasta]))
+            spr = _entero_minimo(spread[desde:hasta])
+            datos = b''.join([d_ts.tobytes(), d_ask.tobytes(), spr.tobytes(),
+                              ask_vol[desde:hasta].tobytes(), bid_vol[desde:hasta].tobytes()])
+            comprimido = comprimir(datos)
+            indice.append((ts[desde], ts[hasta - 1], f.tell(), len(comprimido), hasta - desde,
+                           ask[desde], d_ts.itemsize, d_ask.itemsize, spr.itemsize, 0))
+            f.write(comprimido)
+        
+        offset_indice = f.tell()
+        f.write(np.array(indice, dtype=INDICE_DTK_DTYPE).tobytes())
+        f.write(struct.pack('<QI', offset_indice, len(indice)) + MAGIA_INDICE_DTK)
+    return len(indice)
+
+
+class ArchivoTicks:
+    """Lector de archivos .dtk con acceso aleatorio por rango de fechas"""
+    
+    def __init__(self, ruta_archivo):
+        import json
+        import struct
+        import numpy as np
+        
+        self.ruta_archivo = ruta_archivo
+        with open(ruta_archivo, 'rb') as f:
+            cabecera = f.read(9)
+            if cabecera[:4] != MAGIA_DTK:
+                raise ValueError(f"{ruta_archivo} no es un archivo de ticks .dtk")
+            id_compresor, largo_meta = struct.unpack('<BI', cabecera[4:9])
+            self.meta = json.loads(f.read(largo_meta).decode('utf-8'))
+            
+            f.seek(-16, os.SEEK_END)
+            offset_indice, n_bloques, magia = struct.unpack('<QI4s', f.read(16))
+            if magia != MAGIA_INDICE_DTK:
+                raise ValueError(f"{ruta_archivo} está incompleto (sin índice de bloques)")
+            f.seek(offset_indice)
+            self.indice = np.frombuffer(f.read(n_bloques * np.dtype(INDICE_DTK_DTYPE).itemsize),
+                                        dtype=INDICE_DTK_DTYPE)
+        
+        self.punto = self.meta['punto']
+        # Los .dtk anteriores guardaban los volúmenes como float32
+        self.tipo_volumen = '<' + self.meta.get('volumen', 'f4')
+        self.compresor = COMPRESORES_DTK[id_compresor]
+        _, _, self._descomprimir = _compresor_dtk(self.compresor)
+    
+    def __len__(self):
+        return int(self.indice['n'].sum())
+    
+    def _bloques(self, inicio=None, fin=None):
+        """Posiciones de los bloques que pueden tener ticks en [inicio, fin]"""
+        import numpy as np
+        
+        desde, hasta = 0, len(self.indice)
+        if inicio is not None:
+            desde = int(np.searchsorted(self.indice['ts_fin'], _a_epoch_ms(inicio), side='left'))
+        if fin is not None:
+            hasta = int(np.searchsorted(self.indice['ts_inicio'], _a_epoch_ms(fin), side='right'))
+        return range(desde, hasta)
+    
+    def _decodificar(self, f, entrada, salida=None):
+        """
+        Descomprime un bloque y reconstruye sus arrays (ts ms, ask, bid en
+        puntos, volúmenes). Con `salida` (5 arrays de n elementos; ask y bid
+        pueden ser float64) escribe ahí en lugar de reservar memoria nueva.
+        """
+        import numpy as np
+        
+        f.seek(int(entrada['offset']))
+        datos = self._descomprimir(f.read(int(entrada['largo'])))
+        n = int(entrada['n'])
+        posicion = 0
+        columnas = []
+        for ancho, cantidad in ((entrada['ancho_ts'], n - 1), (entrada['ancho_ask'], n - 1),
+                                (entrada['ancho_spread'], n)):
+            columnas.append(np.frombuffer(datos, dtype=f'<i{ancho}', count=cantidad, offset=posicion))
+            posicion += int(ancho) * cantidad
+        ancho_volumen = np.dtype(self.tipo_volumen).itemsize
+        ask_vol = np.frombuffer(datos, dtype=self.tipo_volumen, count=n, offset=posicion)
+        bid_vol = np.frombuffer(datos, dtype=self.tipo_volumen, count=n, offset=posicion + ancho_volumen * n)
+        
+        if salida is None:
+            ts, ask, bid = np.empty(n, dtype='int64'), np.empty(n, dtype='int64'), np.empty(n, dtype='int64')
+        else:
+            ts, ask, bid = salida[:3]
+            salida[3][:] = ask_vol
+            salida[4][:] = bid_vol
+        ts[0] = entrada['ts_inicio']
+        np.cumsum(columnas[0], out=ts[1:])
+        ts[1:] += ts[0]
+        ask[0] = entrada['ask_inicio']
+        np.cumsum(columnas[1], out=ask[1:])
+        ask[1:] += ask[0]
+        np.subtract(ask, columnas[2], out=bid)
+        return ts, ask, bid, ask_vol, bid_vol
+    
+    def iterar(self, inicio=None, fin=None):
+        """Genera un DataFrame por bloque dentro del rango (lectura en streaming)"""
+        import pandas as pd
+        
+        desde_ms = _a_epoch_ms(inicio) if inicio is not None else None
+        hasta_ms = _a_epoch_ms(fin) if fin is not None else None
+        with open(self.ruta_archivo, 'rb') as f:
+            for posicion in self._bloques(inicio, fin):
+                ts, ask, bid, ask_vol, bid_vol = self._decodificar(f, self.indice[posicion])
+                mascara = slice(None)
+                if desde_ms is not None or hasta_ms is not None:
+                    mascara = (ts >= (desde_ms if desde_ms is not None else ts[0])) & \
+                              (ts <= (hasta_ms if hasta_ms is not None else ts[-1]))
+                df = pd.DataFrame({
+                    'ask': ask[mascara] * self.punto,
+                    'bid': bid[mascara] * self.punto,
+                    'ask_volume': ask_vol[mascara],
+                    'bid_volume': bid_vol[mascara],
+                }, index=pd.DatetimeIndex(pd.to_datetime(ts[mascara], unit='ms', utc=True), name='timestamp'))
+                if len(df):
+                    yield df
+    
+    def leer(self, inicio=None, fin=None):
+        """
+        Lee los ticks del rango [inicio, fin] como un único DataFrame. Los
+        bloques se decodifican directo en arrays del tamaño total (sin un
+        DataFrame por bloque ni concat) y el rango se recorta con searchsorted.
+        """
+        import numpy as np
+        import pandas as pd
+        
+        bloques = self._bloques(inicio, fin)
+        n = int(self.indice['n'][bloques.start:bloques.stop].sum()) if len(bloques) else 0
+        ts = np.empty(n, dtype='int64')
+        # Las cuatro columnas en un solo bloque float64 que el DataFrame usa sin
+        # copiar; los precios en puntos son enteros exactos en float64
+        valores = np.empty((4, n), dtype='float64')
+        posicion = 0
+        with open(self.ruta_archivo, 'rb') as f:
+            for bloque in bloques:
+                entrada = self.indice[bloque]
+                hasta = posicion + int(entrada['n'])
+                self._decodificar(f, entrada, (ts[posicion:hasta], *valores[:, posicion:hasta]))
+                posicion = hasta
+        valores[:2] *= self.punto
+        
+        desde = int(np.searchsorted(ts, _a_epoch_ms(inicio), side='left')) if inicio is not None else 0
+        hasta = int(np.searchsorted(ts, _a_epoch_ms(fin), side='right')) if fin is not None else n
+        # ms -> ns en el lugar: el índice usa el mismo buffer
+        tiempos = ts[desde:hasta]
+        tiempos *= 1_000_000
+        indice = pd.DatetimeIndex(tiempos.view('datetime64[ns]'), name='timestamp').tz_localize('UTC')
+        return pd.DataFrame(valores[:, desde:hasta].T, index=indice, copy=False,
+                            columns=['ask', 'bid', 'ask_volume', 'bid_volume'])
+
+
+def _a_epoch_ms(fecha):
+    """Convierte una fecha (str, datetime o Timestamp; naive = UTC) a epoch en ms"""
+    return _a_utc(fecha).value // 1_000_000
+
+
+
+# Claves de la estructura particionada estilo Hive (en orden de carpetas)
+CLAVES_PARTICION = ('source', 'symbol', 'timeframe', 'year', 'month')
+
+
+def _valor_particion(valor):
+    """Limpia un valor para usarlo como nombre de carpeta clave=valor"""
+    return str(valor).replace('/', '_').replace('\\', '_')
+
+
+def _escribir_parte(df, ruta_archivo, simbolo, formato='csv', esquema_compacto=None):
+    """Escribe un archivo de partición en el formato pedido"""
+    if formato == 'parquet':
+        df.to_parquet(ruta_archivo)
+    elif formato == 'dtk':
+        escribir_archivo_ticks(df, ruta_archivo, simbolo)
+    elif esquema_compacto:
+        guardar_compacto(df, ruta_archivo, simbolo, precios=esquema_compacto)
+    else:
+        df.to_csv(ruta_archivo)
+
+
+def escribir_particionado(df, raiz, fuente, simbolo, temporalidad, formato='csv', esquema_compacto=None):
+    """
+    Guarda una serie normalizada en raiz/source=/symbol=/timeframe=/year=/month=/.
+    Si una partición ya existe se fusiona (los timestamps nuevos reemplazan a los
+    anteriores). Devuelve la lista de archivos escritos.
+    """
+    import pandas as pd
+    
+    if formato not in ('csv', 'parquet', 'dtk'):
+        raise ValueError(f"Formato de partición inválido: {formato}")
+    
+    df = normalizar_datos(df)
+    base = os.path.join(raiz, f"source={_valor_particion(fuente)}", f"symbol={_valor_particion(simbolo)}",
+                        f"timeframe={_valor_particion(temporalidad)}")
+    escritos = []
+    
+    for (anio, mes), parte in df.groupby([df.index.year, df.index.month], sort=True):
+        carpeta = os.path.join(base, f"year={anio:04d}", f"month={mes:02d}")
+        os.makedirs(carpeta, exist_ok=True)
+        ruta_archivo = os.path.join(carpeta, f"part.{formato}")
+        
+        if os.path.exists(ruta_archivo):
+            anterior = leer_datos(ruta_archivo)
+            parte = pd.concat([anterior[~anterior.index.isin(parte.index)], parte]).sort_index()
+        _escribir_parte(parte, ruta_archivo, simbolo, formato, esquema_compacto)
+        escritos.append(ruta_archivo)
+    return escritos
+
+
+def _filtro_particion(condicion):
+    """Convierte un predicado (None, valor, lista o función) en una función de filtro"""
+    if condicion is None:
+        return lambda valor: True
+    if callable(condicion):
+        return condicion
+    if isinstance(condicion, (list, tuple, set)):
+        valores = {_valor_particion(v) for v in condicion}
+        return lambda valor: valor in valores
+    return lambda valor: valor == _valor_particion(condicion)
+
+
+def listar_particiones(raiz, fuente=None, simbolo=None, temporalidad=None, inicio=None, fin=None):
+    """
+    Recorre la estructura particionada descartando carpetas que no cumplen los
+    predicados antes de abrir ningún archivo. Devuelve [(ruta_archivo, valores)].
+    """
+    import pandas as pd
+    
+    mes_inicio = mes_fin = None
+    if inicio is not None:
+        inicio = pd.Timestamp(inicio)
+        mes_inicio = inicio.year * 12 + inicio.month - 1
+    if fin is not None:
+        fin = pd.Timestamp(fin)
+        mes_fin = fin.year * 12 + fin.month - 1
+    
+    filtros = {
+        'source': _filtro_particion(fuente),
+        'symbol': _filtro_particion(simbolo),
+        'timeframe': _filtro_particion(temporalidad),
+        'year': lambda valor: ((mes_inicio is None or int(valor) >= mes_inicio // 12) and
+                               (mes_fin is None or int(valor) <= mes_fin // 12)),
+    }
+    
+    def filtro_mes(valores):
+        mes = int(valores['year']) * 12 + int(valores['month']) - 1
+        return (mes_inicio is None or mes >= mes_inicio) and (mes_fin is None or mes <= mes_fin)
+    
+    resultado = []
+    
+    def recorrer(carpeta, nivel, valores):
+        if nivel == len(CLAVES_PARTICION):
+            for nombre in sorted(os.listdir(carpeta)):
+                if nombre.startswith(('part.', 'part-')) and not nombre.endswith('.json'):
+                    resultado.append((os.path.join(carpeta, nombre), dict(valores)))
+            return
+        clave = CLAVES_PARTICION[nivel]
+        try:
+            nombres = sorted(os.listdir(carpeta))
+        except FileNotFoundError:
+            return
+        for nombre in nombres:
+            if not nombre.startswith(clave + '='):
+                continue
+            valor = nombre.split('=', 1)[1]
+            valores[clave] = valor
+            if clave == 'month':
+                if not filtro_mes(valores):
+                    continue
+            elif not filtros[clave](valor):
+                continue
+            recorrer(os.path.join(carpeta, nombre), nivel + 1, valores)
+        valores.pop(clave, None)
+    
+    recorrer(raiz, 0, {})
+    return resultado
+
+
+def leer_particionado(raiz, fuente=None, simbolo=None, temporalidad=None, inicio=None, fin=None, columnas=None):
+    """
+    Lee solo las particiones que cumplen los predicados y recorta al rango
+    [inicio, fin]. Las claves que no se fijan con un único valor (p. ej. varios
+    símbolos) se agregan como columnas.
+    """
+    import pandas as pd
+    
+    particiones = listar_particiones(raiz, fuente, simbolo, temporalidad, inicio, fin)
+    claves_variables = [clave for clave, condicion in
+                        (('source', fuente), ('symbol', simbolo), ('timeframe', temporalidad))
+                        if not isinstance(condicion, str)]
+    desde = _a_utc(inicio) if inicio is not None else None
+    hasta = _a_utc(fin) if fin is not None else None
+    
+    partes = []
+    for ruta_archivo, valores in particiones:
+        if ruta_archivo.endswith('.dtk'):
+            df = ArchivoTicks(ruta_archivo).leer(desde, hasta)
+        else:
+            df = leer_datos(ruta_archivo)
+            if desde is not None or hasta is not None:
+                df = df.loc[desde:hasta]
+        if columnas:
+            df = df[[c for c in columnas if c in df.columns]]
+        for clave in claves_variables:
+            df[clave] = valores[clave]
+        partes.append(df)
+    
+    if not partes:
+        return pd.DataFrame(index=pd.DatetimeIndex([], tz='UTC', name='timestamp'))
+    return pd.concat(partes).sort_index(kind='stable')
+
+
+def _a_utc(fecha):
+    """Convierte una fecha a Timestamp en UTC (las fechas sin zona se toman como UTC)"""
+    import pandas as pd
+    
+    fecha = pd.Timestamp(fecha)
+    return fecha.tz_localize('UTC') if fecha.tzinfo is None else fecha.tz_convert('UTC')
+
+
+# Barras alternativas construidas desde ticks: cada tipo define cuándo se
+# cierra una barra (n ticks, volumen, valor negociado, rango o ladrillo).
+TIPOS_BARRA = ('tick', 'volumen', 'dolar', 'rango', 'renko')
+
+
+def iterar_ticks(fuentes, filas_por_bloque=1_000_000):
+    """
+    Genera bloques de ticks normalizados (índice UTC, ask/bid/volúmenes) de uno
+    o varios archivos .dtk, CSV de duka, compactos o Parquet, en el orden dado.
+    """
+    import pandas as pd
+    
+    if isinstance(fuentes, (str, pd.DataFrame)):
+        fuentes = [fuentes]
+    for fuente in fuentes:
+        if isinstance(fuente, pd.DataFrame):
+            yield fuente
+        elif fuente.endswith('.dtk'):
+            yield from ArchivoTicks(fuente).iterar()
+        elif fuente.endswith('.parquet') or os.path.isdir(fuente) or leer_esquema(fuente) is not None:
+            yield leer_datos(fuente)
+        else:
+            for parte in pd.read_csv(fuente, chunksize=filas_por_bloque):
+                yield normalizar_datos(parte)
+
+
+class ConstructorBarras:
+    """
+    Construye barras de ticks, volumen, dólar (precio x volumen), rango o
+    renko a partir de bloques de ticks. El estado (la barra incompleta) pasa
+    de un bloque al siguiente, así que se puede alimentar en streaming a
+    través de varios archivos sin cargar todo en memoria.
+    
+    Renko usa la regla estándar: los ladrillos van sobre una grilla fija de
+    tamaño `umbral`; seguir la tendencia pide un ladrillo y revertirla dos
+    (el de reversión abre en la apertura del último ladrillo). Cada barra
+    agrupa los ladrillos que formó el tick que la cerró.
+    
+        constructor = ConstructorBarras('volumen', 5_000)
+        for bloque in iterar_ticks(archivos):
+            barras = constructor.agregar(bloque)
+        ultima = constructor.cerrar()
+    """
+    
+    def __init__(self, tipo, umbral, precio='mid'):
+        if tipo not in TIPOS_BARRA:
+            raise ValueError(f"Tipo de barra inválido: {tipo} (usa {', '.join(TIPOS_BARRA)})")
+        if umbral <= 0:
+            raise ValueError("El umbral de las barras debe ser positivo")
+        if tipo == 'tick':
+            umbral = int(umbral)
+        self.tipo = tipo
+        self.umbral = umbral
+        self.precio = precio
+        self.barras = 0
+        self.ticks = 0
+        self._pendiente = None   # (tiempos, precios, volúmenes) de la barra incompleta
+        self._base = None        # origen de la grilla renko
+        self._ladrillo = 0       # cierre del último ladrillo renko, en ladrillos desde la base
+        self._direccion = 0      # tendencia renko: 1, -1 o 0 antes del primer ladrillo
+        self._excedente = 0.0    # volumen/valor sobrante de la última barra cerrada
+        self._ventana = 4096     # búsqueda adaptativa para barras de rango largas
+    
+    def _arrays(self, ticks):
+        import numpy as np
+        
+        columnas = ticks.columns
+        if self.precio == 'mid' and {'ask', 'bid'} <= set(columnas):
+            precios = (ticks['ask'].to_numpy(dtype='float64') + ticks['bid'].to_numpy(dtype='float64')) / 2
+        elif self.precio in columnas:
+            precios = ticks[self.precio].to_numpy(dtype='float64')
+        else:
+            precios = ticks['close' if 'close' in columnas else columnas[0]].to_numpy(dtype='float64')
+        
+        if {'ask_volume', 'bid_volume'} <= set(columnas):
+            volumenes = ticks['ask_volume'].to_numpy(dtype='float64') + ticks['bid_volume'].to_numpy(dtype='float64')
+        elif 'volume' in columnas:
+            volumenes = ticks['volume'].to_numpy(dtype='float64')
+        else:
+            volumenes = np.ones(len(ticks))
+        return _tiempos_ns(ticks.index), precios, volumenes
+    
+    def agregar(self, ticks):
+        """Procesa un bloque de ticks y devuelve las barras que quedaron completas"""
+        import numpy as np
+        
+        tiempos, precios, volumenes = self._arrays(ticks)
+        self.ticks += len(tiempos)
+        if self._pendiente is not None:
+            tiempos, precios, volumenes = (np.concatenate([a, b]) for a, b in zip(self._pendiente, (tiempos, precios, volumenes)))
+        if not len(tiempos):
+            return self._barras(tiempos, precios, volumenes, np.empty(0, dtype='int64'))
+        
+        cortes, niveles = self._cortes(precios, volumenes)
+        barras = self._barras(tiempos, precios, volumenes, cortes, niveles)
+        fin = int(cortes[-1]) if len(cortes) else 0
+        self._pendiente = (tiempos[fin:], precios[fin:], volumenes[fin:])
+        return barras
+    
+    def cerrar(self):
+        """Devuelve la última barra incompleta (puede estar vacía) y reinicia el estado"""
+        import numpy as np
+        
+        tiempos, precios, volumenes = self._pendiente if self._pendiente is not None else (np.empty(0),) * 3
+        self._pendiente = None
+        self._excedente = 0.0
+        cortes = np.array([len(tiempos)] if len(tiempos) else [], dtype='int64')
+        niveles = None
+        if self.tipo == 'renko' and len(tiempos):
+            # Barra sin ladrillo completo: abre y cierra en el nivel actual
+            nivel = self._base + self._ladrillo * self.umbral if self._base is not None else precios[0]
+            niveles = np.array([[nivel, nivel]])
+        return self._barras(tiempos, precios, volumenes, cortes, niveles)
+    
+    def _cortes(self, precios, volumenes):
+        """Índices (exclusivos) donde termina cada barra completa del bloque"""
+        import numpy as np
+        
+        n = len(precios)
+        if self.tipo == 'tick':
+            return np.arange(1, n // self.umbral + 1, dtype='int64') * self.umbral, None
+        
+        if self.tipo in ('volumen', 'dolar'):
+            pesos = volumenes if self.tipo == 'volumen' else precios * volumenes
+            # El excedente de la barra anterior se arrastra (umbrales fijos k * umbral)
+            # (con tolerancia para que el redondeo no dependa de cómo se partió el stream)
+            tolerancia = self.umbral * 1e-9
+            acumulado = self._excedente + np.cumsum(pesos)
+            completas = int((acumulado[-1] + tolerancia) // self.umbral)
+            limites = np.arange(1, completas + 1, dtype='float64') * self.umbral - tolerancia
+            # Un tick que cruza varios umbrales cierra una sola barra
+            cortes = np.unique(np.searchsorted(acumulado, limites, side='left') + 1)
+            cortes = cortes[cortes <= n].astype('int64')
+            if len(cortes):
+                ultimo = acumulado[cortes[-1] - 1]
+                self._excedente = ultimo - ((ultimo + tolerancia) // self.umbral) * self.umbral
+            return cortes, None
+        
+        if self.tipo == 'renko':
+            return self._cortes_renko(precios)
+        return np.array(self._cortes_rango(precios), dtype='int64'), None
+    
+    def _cortes_rango(self, precios):
+        """
+        Barras de rango. Con barras largas se busca barra por barra con
+        cummax/cummin en ventanas que se adaptan a su largo; con barras
+        cortas eso es una llamada a numpy por pocos ticks, y se calcula de
+        una vez, para todos los inicios posibles, dónde cierra la barra que
+        empieza ahí (si cierra en menos de CORTAS ticks).
+        """
+        n = len(precios)
+        cortes = []
+        inicio = 0
+        fines, origen = None, 0
+        while inicio < n:
+            corte = fines[inicio - origen] if fines is not None else 0
+            if not corte:
+                corte = self._buscar_rango(precios, inicio)
+                if corte is None:
+                    break
+            cortes.append(corte)
+            inicio = corte
+            if fines is None and len(cortes) >= 16 and inicio < self.CORTAS // 2 * len(cortes):
+                fines, origen = self._fines_rango(precios[inicio:], inicio), inicio
+        return cortes
+    
+    # Largo máximo (en ticks) de las barras de rango que se resuelven todas juntas
+    CORTAS = 64
+    
+    def _buscar_rango(self, precios, inicio):
+        """Fin (exclusivo) de la barra de rango que empieza en `inicio` o None si no cierra"""
+        import numpy as np
+        
+        n = len(precios)
+        while True:
+            fin = min(n, inicio + self._ventana)
+            tramo = precios[inicio:fin]
+            cumple = (np.maximum.accumulate(tramo) - np.minimum.accumulate(tramo)) >= self.umbral
+            j = int(cumple.argmax())
+            if cumple[j]:
+                self._ventana = max(64, 2 * (j + 1))
+                return inicio + j + 1
+            if fin == n:
+                return None
+            self._ventana *= 4
+    
+    def _fines_rango(self, precios, desplazamiento=0):
+        """
+        Para cada posición s, fin (exclusivo, más `desplazamiento`) de la barra
+        de rango que empezaría en s, o 0 si no cierra en CORTAS ticks. Es un
+        salto binario sobre máximos y mínimos de bloques de 2**j ticks: cada
+        barra crece por el bloque más grande que no alcanza el umbral.
+        """
+        import numpy as np
+        
+        n = len(precios)
+        # Fuera de la serie el bloque vale +-inf, así que nunca se acepta
+        alto = np.full(n + 1, np.inf)
+        bajo = np.full(n + 1, -np.inf)
+        alto[:n] = bajo[:n] = precios
+        altos, bajos = [alto], [bajo]
+        for j in range(1, self.CORTAS.bit_length() - 1):
+            paso = 1 << (j - 1)
+            alto, bajo = alto.copy(), bajo.copy()
+            np.maximum(alto[:-paso], altos[-1][paso:], out=alto[:-paso])
+            np.minimum(bajo[:-paso], bajos[-1][paso:], out=bajo[:-paso])
+            alto[-paso:], bajo[-paso:] = np.inf, -np.inf
+            altos.append(alto)
+            bajos.append(bajo)
+        
+        siguiente = np.arange(1, n + 1)
+        alto, bajo = precios.copy(), precios.copy()
+        for j in range(len(altos) - 1, -1, -1):
+            nuevo_alto = np.maximum(altos[j][siguiente], alto)
+            nuevo_bajo = np.minimum(bajos[j][siguiente], bajo)
+            acepta = (nuevo_alto - nuevo_bajo) < self.umbral
+            np.copyto(alto, nuevo_alto, where=acepta)
+            np.copyto(bajo, nuevo_bajo, where=acepta)
+            siguiente += acepta * (1 << j)
+        # El tick `siguiente` es el que cierra la barra, si existe y alcanza el umbral
+        cierra = (siguiente < n) & ((np.maximum(alto, altos[0][siguiente])
+                                     - np.minimum(bajo, bajos[0][siguiente])) >= self.umbral)
+        return np.where(cierra, siguiente + 1 + desplazamiento, 0).tolist()
+    
+    def _cortes_renko(self, precios):
+        """
+        Cortes y niveles (apertura, cierre) de las barras renko. Solo puede
+        cerrar una barra un tick que cambia de celda en la grilla, así que
+        el estado se sigue en Python sobre esos ticks, no sobre todos.
+        """
+        import numpy as np
+        
+        if self._base is None:
+            self._base = np.floor(precios[0] / self.umbral) * self.umbral
+        # Redondeo: un precio justo en la grilla no debe caer un ladrillo abajo por error de coma flotante
+        posicion = np.round((precios - self._base) / self.umbral, 9)
+        pisos, techos = np.floor(posicion).astype('int64'), np.ceil(posicion).astype('int64')
+        cambios = np.flatnonzero((pisos[1:] != pisos[:-1]) | (techos[1:] != techos[:-1])) + 1
+        candidatos = np.r_[0, cambios]
+        
+        cortes, niveles = [], []
+        ladrillo, direccion = self._ladrillo, self._direccion
+        for i, piso, techo in zip(candidatos.tolist(), pisos[candidatos].tolist(), techos[candidatos].tolist()):
+            if piso >= ladrillo + (2 if direccion < 0 else 1):
+                apertura = ladrillo + 1 if direccion < 0 else ladrillo
+                ladrillo, direccion = piso, 1
+            elif techo <= ladrillo - (2 if direccion > 0 else 1):
+                apertura = ladrillo - 1 if direccion > 0 else ladrillo
+                ladrillo, direccion = techo, -1
+            else:
+                continue
+            cortes.append(i + 1)
+            niveles.append((apertura, ladrillo))
+        self._ladrillo, self._direccion = ladrillo, direccion
+        niveles = self._base + np.array(niveles, dtype='float64').reshape(-1, 2) * self.umbral
+        return np.array(cortes, dtype='int64'), niveles
+    
+    def _barras(self, tiempos, precios, volumenes, cortes, niveles=None):
+        """OHLC, volumen, valor y número de ticks de cada barra delimitada por `cortes`"""
+        import numpy as np
+        import pandas as pd
+        
+        if not len(cortes):
+            columnas = ['open', 'high', 'low', 'close', 'volume', 'valor', 'ticks', 'cierre']
+            return pd.DataFrame(columns=columnas, index=pd.DatetimeIndex([], tz='UTC', name='timestamp'))
+        
+        fin = int(cortes[-1])
+        inicios = np.r_[0, cortes[:-1]]
+        precios, volumenes = precios[:fin], volumenes[:fin]
+        df = pd.DataFrame({
+            'open': precios[inicios],
+            'high': np.maximum.reduceat(precios, inicios),
+            'low': np.minimum.reduceat(precios, inicios),
+            'close': precios[cortes - 1],
+            'volume': np.add.reduceat(volumenes, inicios),
+            'valor': np.add.reduceat(precios * volumenes, inicios),
+            'ticks': np.diff(np.r_[0, cortes]),
+            'cierre': pd.to_datetime(tiempos[cortes - 1], unit='ns', utc=True),
+        }, index=pd.DatetimeIndex(pd.to_datetime(tiempos[inicios], unit='ns', utc=True), name='timestamp'))
+        
+        if niveles is not None:
+            # Renko: apertura y cierre son los niveles de ladrillo (con signo)
+            df['open'], df['close'] = niveles[:, 0], niveles[:, 1]
+            df['ladrillos'] = np.rint((niveles[:, 1] - niveles[:, 0]) / self.umbral).astype('int64')
+        self.barras += len(df)
+        return df
+
+
+def construir_barras(fuentes, tipo, umbral, precio='mid', filas_por_bloque=1_000_000, incluir_ultima=False):
+    """Barras alternativas de uno o varios archivos de ticks leídos en streaming"""
+    import pandas as pd
+    
+    constructor = ConstructorBarras(tipo, umbral, precio)
+    partes = [constructor.agregar(bloque) for bloque in iterar_ticks(fuentes, filas_por_bloque)]
+    if incluir_ultima:
+        partes.append(constructor.cerrar())
+    partes = [p for p in partes if len(p)]
+    return pd.concat(partes) if partes else constructor.cerrar().iloc[:0]
+
+
+# Majors contra el dólar desde los que se sintetizan los cruces
+MAJORS_USD = ('EURUSD', 'GBPUSD', 'AUDUSD', 'NZDUSD', 'USDJPY', 'USDCHF', 'USDCAD')
+
+
+def patas_cruce(cruce):
+    """
+    [(major, invertido), (major, invertido)] de la moneda base y la cotizada
+    de un cruce (EURJPY -> EURUSD y USDJPY invertido), o None si no se puede
+    sintetizar desde los majors.
+    """
+    cruce = cruce.upper()
+    base, cotizada = cruce[:3], cruce[3:]
+    if len(cruce) != 6 or 'USD' in (base, cotizada) or base == cotizada:
+        return None
+    patas = []
+    for moneda in (base, cotizada):
+        if f"{moneda}USD" in MAJORS_USD:
+            patas.append((f"{moneda}USD", False))
+        elif f"USD{moneda}" in MAJORS_USD:
+            patas.append((f"USD{moneda}", True))
+        else:
+            return None
+    return patas
+
+
+def _dolares_por_unidad(df, invertido, columnas):
+    """Precio en USD de una unidad de la moneda no-USD de un major (bid/ask u OHLC)"""
+    valores = {c: df[c].to_numpy(dtype='float64') for c in columnas}
+    if not invertido:
+        return valores
+    # 1/x invierte el orden: el bid sale del ask y el máximo del mínimo
+    espejo = {'bid': 'ask', 'ask': 'bid', 'high': 'low', 'low': 'high', 'open': 'open', 'close': 'close'}
+    return {c: 1.0 / valores[espejo[c]] for c in columnas}
+
+
+def sintetizar_cruce(cruce, patas, tolerancia=None):
+    """
+    Cruce sintético desde los dos majors USD (dict par -> DataFrame normalizado,
+    ticks con bid/ask o velas OHLC). Las series se alinean por asof sobre la
+    unión de sus timestamps: cada instante usa el último dato de cada pata
+    (descartando los que tengan más de `tolerancia` de antigüedad). Con ticks
+    el bid/ask es exacto; con velas open/close son exactos y high/low se
+    estiman con los extremos de ambas patas, por eso conviene sintetizar
+    desde ticks o M1 y agregar después.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    legs = patas_cruce(cruce)
+    if legs is None:
+        raise ValueError(f"{cruce} no se puede sintetizar desde {', '.join(MAJORS_USD)}")
+    (par_base, inv_base), (par_cotizada, inv_cotizada) = legs
+    df_base, df_cotizada = patas[par_base], patas[par_cotizada]
+    ticks = {'bid', 'ask'} <= set(df_base.columns) & set(df_cotizada.columns)
+    columnas = ('bid', 'ask') if ticks else ('open', 'high', 'low', 'close')
+    
+    t_base, t_cotizada = _tiempos_ns(df_base.index), _tiempos_ns(df_cotizada.index)
+    if not len(t_base) or not len(t_cotizada):
+        return pd.DataFrame(columns=list(columnas), index=pd.DatetimeIndex([], tz='UTC', name='timestamp'))
+    # Unión ordenada: mergesort aprovecha que cada pata ya viene ordenada
+    tiempos = np.concatenate([t_base, t_cotizada])
+    tiempos.sort(kind='mergesort')
+    tiempos = tiempos[np.r_[True, tiempos[1:] != tiempos[:-1]]]
+    tiempos = tiempos[tiempos >= max(t_base[0], t_cotizada[0])]
+    
+    alineadas = []
+    validas = np.ones(len(tiempos), dtype=bool)
+    for df, t_pata, invertido in ((df_base, t_base, inv_base), (df_cotizada, t_cotizada, inv_cotizada)):
+        posicion = np.searchsorted(t_pata, tiempos, side='right') - 1
+        if tolerancia is not None:
+            validas &= (tiempos - t_pata[posicion]) <= pd.Timedelta(tolerancia).value
+        valores = _dolares_por_unidad(df, invertido, columnas)
+        if ticks:
+            alineadas.append({c: v[posicion] for c, v in valores.items()})
+        else:
+            # Una vela que no existe en esta pata queda plana en su último cierre
+            exacta = t_pata[posicion] == tiempos
+            cierre = valores['close'][posicion]
+            alineadas.append({c: np.where(exacta, v[posicion], cierre) for c, v in valores.items()})
+    
+    a, b = alineadas
+    if ticks:
+        datos = {'bid': a['bid'] / b['ask'], 'ask': a['ask'] / b['bid']}
+    else:
+        apertura, cierre = a['open'] / b['open'], a['close'] / b['close']
+        extremos = np.vstack([apertura, cierre, a['high'] / b['high'], a['low'] / b['low']])
+        datos = {'open': apertura, 'high': extremos.max(axis=0), 'low': extremos.min(axis=0), 'close': cierre}
+    
+    indice = pd.DatetimeIndex(pd.to_datetime(tiempos[validas], unit='ns', utc=True), name='timestamp')
+    return pd.DataFrame({c: v[validas] for c, v in datos.items()}, index=indice)
+
+
+def comparar_con_nativo(sintetico, nativo, simbolo, umbral_puntos=5.0):
+    """
+    Diferencia en puntos entre un cruce sintético y el descargado del
+    proveedor (cierre de cada vela o bid de cada tick nativo contra el último
+    sintético). Devuelve (reporte, Serie de diferencias por timestamp nativo).
+    """
+    import numpy as np
+    import pandas as pd
+    
+    columna = 'close' if 'close' in sintetico.columns else 'bid'
+    t_sintetico, t_nativo = _tiempos_ns(sintetico.index), _tiempos_ns(nativo.index)
+    posicion = np.searchsorted(t_sintetico, t_nativo, side='right') - 1
+    validas = posicion >= 0
+    if columna == 'close':
+        validas &= t_sintetico[np.maximum(posicion, 0)] == t_nativo
+    
+    punto = tamano_punto(simbolo)
+    diferencia = (sintetico[columna].to_numpy(dtype='float64')[posicion[validas]]
+                  - nativo[columna].to_numpy(dtype='float64')[validas]) / punto
+    diferencias = pd.Series(diferencia, index=nativo.index[validas], name='diferencia_puntos')
+    absoluta = np.abs(diferencia)
+    marcadas = absoluta > umbral_puntos
+    peores = np.argsort(absoluta)[::-1][:5]
+    reporte = {
+        'simbolo': simbolo,
+        'columna': columna,
+        'comparadas': int(len(diferencia)),
+        'umbral_puntos': umbral_puntos,
+        'diferencia_media_puntos': float(absoluta.mean()) if len(absoluta) else None,
+        'diferencia_p99_puntos': float(np.percentile(absoluta, 99)) if len(absoluta) else None,
+        'diferencia_max_puntos': float(absoluta.max()) if len(absoluta) else None,
+        'marcadas': int(marcadas.sum()),
+        'porcentaje_marcadas': float(marcadas.mean() * 100) if len(absoluta) else 0.0,
+        'peores': [{'timestamp': str(diferencias.index[i]), 'puntos': float(diferencia[i])} for i in peores],
+    }
+    return reporte, diferencias
+
+
+class AcumuladorSpread:
+    """
+    Mid y estadísticas del spread (ask - bid, en unidades de precio) por barra
+    de tiempo a partir de bloques de ticks: OHLC del mid, spread medio, mínimo,
+    máximo y ponderado por tiempo (cada spread pesa lo que duró vigente dentro
+    de la barra). La última barra incompleta pasa al bloque siguiente.
+    """
+    
+    def __init__(self, temporalidad):
+        import pandas as pd
+        
+        frecuencia = FRECUENCIAS_PANDAS.get(temporalidad)
+        if frecuencia is None:
+            raise ValueError(f"Temporalidad sin frecuencia fija para el spread: {temporalidad}")
+        self.temporalidad = temporalidad
+        self.paso = pd.Timedelta(frecuencia).value
+        self._pendiente = None  # (tiempos, ask, bid) de la barra en curso
+    
+    def agregar(self, ticks):
+        """Procesa un bloque de ticks y devuelve las barras que quedaron cerradas"""
+        import numpy as np
+        
+        if not {'ask', 'bid'} <= set(ticks.columns):
+            raise ValueError("Los ticks no tienen columnas ask/bid")
+        arrays = (_tiempos_ns(ticks.index), ticks['ask'].to_numpy(dtype='float64'),
+                  ticks['bid'].to_numpy(dtype='float64'))
+        if self._pendiente is not None:
+            arrays = tuple(np.concatenate([a, b]) for a, b in zip(self._pendiente, arrays))
+        tiempos = arrays[0]
+        if not len(tiempos):
+            return self._barras(*arrays, 0)
+        
+        # Las barras anteriores a la del último tick ya no pueden cambiar
+        ids = tiempos // self.paso
+        cerradas = int(np.searchsorted(ids, ids[-1], side='left'))
+        barras = self._barras(*arrays, cerradas)
+        self._pendiente = tuple(a[cerradas:] for a in arrays)
+        return barras
+    
+    def cerrar(self):
+        """Devuelve la barra en curso y reinicia el estado"""
+        if self._pendiente is None:
+            import numpy as np
+            return self._barras(np.empty(0, dtype='int64'), np.empty(0), np.empty(0), 0)
+        tiempos, ask, bid = self._pendiente
+        self._pendiente = None
+        return self._barras(tiempos, ask, bid, len(tiempos))
+    
+    def _barras(self, tiempos, ask, bid, n):
+        import numpy as np
+        import pandas as pd
+        
+        columnas = ['mid_open', 'mid_high', 'mid_low', 'mid_close', 'spread_medio', 'spread_min',
+                    'spread_max', 'spread_ponderado', 'ticks']
+        if n == 0:
+            return pd.DataFrame(columns=columnas, index=pd.DatetimeIndex([], tz='UTC', name='timestamp'))
+        
+        mid = (ask[:n] + bid[:n]) / 2
+        spread = ask[:n] - bid[:n]
+        ids = tiempos[:n] // self.paso
+        inicios = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        cantidad = np.diff(np.r_[inicios, n])
+        
+        # Vigencia de cada tick: hasta el siguiente tick o el final de su barra
+        fin_barra = (ids + 1) * self.paso
+        siguiente = np.r_[tiempos[1:n], tiempos[n] if n < len(tiempos) else fin_barra[-1]]
+        duracion = (np.minimum(siguiente, fin_barra) - tiempos[:n]).astype('float64')
+        peso_total = np.add.reduceat(duracion, inicios)
+        suma_spread = np.add.reduceat(spread, inicios)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ponderado = np.where(peso_total > 0, np.add.reduceat(spread * duracion, inicios) / peso_total,
+                                 suma_spread / cantidad)
+        
+        return pd.DataFrame({
+            'mid_open': mid[inicios],
+            'mid_high': np.maximum.reduceat(mid, inicios),
+            'mid_low': np.minimum.reduceat(mid, inicios),
+            'mid_close': mid[np.r_[inicios[1:], n] - 1],
+            'spread_medio': suma_spread / cantidad,
+            'spread_min': np.minimum.reduceat(spread, inicios),
+            'spread_max': np.maximum.reduceat(spread, inicios),
+            'spread_ponderado': ponderado,
+            'ticks': cantidad,
+        }, index=pd.DatetimeIndex(pd.to_datetime(ids[inicios] * self.paso, unit='ns', utc=True), name='timestamp'))
+
+
+def series_spread(fuentes, temporalidad, filas_por_bloque=1_000_000):
+    """Serie de mid/spread por barra de uno o varios archivos de ticks leídos en streaming"""
+    import pandas as pd
+    
+    acumulador = AcumuladorSpread(temporalidad)
+    partes = [acumulador.agregar(bloque) for bloque in iterar_ticks(fuentes, filas_por_bloque)]
+    partes.append(acumulador.cerrar())
+    partes = [p for p in partes if len(p)]
+    return pd.concat(partes) if partes else acumulador.cerrar()
+
+
+# Valores por defecto del estimador cuando no hay historial de ejecuciones
+# previas: filas por día de mercado y bytes por fila en CSV estándar.
+DENSIDAD_FILAS_DIA = {
+    'forex': {'tick': 80_000, 'M1': 1440, 'M5': 288, 'M15': 96, 'M30': 48, 'H1': 24, 'H4': 6, 'D1': 1},
+    'indices': {'1m': 390, '5m': 78, '15m': 26, '30m': 13, '1h': 7, '1d': 1, '1wk': 0.2, '1mo': 1 / 21},
+}
+BYTES_POR_FILA = {'forex': {'tick': 48}, 'indices': {}}
+BYTES_POR_FILA_DEFECTO = {'forex': 58, 'indices': 110}
+SEGUNDOS_POR_PETICION = {'forex': 0.08, 'indices': 1.2}
+
+
+def carpeta_usuario():
+    """Carpeta de datos del usuario para historial y cachés compartidas entre ejecuciones"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    carpeta = os.path.join(base, 'descargar_pro')
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+class HistorialRendimiento:
+    """Rendimiento medido en descargas anteriores (promedios móviles por tipo y temporalidad)"""
+    
+    def __init__(self, ruta=None):
+        self.ruta = ruta or os.path.join(carpeta_usuario(), 'historial_rendimiento.json')
+        self.datos = self._cargar()
+    
+    def _cargar(self):
+        import json
+        
+        try:
+            with open(self.ruta, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    def obtener(self, tipo, temporalidad):
+        """Promedios registrados para (tipo, temporalidad) o un dict vacío"""
+        return self.datos.get(f"{tipo}|{temporalidad}", {})
+    
+    def registrar(self, tipo, temporalidad, dias, filas, bytes_disco, segundos, peticiones, peso=0.3):
+        """Incorpora una medición real al promedio móvil exponencial"""
+        if dias <= 0 or filas <= 0 or peticiones <= 0:
+            return
+        muestra = {
+            'filas_por_dia': filas / dias,
+            'bytes_por_fila': bytes_disco / filas,
+            'segundos_por_peticion': segundos / peticiones,
+        }
+        self._actualizar(f"{tipo}|{temporalidad}", muestra, peso)
+    
+    def factor(self, formato, defecto):
+        """Tamaño medido de un formato respecto al CSV estándar (o el valor por defecto)"""
+        return self.datos.get(f"formato|{formato}", {}).get('factor', defecto)
+    
+    def registrar_factor(self, formato, factor, peso=0.3):
+        """Incorpora la proporción medida al convertir un CSV estándar a otro formato"""
+        if factor > 0:
+            self._actualizar(f"formato|{formato}", {'factor': factor}, peso)
+    
+    def _actualizar(self, llave, muestra, peso):
+        import json
+        
+        with _BloqueoArchivo(self.ruta + '.lock'):
+            self.datos = self._cargar()
+            actual = self.datos.get(llave, {})
+            for clave, valor in muestra.items():
+                actual[clave] = valor if clave not in actual else (1 - peso) * actual[clave] + peso * valor
+            actual['muestras'] = actual.get('muestras', 0) + 1
+            self.datos[llave] = actual
+            
+            temporal = self.ruta + '.tmp'
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(self.datos, f, indent=1)
+            os.replace(temporal, self.ruta)
+
+
+def dias_mercado(tipo, fecha_inicio, fecha_fin, simbolo=None):
+    """Días con sesión en [inicio, fin) según el calendario del mercado"""
+    return len(dias_habiles(mercado_de(simbolo or '', tipo), fecha_inicio, fecha_fin))
+
+
+def estimar_descarga(tipo, instrumentos, temporalidad, fecha_inicio, fecha_fin, historial=None,
+                     factor_disco=1.0):
+    """
+    Estima por instrumento peticiones, filas, bytes en disco y segundos de una
+    descarga. Usa el historial de rendimiento si existe y densidades por defecto
+    si no. Devuelve {'instrumentos': [...], 'total': {...}}.
+    """
+    historial = historial if historial is not None else HistorialRendimiento()
+    medido = historial.obtener(tipo, temporalidad)
+    
+    filas_dia = medido.get('filas_por_dia', DENSIDAD_FILAS_DIA[tipo].get(temporalidad, 1))
+    bytes_fila = medido.get('bytes_por_fila',
+                            BYTES_POR_FILA[tipo].get(temporalidad, BYTES_POR_FILA_DEFECTO[tipo]))
+    segundos_peticion = medido.get('segundos_por_peticion', SEGUNDOS_POR_PETICION[tipo])
+    
+    por_instrumento = []
+    for instrumento in instrumentos:
+        rangos = planificar_rangos(tipo, instrumento, fecha_inicio, fecha_fin)
+        dias = dias_mercado(tipo, fecha_inicio, fecha_fin, instrumento)
+        if tipo == 'forex':
+            # Un archivo por hora con mercado abierto
+            peticiones = peticiones_forex(rangos)
+        else:
+            peticiones = 1 if rangos else 0
+        
+        filas = int(dias * filas_dia)
+        por_instrumento.append({
+            'instrumento': instrumento,
+            'peticiones': peticiones,
+            'filas': filas,
+            'bytes': int(filas * bytes_fila * factor_disco),
+            'segundos': peticiones * segundos_peticion,
+            'medido': bool(medido),
+        })
+    
+    total = {clave: sum(e[clave] for e in por_instrumento) for clave in ('peticiones', 'filas', 'bytes', 'segundos')}
+    return {'instrumentos': por_instrumento, 'total': total}
+
+
+def estimar_tareas(tareas, historial=None):
+    """Suma las estimaciones de una lista de tareas de la cola (para el planificador por lotes)"""
+    historial = historial if historial is not None else HistorialRendimiento()
+    total = {'tareas': len(tareas), 'peticiones': 0, 'filas': 0, 'bytes': 0, 'segundos': 0.0}
+    for t in tareas:
+        estimacion = estimar_descarga(t['tipo'], t['simbolo'].split(','), t['temporalidad'],
+                                      datetime.strptime(t['fecha_inicio'], "%Y-%m-%d"),
+                                      datetime.strptime(t['fecha_fin'], "%Y-%m-%d"), historial)
+        for clave in ('peticiones', 'filas', 'bytes', 'segundos'):
+            total[clave] += estimacion['total'][clave]
+    return total
+
+
+def formatear_bytes(n):
+    """Tamaño legible (KB, MB, GB)"""
+    for unidad in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if n < 1024 or unidad == 'TB':
+            return f"{n:.0f} {unidad}" if unidad == 'B' else f"{n:.2f} {unidad}"
+        n /= 1024
+
+
+def formatear_duracion(segundos):
+    """Duración legible (s, min, h)"""
+    if segundos < 60:
+        return f"{segundos:.0f} s"
+    if segundos < 3600:
+        return f"{segundos / 60:.1f} min"
+    return f"{segundos / 3600:.1f} h"
+
+
+
+class ReporteProgreso:
+    """
+    Progreso de una descarga: tareas completadas, bytes/s, filas/s, ETA y
+    workers activos. En terminal dibuja un bloque que se actualiza en el sitio;
+    si la salida no es una terminal imprime una línea cada cierto tiempo.
+    Las llamadas desde el bucle de descarga solo suman contadores.
+    """
+    
+    # True en los procesos worker: el bloque del terminal lo dibuja seguir_cola
+    # y los reportes de cada tarea solo imprimen líneas sueltas
+    solo_lineas = False
+    
+    def __init__(self, total, titulo="Progreso", intervalo=None, salida=None):
+        import threading
+        
+        self.total = total
+        self.titulo = titulo
+        self.salida = salida or sys.stdout
+        self.es_terminal = (not self.solo_lineas and hasattr(self.salida, 'isatty')
+                            and self.salida.isatty())
+        self.intervalo = intervalo or (0.5 if self.es_terminal else 30)
+        
+        self.completadas = 0
+        self.fallidas = 0
+        self.filas = 0
+        self.bytes = 0
+        self.activos = {}  # worker -> (descripcion, inicio)
+        self.inicio = time.time()
+        self._exitos = set()  # workers cuyo elemento actual de recorrer() terminó bien
+        
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._proxy = None
+    
+    # --- Llamadas desde el bucle de descarga ---
+    
+    def comenzar(self, worker, descripcion):
+        with self._lock:
+            self.activos[worker] = (descripcion, time.time())
+    
+    def avanzar(self, filas=0, bytes_=0):
+        with self._lock:
+            self.filas += filas
+            self.bytes += bytes_
+    
+    def terminar(self, worker, exito=True):
+        with self._lock:
+            self.activos.pop(worker, None)
+            if exito:
+                self.completadas += 1
+            else:
+                self.fallidas += 1
+    
+    def marcar_exito(self, worker='principal'):
+        """El elemento actual de recorrer() se descargó bien"""
+        with self._lock:
+            self._exitos.add(worker)
+    
+    def recorrer(self, elementos, worker='principal'):
+        """
+        Itera (idx, elemento) marcando cada elemento como activo hasta pasar al
+        siguiente. Cuenta como completado si el bucle llamó a marcar_exito();
+        si no (continue por error, excepción atrapada...), como fallido.
+        """
+        for idx, elemento in enumerate(elementos, 1):
+            self.comenzar(worker, str(elemento))
+            yield idx, elemento
+            with self._lock:
+                exito = worker in self._exitos
+                self._exitos.discard(worker)
+            self.terminar(worker, exito=exito)
+    
+    def actualizar(self, completadas=None, fallidas=None, filas=None, bytes_=None, activos=None, total=None):
+        """Reemplaza los contadores (usado al seguir una cola desde otro proceso)"""
+        with self._lock:
+            for nombre, valor in (('completadas', completadas), ('fallidas', fallidas),
+                                  ('filas', filas), ('bytes', bytes_), ('activos', activos), ('total', total)):
+                if valor is not None:
+                    setattr(self, nombre, valor)
+    
+    # --- Presentación ---
+    
+    def lineas(self):
+        """Texto del estado actual"""
+        with self._lock:
+            hechas = self.completadas + self.fallidas
+            transcurrido = max(time.time() - self.inicio, 1e-6)
+            activos = list(self.activos.items())
+            filas, bytes_ = self.filas, self.bytes
+        
+        porcentaje = 100 * hechas / self.total if self.total else 100
+        eta = "--"
+        if 0 < hechas < self.total:
+            eta = formatear_duracion(transcurrido / hechas * (self.total - hechas))
+        elif hechas >= self.total:
+            eta = "0 s"
+        
+        lineas = [
+            f"{self.titulo}: {hechas}/{self.total} ({porcentaje:.0f}%)"
+            f"{f', {self.fallidas} fallidas' if self.fallidas else ''} | "
+            f"{formatear_bytes(bytes_ / transcurrido)}/s | {filas / transcurrido:,.0f} filas/s | "
+            f"ETA {eta} | {len(activos)} workers activos"
+        ]
+        ahora = time.time()
+        for worker, (descripcion, desde) in activos[:8]:
+            lineas.append(f"  ▸ {worker}: {descripcion} ({formatear_duracion(ahora - desde)})")
+        if len(activos) > 8:
+            lineas.append(f"  ... y {len(activos) - 8} workers más")
+        return lineas
+    
+    def _dibujar(self):
+        if self.es_terminal:
+            self._proxy.dibujar(self.lineas())
+        else:
+            self.salida.write(f"[{datetime.now().strftime('%H:%M:%S')}] {self.lineas()[0]}\n")
+            self.salida.flush()
+    
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo):
+            self._dibujar()
+    
+    def iniciar(self):
+        import threading
+        
+        if self.es_terminal:
+            self._proxy = _SalidaConProgreso(self.salida)
+            sys.stdout = self._proxy
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+        return self
+    
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        if self._proxy is not None:
+            self._proxy.borrar()
+            sys.stdout = self.salida
+            self._proxy = None
+        self.salida.write(self.lineas()[0] + "\n")
+        self.salida.flush()
+    
+    def __enter__(self):
+        return self.iniciar()
+    
+    def __exit__(self, *exc):
+        self.detener()
+        return False
+
+
+class _SalidaConProgreso:
+    """Envuelve stdout para borrar el bloque de progreso antes de cada print"""
+    
+    def __init__(self, salida):
+        import threading
+        
+        self.salida = salida
+        self._lock = threading.Lock()
+        self._lineas_dibujadas = 0
+    
+    def borrar(self):
+        with self._lock:
+            self._borrar()
+    
+    def _borrar(self):
+        if self._lineas_dibujadas:
+            self.salida.write("\x1b[J")
+            self._lineas_dibujadas = 0
+    
+    def dibujar(self, lineas):
+        with self._lock:
+            self._borrar()
+            ancho = 120
+            self.salida.write("\x1b[J" + "\n".join(l[:ancho] for l in lineas) + "\n")
+            # Volver al inicio del bloque para que el próximo print lo reemplace
+            self.salida.write(f"\x1b[{len(lineas)}F")
+            self.salida.flush()
+            self._lineas_dibujadas = len(lineas)
+    
+    def write(self, texto):
+        with self._lock:
+            self._borrar()
+            return self.salida.write(texto)
+    
+    def flush(self):
+        self.salida.flush()
+    
+    def __getattr__(self, nombre):
+        return getattr(self.salida, nombre)
+
+
+
+class Catalogo:
+    """Índice JSON de las series guardadas en una carpeta (símbolo + temporalidad -> archivo)"""
+    
+    NOMBRE_ARCHIVO = 'catalogo.json'
+    
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self.ruta = os.path.join(carpeta, self.NOMBRE_ARCHIVO)
+        self.series = self._cargar()
+    
+    def _cargar(self):
+        """Lee el catálogo del disco (vacío si todavía no existe)"""
+        import json
+        
+        try:
+            with open(self.ruta, encoding='utf-8') as f:
+                return json.load(f).get('series', {})
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    @staticmethod
+    def clave(simbolo, temporalidad):
+        return f"{simbolo}|{temporalidad}"
+    
+    def obtener(self, simbolo, temporalidad):
+        """Devuelve la entrada de una serie (con 'ruta' absoluta) o None"""
+        entrada = self.series.get(self.clave(simbolo, temporalidad))
+        if entrada is None:
+            return None
+        entrada = dict(entrada)
+        entrada['ruta'] = os.path.join(self.carpeta, entrada['archivo'])
+        return entrada
+    
+    def registrar(self, simbolo, temporalidad, ruta, **datos):
+        """Agrega o actualiza una serie y guarda el catálogo (releyendo cambios de otros procesos)"""
+        import json
+        
+        with _BloqueoArchivo(self.ruta + '.lock'):
+            self.series = self._cargar()
+            entrada = self.series.get(self.clave(simbolo, temporalidad), {})
+            entrada.update(datos)
+            entrada.update({
+                'simbolo': simbolo,
+                'temporalidad': temporalidad,
+                'archivo': os.path.relpath(ruta, self.carpeta),
+                'actualizado': datetime.now().isoformat(timespec='seconds'),
+            })
+            self.series[self.clave(simbolo, temporalidad)] = entrada
+            
+            temporal = self.ruta + '.tmp'
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'series': self.series}, f, ensure_ascii=False, indent=1)
+            os.replace(temporal, self.ruta)
+        return entrada
+
+
+class _BloqueoArchivo:
+    """
+    Lock exclusivo entre procesos con flock (POSIX) o msvcrt (Windows) sobre
+    un archivo. El sistema lo libera si el proceso muere, así que nunca se
+    roba un lock de un proceso vivo. Con espera_maxima, TimeoutError al vencer.
+    """
+    
+    def __init__(self, ruta, espera_maxima=None):
+        self.ruta = ruta
+        self.espera_maxima = espera_maxima
+        self._archivo = None
+    
+    def _intentar(self):
+        """Toma el lock sin bloquear; False si otro proceso lo tiene"""
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._archivo.seek(0)
+                msvcrt.locking(self._archivo.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+    
+    def __enter__(self):
+        self._archivo = open(self.ruta, 'a+b')
+        limite = time.time() + self.espera_maxima if self.espera_maxima is not None else None
+        while not self._intentar():
+            if limite is not None and time.time() > limite:
+                self._archivo.close()
+                self._archivo = None
+                raise TimeoutError(f"No se obtuvo el lock {self.ruta} en {self.espera_maxima}s")
+            time.sleep(0.05)
+        return self
+    
+    def __exit__(self, *exc):
+        # El archivo no se borra: otro proceso puede estar esperando sobre él
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._archivo.seek(0)
+                msvcrt.locking(self._archivo.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._archivo.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._archivo.close()
+            self._archivo = None
+        return False
+
+
+def leer_primer_timestamp(ruta_archivo):
+    """Timestamp (UTC) de la primera fila de un CSV (None si no tiene filas)"""
+    import pandas as pd
+    
+    with open(ruta_archivo, 'rb') as f:
+        f.readline()
+        linea = f.readline()
+    if not linea.strip():
+        return None
+    
+    campo = linea.split(b',', 1)[0].decode('utf-8')
+    esquema = leer_esquema(ruta_archivo)
+    if esquema is not None:
+        return pd.to_datetime(int(campo), unit=esquema['unidad_tiempo'], utc=True)
+    return _a_utc(campo)
+
+
+def leer_ultimo_timestamp(ruta_archivo):
+    """Timestamp (UTC) de la última fila de un CSV leyendo solo el final del archivo"""
+    import pandas as pd
+    
+    with open(ruta_archivo, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        tamano = f.tell()
+        bloque = 4096
+        while True:
+            f.seek(max(0, tamano - bloque))
+            lineas = [l for l in f.read().splitlines() if l.strip()]
+            if len(lineas) >= 2 or bloque >= tamano:
+                break
+            bloque *= 4
+    if len(lineas) < 2:
+        return None
+    
+    campo = lineas[-1].split(b',', 1)[0].decode('utf-8')
+    esquema = leer_esquema(ruta_archivo)
+    if esquema is not None:
+        return pd.to_datetime(int(campo), unit=esquema['unidad_tiempo'], utc=True)
+    return _a_utc(campo)
+
+
+def anexar_csv(df, ruta_archivo, simbolo):
+    """Agrega filas al final de un CSV existente respetando sus columnas y su esquema"""
+    import csv
+    
+    with open(ruta_archivo, newline='', encoding='utf-8') as f:
+        cabecera = next(csv.reader(f))
+    
+    esquema = leer_esquema(ruta_archivo)
+    if esquema is not None:
+        df, _ = compactar_tipos(normalizar_datos(df), simbolo, esquema['precios'], esquema['unidad_tiempo'])
+        df = df.reindex(columns=cabecera)
+        df.to_csv(ruta_archivo, mode='a', header=False, index=False)
+    else:
+        df = df.reindex(columns=cabecera[1:])
+        df.to_csv(ruta_archivo, mode='a', header=False)
+
+
+
+def leer_cola_csv(ruta_archivo, desde):
+    """Filas con timestamp >= desde de un CSV (normal o compacto) leyendo solo la cola del archivo"""
+    import io
+    import pandas as pd
+    
+    esquema = leer_esquema(ruta_archivo)
+    desde = _a_utc(desde)
+    
+    def tiempo(linea):
+        campo = linea.split(b',', 1)[0].decode('utf-8')
+        if esquema is not None:
+            return pd.to_datetime(int(campo), unit=esquema['unidad_tiempo'], utc=True)
+        return _a_utc(campo)
+    
+    with open(ruta_archivo, 'rb') as f:
+        cabecera = f.readline()
+        f.seek(0, os.SEEK_END)
+        tamano = f.tell()
+        bloque = 65536
+        while True:
+            inicio = max(len(cabecera), tamano - bloque)
+            f.seek(inicio)
+            lineas = f.read().split(b'\n')
+            # Salvo desde el comienzo, la primera línea puede ser un fragmento
+            lineas = [l for l in (lineas if inicio == len(cabecera) else lineas[1:]) if l.strip()]
+            if inicio == len(cabecera) or not lineas or tiempo(lineas[0]) < desde:
+                break
+            bloque *= 4
+    
+    df = pd.read_csv(io.BytesIO(cabecera + b'\n'.join(lineas)))
+    df = normalizar_datos(df) if esquema is None else expandir_tipos(df, esquema)
+    return df[df.index >= desde]
+
+
+def barras_distintas(df, guardado, rtol=1e-6):
+    """
+    Máscara de las barras de df que no están en `guardado` o cuyos valores
+    numéricos difieren (con tolerancia para los esquemas compactos float32).
+    """
+    import numpy as np
+    
+    guardado = guardado[~guardado.index.duplicated(keep='last')]
+    posiciones = guardado.index.get_indexer(df.index)
+    distintas = posiciones < 0
+    columnas = [c for c in df.columns if c in guardado.columns
+                and np.issubdtype(df[c].dtype, np.number) and np.issubdtype(guardado[c].dtype, np.number)]
+    if columnas and (~distintas).any():
+        presentes = np.flatnonzero(~distintas)
+        nuevos = df[columnas].to_numpy(dtype='float64')[presentes]
+        viejos = guardado[columnas].to_numpy(dtype='float64')[posiciones[presentes]]
+        iguales = np.isclose(nuevos, viejos, rtol=rtol, atol=0, equal_nan=True).all(axis=1)
+        distintas[presentes] = ~iguales
+    return distintas
+
+
+def recortar_csv_desde(ruta_archivo, desde):
+    """
+    Elimina del final de un CSV las filas con timestamp >= desde leyendo solo
+    la cola del archivo. Devuelve el número de filas eliminadas.
+    """
+    import pandas as pd
+    
+    esquema = leer_esquema(ruta_archivo)
+    desde = _a_utc(desde)
+    
+    def tiempo(linea):
+        campo = linea.split(b',', 1)[0].decode('utf-8')
+        if esquema is not None:
+            return pd.to_datetime(int(campo), unit=esquema['unidad_tiempo'], utc=True)
+        return _a_utc(campo)
+    
+    with open(ruta_archivo, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        tamano = f.tell()
+        bloque = 65536
+        while True:
+            inicio = max(0, tamano - bloque)
+            f.seek(inicio)
+            datos = f.read()
+            lineas, posicion = [], inicio
+            for linea in datos.split(b'\n'):
+                lineas.append((posicion, linea))
+                posicion += len(linea) + 1
+            # La primera línea es la cabecera o un fragmento de una fila
+            lineas = [(p, l) for p, l in lineas[1:] if l.strip()]
+            if inicio == 0 or not lineas or tiempo(lineas[0][1]) < desde:
+                break
+            bloque *= 4
+        
+        eliminar = [p for p, l in lineas if tiempo(l) >= desde]
+        if not eliminar:
+            return 0
+        f.truncate(eliminar[0])
+    return len(eliminar)
+
+
+def huellas_dias(df):
+    """
+    Huella de las barras de cada día UTC de una serie normalizada, por número
+    de día desde epoch: unas pocas entradas por serie en vez de una por barra.
+    """
+    import hashlib
+    import numpy as np
+    import pandas as pd
+    
+    if not len(df):
+        return {}
+    huellas = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    dias = _tiempos_ns(df.index) // 86_400_000_000_000
+    inicios = np.flatnonzero(np.r_[True, dias[1:] != dias[:-1]])
+    finales = np.r_[inicios[1:], len(dias)]
+    return {str(int(dias[a])): hashlib.blake2b(huellas[a:b].tobytes(), digest_size=8).hexdigest()
+            for a, b in zip(inicios, finales)}
+
+
+class RegistroFrescura(Catalogo):
+    """
+    Metadatos de frescura de la ventana reciente de cada serie (validadores
+    HTTP y huella de cada día) para no reescribir lo que no cambió. Se lee
+    una vez por ejecución y los cambios se escriben juntos con guardar().
+    """
+    
+    NOMBRE_ARCHIVO = 'frescura.json'
+    
+    def __init__(self, carpeta):
+        super().__init__(carpeta)
+        self._cambios = {}
+    
+    def actualizar(self, simbolo, temporalidad, **datos):
+        """Reemplaza los metadatos de la serie en memoria (guardar() los escribe)"""
+        entrada = dict(datos, verificado=datetime.now().isoformat(timespec='seconds'))
+        self.series[self.clave(simbolo, temporalidad)] = entrada
+        self._cambios[self.clave(simbolo, temporalidad)] = entrada
+        return entrada
+    
+    def guardar(self):
+        """Escribe los cambios pendientes de una vez, releyendo los de otros procesos"""
+        import json
+        
+        if not self._cambios:
+            return
+        with _BloqueoArchivo(self.ruta + '.lock'):
+            self.series = self._cargar()
+            self.series.update(self._cambios)
+            temporal = self.ruta + '.tmp'
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'series': self.series}, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temporal, self.ruta)
+        self._cambios = {}
+    
+    def obtener(self, simbolo, temporalidad):
+        return dict(self.series.get(self.clave(simbolo, temporalidad), {}))
+
+
+# Respuestas crudas de los proveedores (JSON de Yahoo, .bi5 de Dukascopy)
+# guardadas por contenido para reprocesar sin volver a la red.
+URL_YAHOO_CHART = "https://query2.finance.yahoo.com/v8/finance/chart/{simbolo}"
+URL_DUKASCOPY_BI5 = "https://datafeed.dukascopy.com/datafeed/{par}/{anio:04d}/{mes:02d}/{dia:02d}/{hora:02d}h_ticks.bi5"
+CABECERAS_HTTP = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept-Encoding': 'gzip',
+}
+
+
+class SesionHTTP:
+    """
+    Cliente HTTP mínimo con conexiones keep-alive reutilizables por host,
+    seguro entre hilos, con reintentos y descompresión gzip.
+    """
+    
+    def __init__(self, cabeceras=None, timeout=30, reintentos=3):
+        import threading
+        
+        self.cabeceras = dict(CABECERAS_HTTP, **(cabeceras or {}))
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.bytes_recibidos = 0
+        self.peticiones = 0
+        self._libres = {}
+        self._lock = threading.Lock()
+    
+    def _conexion(self, esquema, host):
+        import http.client
+        
+        with self._lock:
+            libres = self._libres.get((esquema, host))
+            if libres:
+                return libres.pop()
+        clase = http.client.HTTPSConnection if esquema == 'https' else http.client.HTTPConnection
+        return clase(host, timeout=self.timeout)
+    
+    def _devolver(self, esquema, host, conexion):
+        with self._lock:
+            self._libres.setdefault((esquema, host), []).append(conexion)
+    
+    def obtener(self, url, cabeceras=None):
+        """GET de la URL: devuelve (estado, cabeceras en minúsculas, cuerpo)"""
+        import gzip
+        import http.client
+        from urllib.parse import urlsplit
+        
+        partes = urlsplit(url)
+        ruta = partes.path + (f"?{partes.query}" if partes.query else '')
+        cabeceras = dict(self.cabeceras, **(cabeceras or {}))
+        
+        for intento in range(self.reintentos + 1):
+            conexion = self._conexion(partes.scheme, partes.netloc)
+            try:
+                conexion.request('GET', ruta, headers=cabeceras)
+                respuesta = conexion.getresponse()
+                cuerpo = respuesta.read()
+            except (http.client.HTTPException, OSError):
+                # Conexión keep-alive cerrada por el servidor: se abre otra
+                conexion.close()
+                if intento == self.reintentos:
+                    raise
+                time.sleep(0.5 * (intento + 1))
+                continue
+            
+            encabezados = {k.lower(): v for k, v in respuesta.getheaders()}
+            if respuesta.will_close:
+                conexion.close()
+            else:
+                self._devolver(partes.scheme, partes.netloc, conexion)
+            with self._lock:
+                self.peticiones += 1
+                self.bytes_recibidos += len(cuerpo)
+            
+            if respuesta.status in (429, 500, 502, 503, 504) and intento < self.reintentos:
+                time.sleep(2 ** intento)
+                continue
+            if encabezados.get('content-encoding') == 'gzip':
+                cuerpo = gzip.decompress(cuerpo)
+            return respuesta.status, encabezados, cuerpo
+    
+    def cerrar(self):
+        with self._lock:
+            for conexiones in self._libres.values():
+                for conexion in conexiones:
+                    conexion.close()
+            self._libres.clear()
+
+
+class CacheCrudo:
+    """
+    Caché en disco de respuestas crudas direccionada por contenido: cada
+    payload se guarda una vez como objetos/ab/<sha256> y un índice SQLite
+    asocia claves (proveedor/símbolo/ventana) al hash. Si el total supera
+    limite_bytes se eliminan los objetos usados hace más tiempo (LRU).
+    """
+    
+    def __init__(self, carpeta=None, limite_bytes=20 * 1024**3):
+        self.carpeta = carpeta or os.path.join(carpeta_usuario(), 'crudo')
+        self.limite_bytes = limite_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        os.makedirs(os.path.join(self.carpeta, 'objetos'), exist_ok=True)
+        self.ruta_indice = os.path.join(self.carpeta, 'indice.db')
+        
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS objetos (
+                    sha256 TEXT PRIMARY KEY,
+                    tamano INTEGER NOT NULL,
+                    ultimo_acceso REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS claves (
+                    clave TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    guardado REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_objetos_acceso ON objetos (ultimo_acceso)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_claves_sha ON claves (sha256)")
+    
+    def _conectar(self):
+        conn = sqlite3.connect(self.ruta_indice, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _ConexionCola(conn)
+    
+    def _ruta_objeto(self, sha256):
+        return os.path.join(self.carpeta, 'objetos', sha256[:2], sha256)
+    
+    def obtener(self, clave):
+        """Payload guardado para la clave o None"""
+        with self._conectar() as conn:
+            fila = conn.execute("SELECT sha256 FROM claves WHERE clave = ?", (clave,)).fetchone()
+            if fila is not None:
+                try:
+                    with open(self._ruta_objeto(fila['sha256']), 'rb') as f:
+                        datos = f.read()
+                except FileNotFoundError:
+                    conn.execute("DELETE FROM claves WHERE clave = ?", (clave,))
+                else:
+                    conn.execute("UPDATE objetos SET ultimo_acceso = ? WHERE sha256 = ?",
+                                 (time.time(), fila['sha256']))
+                    self.aciertos += 1
+                    return datos
+        self.fallos += 1
+        return None
+    
+    def guardar(self, clave, datos):
+        """Guarda el payload (una sola copia por contenido) y devuelve su hash"""
+        import hashlib
+        
+        sha256 = hashlib.sha256(datos).hexdigest()
+        ruta = self._ruta_objeto(sha256)
+        if not os.path.exists(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            with open(temporal, 'wb') as f:
+                f.write(datos)
+            os.replace(temporal, ruta)
+        
+        ahora = time.time()
+        with self._conectar() as conn:
+            conn.execute("""
+                INSERT INTO objetos (sha256, tamano, ultimo_acceso) VALUES (?, ?, ?)
+                ON CONFLICT(sha256) DO UPDATE SET ultimo_acceso = excluded.ultimo_acceso
+            """, (sha256, len(datos), ahora))
+            conn.execute("INSERT OR REPLACE INTO claves (clave, sha256, guardado) VALUES (?, ?, ?)",
+                         (clave, sha256, ahora))
+            total = conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM objetos").fetchone()[0]
+        if total > self.limite_bytes:
+            self.recortar(total)
+        return sha256
+    
+    def recortar(self, total=None):
+        """Elimina los objetos menos usados hasta quedar bajo el límite"""
+        eliminados = []
+        with self._conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if total is None:
+                total = conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM objetos").fetchone()[0]
+            for fila in conn.execute("SELECT sha256, tamano FROM objetos ORDER BY ultimo_acceso").fetchall():
+                if total <= self.limite_bytes:
+                    break
+                conn.execute("DELETE FROM claves WHERE sha256 = ?", (fila['sha256'],))
+                conn.execute("DELETE FROM objetos WHERE sha256 = ?", (fila['sha256'],))
+                total -= fila['tamano']
+                eliminados.append(fila['sha256'])
+            conn.execute("COMMIT")
+        for sha256 in eliminados:
+            try:
+                os.remove(self._ruta_objeto(sha256))
+            except FileNotFoundError:
+                pass
+        return len(eliminados)
+    
+    def resumen(self):
+        with self._conectar() as conn:
+            objetos, tamano = conn.execute("SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM objetos").fetchone()
+            claves = conn.execute("SELECT COUNT(*) FROM claves").fetchone()[0]
+        return {'claves': claves, 'objetos': objetos, 'bytes': tamano,
+                'aciertos': self.aciertos, 'fallos': self.fallos}
+
+
+def obtener_crudo(url, clave=None, cache=None, sesion=None, guardar=True):
+    """
+    Payload de la URL, desde la caché si la clave ya está guardada. Solo se
+    guardan respuestas 200 y solo si `guardar` (ventanas ya cerradas).
+    """
+    if cache is not None and clave is not None:
+        datos = cache.obtener(clave)
+        if datos is not None:
+            return datos
+    estado, _, datos = (sesion or SesionHTTP()).obtener(url)
+    if estado == 404:
+        return b''
+    if estado != 200:
+        raise ConnectionError(f"HTTP {estado} en {url}")
+    if cache is not None and clave is not None and guardar:
+        cache.guardar(clave, datos)
+    return datos
+
+
+def parsear_yahoo_chart(payload, ajustar=True, acciones=False):
+    """
+    JSON de /v8/finance/chart a DataFrame con el mismo formato que
+    yfinance.history (índice en la zona horaria de la bolsa, Open...Volume).
+    Con acciones=True agrega Dividends y Stock Splits como actions=True.
+    """
+    import json
+    import numpy as np
+    import pandas as pd
+    
+    datos = json.loads(payload)
+    chart = datos.get('chart', {})
+    if chart.get('error'):
+        raise ValueError(chart['error'].get('description') or chart['error'].get('code'))
+    resultado = chart['result'][0]
+    meta = resultado.get('meta', {})
+    tiempos = resultado.get('timestamp') or []
+    
+    zona = meta.get('exchangeTimezoneName') or 'UTC'
+    intervalo = meta.get('dataGranularity', '1d')
+    indice = pd.to_datetime(np.asarray(tiempos, dtype='int64'), unit='s', utc=True).tz_convert(zona)
+    diario = intervalo.endswith(('d', 'wk', 'mo'))
+    if diario:
+        indice = indice.normalize()
+    
+    cotizaciones = (resultado.get('indicators', {}).get('quote') or [{}])[0]
+    # Yahoo devuelve null en las velas sin datos: float64 los convierte en NaN
+    df = pd.DataFrame({
+        nombre.capitalize(): np.asarray(cotizaciones.get(nombre) or [None] * len(tiempos), dtype='float64')
+        for nombre in ('open', 'high', 'low', 'close', 'volume')
+    }, index=pd.DatetimeIndex(indice, name='Date' if diario else 'Datetime'))
+    
+    ajustados = (resultado.get('indicators', {}).get('adjclose') or [{}])[0].get('adjclose')
+    if ajustar and ajustados:
+        cierre_ajustado = np.asarray(ajustados, dtype='float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factor = cierre_ajustado / df['Close'].to_numpy()
+        for columna in ('Open', 'High', 'Low'):
+            df[columna] = df[columna].to_numpy() * factor
+        df['Close'] = cierre_ajustado
+    
+    if acciones:
+        # Cada evento cae en la primera vela que empieza en su fecha o después
+        eventos = resultado.get('events') or {}
+        for columna, tipo, valor in (('Dividends', 'dividends', lambda e: e.get('amount', 0.0)),
+                                     ('Stock Splits', 'splits',
+                                      lambda e: e.get('numerator', 0.0) / (e.get('denominator') or 1.0))):
+            columna_valores = np.zeros(len(df))
+            lista = list((eventos.get(tipo) or {}).values())
+            if lista and len(df):
+                fechas = pd.to_datetime(np.asarray([e['date'] for e in lista], dtype='int64'), unit='s', utc=True)
+                fechas = fechas.tz_convert(zona)
+                if diario:
+                    fechas = fechas.normalize()
+                posiciones = np.minimum(df.index.searchsorted(fechas, side='left'), len(df) - 1)
+                np.add.at(columna_valores, posiciones, [valor(e) for e in lista])
+            df[columna] = columna_valores
+    
+    df = df.dropna(subset=['Open', 'High', 'Low', 'Close'], how='all')
+    return df[~df.index.duplicated(keep='last')]
+
+
+def historial_yahoo(simbolo, fecha_inicio, fecha_fin, intervalo, cache=None, sesion=None, ajustar=True,
+                    frescura=None, acciones=False):
+    """
+    Equivalente a yf.Ticker(simbolo).history() guardando el JSON crudo en la caché.
+    Con `frescura` (dict con url/etag/last_modified de la consulta anterior)
+    se hace una petición condicional si la URL es la misma: devuelve None si
+    el servidor responde 304 y actualiza el dict con los validadores nuevos.
+    """
+    from urllib.parse import quote, urlencode
+    
+    periodo1, periodo2 = int(_a_epoch_ms(fecha_inicio) // 1000), int(_a_epoch_ms(fecha_fin) // 1000)
+    consulta = urlencode({'period1': periodo1, 'period2': periodo2, 'interval': intervalo,
+                          'events': 'div,split', 'includeAdjustedClose': 'true'})
+    url = f"{URL_YAHOO_CHART.format(simbolo=quote(simbolo))}?{consulta}"
+    clave = f"yahoo/{simbolo}/{intervalo}/{periodo1}-{periodo2}"
+    # Las ventanas que incluyen el último día pueden cambiar: no se guardan
+    cerrada = periodo2 <= time.time() - 86_400
+    if frescura is None:
+        return parsear_yahoo_chart(obtener_crudo(url, clave, cache, sesion, guardar=cerrada), ajustar=ajustar,
+                                   acciones=acciones)
+    
+    if cache is not None and cerrada:
+        payload = cache.obtener(clave)
+        if payload is not None:
+            return parsear_yahoo_chart(payload, ajustar=ajustar, acciones=acciones)
+    
+    # Un ETag vale para una URL: si la ventana pedida cambió no se envía
+    cabeceras = {}
+    if frescura.get('url') == url:
+        if frescura.get('etag'):
+            cabeceras['If-None-Match'] = frescura['etag']
+        if frescura.get('last_modified'):
+            cabeceras['If-Modified-Since'] = frescura['last_modified']
+    estado, encabezados, payload = (sesion or SesionHTTP()).obtener(url, cabeceras)
+    if estado == 304:
+        return None
+    if estado != 200:
+        raise ConnectionError(f"HTTP {estado} en {url}")
+    frescura.update(url=url, etag=encabezados.get('etag'), last_modified=encabezados.get('last-modified'))
+    if cache is not None and cerrada:
+        cache.guardar(clave, payload)
+    return parsear_yahoo_chart(payload, ajustar=ajustar, acciones=acciones)
+
+
+# Modos de ajuste al leer series con tabla de acciones corporativas
+MODOS_AJUSTE = ('ninguno', 'splits', 'total')
+
+
+def separar_acciones(df, splits_posteriores=1.0):
+    """
+    Divide un DataFrame de Yahoo con Dividends y Stock Splits (auto_adjust=False)
+    en OHLCV sin ajustar y tabla de acciones (dividendo, split) por fecha ex.
+    Yahoo entrega precios, volúmenes y dividendos ya ajustados por los splits
+    posteriores a cada vela (incluidos los que caen después del rango pedido,
+    `splits_posteriores`); aquí se deshace para guardar lo realmente operado.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    splits = df['Stock Splits'].to_numpy(dtype='float64') if 'Stock Splits' in df.columns else np.zeros(len(df))
+    dividendos = df['Dividends'].to_numpy(dtype='float64') if 'Dividends' in df.columns else np.zeros(len(df))
+    razones = np.where(splits > 0, splits, 1.0)
+    # Producto de los splits con fecha ex estrictamente posterior a cada vela
+    factor = np.r_[np.cumprod(razones[::-1])[::-1][1:], 1.0] * splits_posteriores
+    
+    crudo = df.drop(columns=[c for c in ('Dividends', 'Stock Splits', 'Capital Gains', 'Adj Close')
+                             if c in df.columns])
+    for columna in ('Open', 'High', 'Low', 'Close'):
+        if columna in crudo.columns:
+            crudo[columna] = crudo[columna].to_numpy() * factor
+    if 'Volume' in crudo.columns:
+        crudo['Volume'] = crudo['Volume'].to_numpy() / factor
+    
+    eventos = (splits > 0) | (dividendos > 0)
+    acciones = pd.DataFrame({'dividendo': dividendos[eventos] * factor[eventos], 'split': razones[eventos]},
+                            index=pd.DatetimeIndex(df.index[eventos], name='timestamp'))
+    return crudo, acciones
+
+
+def ruta_acciones(carpeta, simbolo):
+    return os.path.join(carpeta, 'acciones', f"{simbolo.replace('^', '')}.csv")
+
+
+def serie_cruda(entrada):
+    """
+    True si la entrada del catálogo es una serie guardada sin ajustar. La
+    tabla de acciones es por símbolo y no dice nada de cada serie: las
+    entradas sin la marca se guardaron ya ajustadas.
+    """
+    return bool(entrada) and entrada.get('ajuste') == 'crudo'
+
+
+def leer_acciones(carpeta, simbolo):
+    """Tabla de acciones de un símbolo (índice UTC) o None si la serie no tiene"""
+    import pandas as pd
+    
+    ruta = ruta_acciones(carpeta, simbolo)
+    if not os.path.exists(ruta):
+        return None
+    acciones = pd.read_csv(ruta)
+    indice = pd.to_datetime(acciones.pop('timestamp'), utc=True, format='mixed')
+    acciones.index = pd.DatetimeIndex(indice, name='timestamp')
+    return acciones
+
+
+def guardar_acciones(carpeta, simbolo, acciones):
+    """Une las acciones nuevas con las guardadas (la última versión de cada fecha gana)"""
+    import pandas as pd
+    
+    ruta = ruta_acciones(carpeta, simbolo)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    nuevas = normalizar_datos(acciones) if len(acciones) else acciones
+    anteriores = leer_acciones(carpeta, simbolo)
+    if anteriores is not None and len(anteriores):
+        nuevas = pd.concat([anteriores, nuevas]) if len(nuevas) else anteriores
+        nuevas = nuevas[~nuevas.index.duplicated(keep='last')].sort_index()
+    temporal = ruta + '.tmp'
+    nuevas.rename_axis('timestamp').to_csv(temporal)
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def factores_ajuste(df, acciones, modo='total'):
+    """
+    Factores por vela (precio, volumen) para pasar de precios sin ajustar al
+    modo pedido: productos acumulados, desde el final, de los factores de las
+    acciones con fecha ex posterior a cada vela. Los dividendos usan el cierre
+    sin ajustar de la vela anterior a la fecha ex, como el Adj Close de Yahoo.
+    """
+    import numpy as np
+    
+    if modo not in MODOS_AJUSTE:
+        raise ValueError(f"Modo de ajuste desconocido: {modo}")
+    n = len(df)
+    if modo == 'ninguno' or acciones is None or not len(acciones) or not n:
+        return np.ones(n), np.ones(n)
+    
+    acciones = acciones.sort_index()
+    tiempos, fechas_ex = _tiempos_ns(df.index), _tiempos_ns(acciones.index)
+    razones = acciones['split'].to_numpy(dtype='float64')
+    factor_precio = 1.0 / razones
+    if modo == 'total':
+        previas = np.searchsorted(tiempos, fechas_ex, side='left') - 1
+        cierres = df['close'].to_numpy(dtype='float64')[np.maximum(previas, 0)]
+        dividendos = acciones['dividendo'].to_numpy(dtype='float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factor_dividendo = np.where((previas >= 0) & (dividendos > 0) & (cierres > 0),
+                                        1.0 - dividendos / cierres, 1.0)
+        factor_precio = factor_precio * factor_dividendo
+    
+    # Acumulado desde el final: posición k = producto de las acciones k..m-1
+    acumulado_precio = np.r_[np.cumprod(factor_precio[::-1])[::-1], 1.0]
+    acumulado_volumen = np.r_[np.cumprod(razones[::-1])[::-1], 1.0]
+    siguiente = np.searchsorted(fechas_ex, tiempos, side='right')
+    return acumulado_precio[siguiente], acumulado_volumen[siguiente]
+
+
+def ajustar_precios(df, acciones, modo='total'):
+    """Serie sin ajustar (columnas normalizadas) en el modo de ajuste pedido"""
+    if modo == 'ninguno' or acciones is None or not len(acciones):
+        return df
+    factor_precio, factor_volumen = factores_ajuste(df, acciones, modo)
+    df = df.copy()
+    for columna in ('open', 'high', 'low', 'close'):
+        if columna in df.columns:
+            df[columna] = df[columna].to_numpy() * factor_precio
+    if 'volume' in df.columns:
+        df['volume'] = df['volume'].to_numpy() * factor_volumen
+    return df
+
+
+def parsear_bi5(payload, par, hora):
+    """
+    Hora de ticks de Dukascopy (.bi5: LZMA con registros de 20 bytes
+    ms, ask, bid, volumen ask, volumen bid) a DataFrame con índice UTC.
+    """
+    import lzma
+    import numpy as np
+    import pandas as pd
+    
+    registro = np.dtype([('ms', '>u4'), ('ask', '>u4'), ('bid', '>u4'),
+                         ('ask_volume', '>f4'), ('bid_volume', '>f4')])
+    crudo = lzma.decompress(payload) if payload else b''
+    datos = np.frombuffer(crudo, dtype=registro)
+    base_ms = int(_a_epoch_ms(hora))
+    punto = tamano_punto(par)
+    indice = pd.to_datetime(base_ms + datos['ms'].astype('int64'), unit='ms', utc=True)
+    return pd.DataFrame({
+        'ask': datos['ask'] * punto,
+        'bid': datos['bid'] * punto,
+        'ask_volume': datos['ask_volume'].astype('float64'),
+        'bid_volume': datos['bid_volume'].astype('float64'),
+    }, index=pd.DatetimeIndex(indice, name='timestamp'))
+
+
+def ticks_dukascopy(par, fecha_inicio, fecha_fin, cache=None, sesion=None, hilos=8):
+    """
+    Ticks de Dukascopy en [inicio, fin) pidiendo en paralelo solo las horas
+    con mercado abierto; cada .bi5 se guarda crudo en la caché.
+    """
+    import pandas as pd
+    from concurrent.futures import ThreadPoolExecutor
+    
+    sesion = sesion or SesionHTTP()
+    # Las horas recientes pueden estar incompletas: se piden pero no se guardan
+    limite_guardado = (time.time() - 2 * 3600) * 1000
+    horas = [pd.Timestamp(h).to_pydatetime() for h in horas_forex_abiertas(fecha_inicio, fecha_fin)]
+    
+    def descargar_hora(hora):
+        # En la URL de Dukascopy los meses van de 00 a 11
+        url = URL_DUKASCOPY_BI5.format(par=par.upper(), anio=hora.year, mes=hora.month - 1,
+                                       dia=hora.day, hora=hora.hour)
+        clave = f"dukascopy/{par.upper()}/{hora:%Y/%m/%d/%H}"
+        payload = obtener_crudo(url, clave, cache, sesion, guardar=_a_epoch_ms(hora) < limite_guardado)
+        return parsear_bi5(payload, par, hora)
+    
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        partes = [p for p in ejecutor.map(descargar_hora, horas) if len(p)]
+    if not partes:
+        return parsear_bi5(b'', par, fecha_inicio)
+    return pd.concat(partes)
+
+
+def _solo_lectura(df):
+    """Copia única del DataFrame con arrays de solo lectura (sin consolidar bloques)"""
+    import numpy as np
+    import pandas as pd
+    
+    columnas = {}
+    for columna in df.columns:
+        serie = df[columna]
+        if isinstance(serie.dtype, np.dtype) and serie.dtype != object:
+            valores = serie.to_numpy(copy=True)
+            valores.flags.writeable = False
+            columnas[columna] = valores
+        else:
+            columnas[columna] = serie.array
+    return pd.DataFrame(columnas, index=df.index, copy=False)
+
+
+class CacheFrames:
+    """
+    Caché en memoria de DataFrames con límite en bytes y expulsión LRU o LFU.
+    Los frames se guardan de solo lectura y se entregan como vistas (sin copiar
+    datos); las entradas con ttl (día en curso) expiran y se vuelven a leer.
+    """
+    
+    def __init__(self, limite_bytes=512 * 1024**2, politica='lru'):
+        import threading
+        from collections import OrderedDict
+        
+        if politica not in ('lru', 'lfu'):
+            raise ValueError(f"Política de caché inválida: {politica}")
+        self.limite_bytes = limite_bytes
+        self.politica = politica
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.expirados = 0
+        self._entradas = OrderedDict()  # clave -> [df, tamano, expira, usos]
+        # LFU en O(1): claves agrupadas por cantidad de usos, cada grupo en
+        # orden de último acceso, y el mínimo de usos presente
+        self._por_usos = {}
+        self._min_usos = 0
+        self._lock = threading.Lock()
+    
+    def obtener(self, clave):
+        """Vista del frame guardado o None (también si expiró)"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[2] is not None and entrada[2] <= time.monotonic():
+                self._quitar(clave)
+                self.expirados += 1
+                entrada = None
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            if self.politica == 'lfu':
+                self._mover_grupo(clave, entrada[3], entrada[3] + 1)
+            entrada[3] += 1
+            self.aciertos += 1
+            df = entrada[0]
+        # Copia superficial: comparte los arrays y, con copy-on-write, los
+        # cambios del usuario no llegan a la caché
+        return df.copy(deep=False)
+    
+    def guardar(self, clave, df, ttl=None):
+        """Guarda el frame (expira a los ttl segundos si se indica) y devuelve su vista"""
+        df = _solo_lectura(df)
+        tamano = int(df.memory_usage(index=True).sum())
+        expira = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            if tamano <= self.limite_bytes:
+                self._entradas[clave] = [df, tamano, expira, 1]
+                self.bytes += tamano
+                if self.politica == 'lfu':
+                    self._mover_grupo(clave, None, 1)
+                while self.bytes > self.limite_bytes:
+                    self._quitar(self._victima())
+                    self.expulsiones += 1
+        return df.copy(deep=False)
+    
+    def _victima(self):
+        """Clave a expulsar: la menos reciente (LRU) o la menos usada (LFU, empate por antigüedad)"""
+        if self.politica == 'lru':
+            return next(iter(self._entradas))
+        if self._min_usos not in self._por_usos:
+            # Solo pasa si invalidar() o un ttl vaciaron el grupo mínimo
+            self._min_usos = min(self._por_usos)
+        return next(iter(self._por_usos[self._min_usos]))
+    
+    def _mover_grupo(self, clave, desde, hasta):
+        """Pasa la clave del grupo de `desde` usos al de `hasta` (None = fuera de todo grupo)"""
+        from collections import OrderedDict
+        
+        if desde is not None:
+            grupo = self._por_usos[desde]
+            del grupo[clave]
+            if not grupo:
+                del self._por_usos[desde]
+                if self._min_usos == desde and hasta is not None:
+                    self._min_usos = hasta
+        if hasta is not None:
+            self._por_usos.setdefault(hasta, OrderedDict())[clave] = None
+            if hasta < self._min_usos or hasta == 1:
+                self._min_usos = hasta
+    
+    def _quitar(self, clave):
+        entrada = self._entradas.pop(clave)
+        self.bytes -= entrada[1]
+        if self.politica == 'lfu':
+            self._mover_grupo(clave, entrada[3], None)
+    
+    def invalidar(self, filtro=None):
+        """Elimina todas las entradas o las que cumplan filtro(clave)"""
+        with self._lock:
+            for clave in [c for c in self._entradas if filtro is None or filtro(c)]:
+                self._quitar(clave)
+    
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            'entradas': len(self._entradas),
+            'bytes': self.bytes,
+            'limite_bytes': self.limite_bytes,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            'expulsiones': self.expulsiones,
+            'expirados': self.expirados,
+        }
+
+
+def _pyarrow():
+    """Importa pyarrow (dependencia opcional del intercambio Arrow)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        raise ImportError("pyarrow no está instalado (pip install pyarrow)")
+    return pa
+
+
+def carpeta_arrow():
+    """Carpeta de intercambio Arrow: memoria compartida (/dev/shm) si existe, si no la del usuario"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else carpeta_usuario()
+    carpeta = os.path.join(base, 'descargar_pro' if base == '/dev/shm' else 'arrow')
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+def nombre_arrow(simbolo, temporalidad, inicio=None, fin=None):
+    nombre = f"{simbolo.replace('^', '').replace('/', '-')}_{temporalidad}"
+    if inicio is not None or fin is not None:
+        nombre += f"_{inicio or 'inicio'}_to_{fin or 'hoy'}".replace(':', '').replace(' ', 'T')
+    return nombre + '.arrow'
+
+
+def a_arrow(df):
+    """DataFrame con índice de tiempo a pyarrow.Table (timestamp como primera columna)"""
+    pa = _pyarrow()
+    tabla = pa.Table.from_pandas(df, preserve_index=True)
+    nombre = df.index.name
+    if nombre in tabla.column_names:
+        tabla = tabla.select([nombre] + [c for c in tabla.column_names if c != nombre])
+    return tabla
+
+
+def escribir_arrow(datos, ruta):
+    """
+    Guarda un DataFrame o Table como archivo Arrow IPC sin comprimir, de forma
+    atómica (los lectores que ya lo tienen mapeado conservan la versión vieja).
+    """
+    pa = _pyarrow()
+    tabla = datos if isinstance(datos, pa.Table) else a_arrow(datos)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with pa.OSFile(temporal, 'wb') as salida, pa.ipc.new_file(salida, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def mapear_arrow(ruta):
+    """
+    Abre un archivo Arrow IPC con memory map: las columnas apuntan a las
+    páginas del archivo, sin parsear ni copiar (to_pandas() si hace falta).
+    """
+    pa = _pyarrow()
+    with pa.memory_map(ruta, 'r') as fuente:
+        return pa.ipc.open_file(fuente).read_all()
+
+
+class ClienteDatos:
+    """
+    Modo biblioteca: entrega series (índice UTC, o en la zona canónica con que
+    se descargaron, y columnas normalizadas) desde las carpetas de descarga o,
+    si no están guardadas, desde el proveedor, con una CacheFrames delante
+    para las consultas repetidas.
+    
+        cliente = ClienteDatos()
+        df = cliente.obtener('SPY', '1d', '2024-01-01')
+        tabla = cliente.obtener_arrow('EURUSD', 'tick', '2024-01-01')
+    """
+    
+    def __init__(self, carpetas=('datos_indices', 'datos_forex'), cache=None, cache_crudo=None,
+                 sesion=None, ttl_abierto=60):
+        self.carpetas = list(carpetas)
+        self.cache = cache if cache is not None else CacheFrames()
+        self.cache_crudo = cache_crudo
+        self.sesion = sesion or SesionHTTP()
+        self.ttl_abierto = ttl_abierto
+        self._catalogos = {}  # carpeta -> (firma de catalogo.json, Catalogo)
+    
+    def catalogo(self, carpeta):
+        """Catalogo de la carpeta; solo se vuelve a leer cuando cambia catalogo.json"""
+        ruta = os.path.join(carpeta, Catalogo.NOMBRE_ARCHIVO)
+        try:
+            estado = os.stat(ruta)
+            firma = (estado.st_mtime_ns, estado.st_size)
+        except FileNotFoundError:
+            firma = None
+        guardado = self._catalogos.get(carpeta)
+        if guardado is not None and guardado[0] == firma:
+            return guardado[1]
+        catalogo = Catalogo(carpeta)
+        self._catalogos[carpeta] = (firma, catalogo)
+        return catalogo
+    
+    def obtener(self, simbolo, temporalidad, inicio=None, fin=None, columnas=None, ajuste='total'):
+        """
+        Serie de [inicio, fin) de solo lectura; fin=None incluye el día en curso.
+        `ajuste` (ninguno, splits, total) se aplica al leer si la serie tiene
+        tabla de acciones, sin volver a descargar.
+        """
+        clave = (simbolo, temporalidad, str(inicio), str(fin), tuple(columnas) if columnas else None, ajuste)
+        df = self.cache.obtener(clave)
+        if df is not None:
+            return df
+        
+        df = self._cargar(simbolo, temporalidad, inicio, fin, columnas, ajuste)
+        # El día en curso sigue abierto: se relee pasado el ttl
+        abierto = fin is None or _a_utc(fin) > _a_utc(datetime.now().date().isoformat())
+        return self.cache.guardar(clave, df, ttl=self.ttl_abierto if abierto else None)
+    
+    def obtener_arrow(self, simbolo, temporalidad, inicio=None, fin=None, columnas=None, ajuste='total'):
+        """Como obtener() pero como pyarrow.Table"""
+        return a_arrow(self.obtener(simbolo, temporalidad, inicio, fin, columnas, ajuste))
+    
+    def obtener_cola(self, simbolo, temporalidad, desde, ajuste='total'):
+        """
+        Barras desde `desde` leyendo solo la cola del archivo y sin pasar por
+        la caché: para quien ya tiene lo anterior y solo necesita lo anexado.
+        """
+        return self._cargar(simbolo, temporalidad, desde, None, None, ajuste, cola=True)
+    
+    def exportar_arrow(self, simbolo, temporalidad, inicio=None, fin=None, ajuste='total', ruta=None):
+        """
+        Escribe la serie como archivo Arrow IPC (por defecto en memoria
+        compartida) para que otro proceso la mapee con mapear_arrow sin
+        parsear ni copiar. Devuelve la ruta.
+        """
+        ruta = ruta or os.path.join(carpeta_arrow(), nombre_arrow(simbolo, temporalidad, inicio, fin))
+        return escribir_arrow(self.obtener(simbolo, temporalidad, inicio, fin, ajuste=ajuste), ruta)
+    
+    def buscar(self, simbolo, temporalidad):
+        """(carpeta, entrada del catálogo) de la serie guardada o (None, None)"""
+        for carpeta in self.carpetas:
+            entrada = self.catalogo(carpeta).obtener(simbolo, temporalidad)
+            if entrada and os.path.exists(entrada['ruta']):
+                return carpeta, entrada
+        return None, None
+    
+    def _cargar(self, simbolo, temporalidad, inicio, fin, columnas, ajuste='total', cola=False):
+        carpeta, entrada = self.buscar(simbolo, temporalidad)
+        if entrada is not None:
+            acciones = leer_acciones(carpeta, simbolo) if ajuste != 'ninguno' and serie_cruda(entrada) else None
+            # Con `cola` se lee solo desde `inicio`: los factores de esas barras dependen
+            # de acciones posteriores, cuyo cierre previo también está en la cola
+            if entrada.get('particionado'):
+                # El ajuste por dividendos necesita el cierre previo a cada fecha ex
+                if acciones is not None and not cola:
+                    df = leer_particionado(carpeta, entrada.get('fuente'), simbolo, temporalidad)
+                else:
+                    df = leer_particionado(carpeta, entrada.get('fuente'), simbolo, temporalidad, inicio, fin,
+                                           columnas)
+            elif cola and entrada['ruta'].endswith('.csv'):
+                df = leer_cola_csv(entrada['ruta'], inicio)
+            else:
+                df = leer_datos(entrada['ruta'])
+            df = ajustar_precios(df, acciones, ajuste)
+            if entrada.get('zona') in ZONAS_CANONICAS:
+                df.index = df.index.tz_convert(ZONAS_CANONICAS[entrada['zona']][0])
+        else:
+            df = self._descargar(simbolo, temporalidad, inicio, fin)
+        
+        if inicio is not None:
+            df = df[df.index >= _a_utc(inicio)]
+        if fin is not None:
+            df = df[df.index < _a_utc(fin)]
+        if columnas:
+            df = df[[c for c in columnas if c in df.columns]]
+        return df
+    
+    def _descargar(self, simbolo, temporalidad, inicio, fin):
+        """Serie que no está en las carpetas, directo del proveedor (por defecto, último año)"""
+        fin_descarga = _a_utc(fin) if fin is not None else _a_utc(datetime.now()) + timedelta(days=1)
+        inicio_descarga = _a_utc(inicio) if inicio is not None else fin_descarga - timedelta(days=365)
+        inicio_descarga, fin_descarga = (t.tz_convert(None).to_pydatetime() for t in (inicio_descarga, fin_descarga))
+        
+        if temporalidad == 'tick' or temporalidad in ('M1', 'M5', 'M15', 'M30', 'H1', 'H4', 'D1'):
+            ticks = ticks_dukascopy(simbolo, inicio_descarga, fin_descarga, cache=self.cache_crudo, sesion=self.sesion)
+            if temporalidad == 'tick':
+                return ticks
+            return ticks['bid'].resample(FRECUENCIAS_PANDAS[temporalidad], label='left', closed='left').ohlc().dropna()
+        
+        df = historial_yahoo(simbolo, inicio_descarga, fin_descarga, temporalidad,
+                             cache=self.cache_crudo, sesion=self.sesion)
+        return normalizar_datos(df)
+    
+    def estadisticas(self):
+        return self.cache.estadisticas()
+
+
+PUERTO_SERVIDOR = 8787
+FORMATOS_SERVIDOR = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+class ServidorDatos:
+    """
+    Servidor HTTP local sobre un ClienteDatos: los procesos piden rangos por
+    localhost y comparten una sola caché caliente en vez de leer cada uno los
+    archivos.
+    
+        GET /series?simbolo=SPY&temporalidad=1d&desde=2024-01-01&hasta=2024-07-01
+                   &columnas=close,volume&ajuste=total&formato=csv|jsonl|arrow&limite=100000
+        GET /catalogo
+        GET /estadisticas
+    
+    Las respuestas salen por bloques (chunked). Con `limite`, la cabecera
+    X-Siguiente trae el `desde` de la página siguiente.
+    """
+    
+    FILAS_POR_BLOQUE = 50_000
+    
+    def __init__(self, cliente=None, host='127.0.0.1', puerto=PUERTO_SERVIDOR):
+        import threading
+        
+        self.cliente = cliente or ClienteDatos()
+        self.host = host
+        self.puerto = puerto
+        self.consultas = 0
+        self.filas_servidas = 0
+        self._firmas = {}  # (simbolo, temporalidad) -> firma del catálogo de lo que hay en caché
+        self._cargando = {}  # clave -> lock de la carga en curso (se quita al terminar)
+        self._lock = threading.Lock()
+        self._http = None
+    
+    def serie(self, simbolo, temporalidad, inicio=None, fin=None, ajuste='total'):
+        """
+        Serie completa en caché si está en el catálogo (los rangos se recortan
+        como vistas) o solo el rango si hay que descargarla. Lo guardado se
+        invalida cuando cambia la entrada del catálogo, no por ttl.
+        """
+        import threading
+        
+        _, entrada = self.cliente.buscar(simbolo, temporalidad)
+        if entrada is None:
+            return self.cliente.obtener(simbolo, temporalidad, inicio, fin, ajuste=ajuste)
+        
+        clave = ('servidor', simbolo, temporalidad, ajuste)
+        firma = (entrada['ruta'], entrada.get('fin'), entrada.get('filas'), entrada.get('bytes'))
+        with self._lock:
+            if self._firmas.get((simbolo, temporalidad)) != firma:
+                self.cliente.cache.invalidar(lambda c: c[:3] == clave[:3])
+                self._firmas[(simbolo, temporalidad)] = firma
+            # Un solo hilo lee cada serie; los demás esperan y la toman de la caché
+            carga = self._cargando.setdefault(clave, threading.Lock())
+        with carga:
+            df = self.cliente.cache.obtener(clave)
+            if df is None:
+                df = self.cliente._cargar(simbolo, temporalidad, None, None, None, ajuste)
+                df = self.cliente.cache.guardar(clave, df)
+            # Los que ya esperan este lock la encuentran en caché; los que
+            # lleguen después crean otro solo si la caché la descartó
+            with self._lock:
+                if self._cargando.get(clave) is carga:
+                    del self._cargando[clave]
+        return df
+    
+    def consultar(self, simbolo, temporalidad, inicio=None, fin=None, columnas=None, ajuste='total', limite=None):
+        """(vista de [inicio, fin) con a lo sumo ~limite filas, `desde` de la página siguiente o None)"""
+        import numpy as np
+        
+        df = self.serie(simbolo, temporalidad, inicio, fin, ajuste)
+        tiempos = _tiempos_ns(df.index)
+        desde = int(np.searchsorted(tiempos, _a_utc(inicio).value)) if inicio is not None else 0
+        hasta = int(np.searchsorted(tiempos, _a_utc(fin).value)) if fin is not None else len(df)
+        siguiente = None
+        if limite is not None and hasta - desde > limite:
+            # La página corta antes de un instante: los ticks con el mismo
+            # timestamp no se reparten entre dos páginas
+            instante = tiempos[desde + limite]
+            corte = int(np.searchsorted(tiempos, instante))
+            if corte <= desde:
+                corte = int(np.searchsorted(tiempos, instante, 'right'))
+            if corte < hasta:
+                hasta = corte
+                siguiente = df.index[corte].tz_convert('UTC').isoformat()
+        df = df.iloc[desde:hasta]
+        if columnas:
+            df = df[[c for c in columnas if c in df.columns]]
+        return df, siguiente
+    
+    def bloques(self, df, formato):
+        """Cuerpo de la respuesta por bloques de filas, sin armarlo entero en memoria"""
+        import io
+        
+        if formato == 'arrow':
+            pa = _pyarrow()
+            tabla = a_arrow(df)
+            salida = io.BytesIO()
+            escritor = pa.ipc.new_stream(salida, tabla.schema)
+            for lote in tabla.to_batches(max_chunksize=self.FILAS_POR_BLOQUE):
+                escritor.write_batch(lote)
+                yield salida.getvalue()
+                salida.seek(0)
+                salida.truncate()
+            escritor.close()
+            yield salida.getvalue()
+            return
+        
+        for i in range(0, len(df), self.FILAS_POR_BLOQUE):
+            bloque = df.iloc[i:i + self.FILAS_POR_BLOQUE]
+            if formato == 'jsonl':
+                lineas = bloque.reset_index().to_json(orient='records', lines=True, date_format='iso', date_unit='ns')
+                yield (lineas if lineas.endswith('\n') else lineas + '\n').encode('utf-8')
+            else:
+                yield bloque.to_csv(header=i == 0).encode('utf-8')
+        if not len(df) and formato == 'csv':
+            yield df.to_csv().encode('utf-8')
+    
+    def catalogo(self):
+        """Series guardadas en las carpetas del cliente"""
+        series = []
+        for carpeta in self.cliente.carpetas:
+            for entrada in self.cliente.catalogo(carpeta).series.values():
+                series.append(dict(entrada, carpeta=carpeta))
+        return series
+    
+    def estadisticas(self):
+        return dict(self.cliente.estadisticas(), consultas=self.consultas, filas_servidas=self.filas_servidas)
+    
+    def atender(self, peticion):
+        """Responde un GET (peticion es el BaseHTTPRequestHandler)"""
+        from urllib.parse import urlsplit, parse_qs
+        
+        partes = urlsplit(peticion.path)
+        parametros = {k: v[-1] for k, v in parse_qs(partes.query).items()}
+        try:
+            if partes.path == '/catalogo':
+                return self._responder_json(peticion, 200, self.catalogo())
+            if partes.path == '/estadisticas':
+                return self._responder_json(peticion, 200, self.estadisticas())
+            if partes.path != '/series':
+                return self._responder_json(peticion, 404, {'error': f"Ruta desconocida: {partes.path}"})
+            
+            if not parametros.get('simbolo') or not parametros.get('temporalidad'):
+                raise ValueError("Faltan los parámetros simbolo y temporalidad")
+            formato = parametros.get('formato', 'csv')
+            if formato not in FORMATOS_SERVIDOR:
+                raise ValueError(f"Formato inválido: {formato} (usa {', '.join(FORMATOS_SERVIDOR)})")
+            if formato == 'arrow':
+                _pyarrow()
+            ajuste = parametros.get('ajuste', 'total')
+            if ajuste not in MODOS_AJUSTE:
+                raise ValueError(f"Modo de ajuste desconocido: {ajuste}")
+            limite = int(parametros['limite']) if parametros.get('limite') else None
+            if limite is not None and limite <= 0:
+                raise ValueError("El límite debe ser positivo")
+            columnas = [c for c in parametros.get('columnas', '').split(',') if c] or None
+            
+            df, siguiente = self.consultar(parametros['simbolo'].upper(), parametros['temporalidad'],
+                                           parametros.get('desde'), parametros.get('hasta'), columnas, ajuste, limite)
+        except (ValueError, ImportError) as e:
+            return self._responder_json(peticion, 400, {'error': str(e)})
+        except Exception as e:
+            return self._responder_json(peticion, 500, {'error': str(e)})
+        
+        with self._lock:
+            self.consultas += 1
+            self.filas_servidas += len(df)
+        peticion.send_response(200)
+        peticion.send_header('Content-Type', FORMATOS_SERVIDOR[formato])
+        peticion.send_header('Transfer-Encoding', 'chunked')
+        peticion.send_header('X-Filas', str(len(df)))
+        if siguiente:
+            peticion.send_header('X-Siguiente', siguiente)
+        peticion.end_headers()
+        try:
+            for bloque in self.bloques(df, formato):
+                if bloque:
+                    peticion.wfile.write(b'%x\r\n%s\r\n' % (len(bloque), bloque))
+            peticion.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            peticion.close_connection = True
+    
+    @staticmethod
+    def _responder_json(peticion, estado, datos):
+        import json
+        
+        cuerpo = json.dumps(datos, ensure_ascii=False, default=str).encode('utf-8')
+        peticion.send_response(estado)
+        peticion.send_header('Content-Type', 'application/json; charset=utf-8')
+        peticion.send_header('Content-Length', str(len(cuerpo)))
+        peticion.end_headers()
+        peticion.wfile.write(cuerpo)
+    
+    def iniciar(self, bloquear=True):
+        """Escucha en host:puerto (hilo por conexión); con bloquear=False vuelve enseguida"""
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        
+        servidor = self
+        
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                servidor.atender(self)
+            
+            def log_message(self, formato, *args):
+                pass
+        
+        self._http = ThreadingHTTPServer((self.host, self.puerto), Manejador)
+        self._http.daemon_threads = True
+        self.puerto = self._http.server_address[1]
+        print(f"✓ Servidor de datos en http://{self.host}:{self.puerto} "
+              f"(caché {formatear_bytes(self.cliente.cache.limite_bytes)}, {', '.join(self.cliente.carpetas)})")
+        if not bloquear:
+            threading.Thread(target=self._http.serve_forever, daemon=True).start()
+            return self
+        try:
+            self._http.serve_forever()
+        except KeyboardInterrupt:
+            print("\n✓ Servidor detenido")
+        finally:
+            self._http.server_close()
+    
+    def detener(self):
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+
+
+class ClienteRemoto:
+    """
+    Cliente de un ServidorDatos con la interfaz de ClienteDatos.obtener: la
+    serie llega por HTTP (Arrow si pyarrow está instalado, si no CSV),
+    recorriendo las páginas de X-Siguiente.
+    
+        cliente = ClienteRemoto()
+        df = cliente.obtener('EURUSD', 'tick', '2024-01-01', '2024-02-01')
+    """
+    
+    def __init__(self, url=f"http://127.0.0.1:{PUERTO_SERVIDOR}", limite=1_000_000, sesion=None):
+        self.url = url.rstrip('/')
+        self.limite = limite
+        self.sesion = sesion or SesionHTTP(reintentos=1)
+    
+    def _pedir(self, ruta, parametros=None):
+        import json
+        from urllib.parse import urlencode
+        
+        url = f"{self.url}{ruta}" + (f"?{urlencode(parametros)}" if parametros else '')
+        estado, encabezados, cuerpo = self.sesion.obtener(url)
+        if estado != 200:
+            try:
+                mensaje = json.loads(cuerpo).get('error')
+            except ValueError:
+                mensaje = None
+            raise ConnectionError(f"HTTP {estado} en {url}" + (f": {mensaje}" if mensaje else ''))
+        return encabezados, cuerpo
+    
+    def obtener(self, simbolo, temporalidad, inicio=None, fin=None, columnas=None, ajuste='total'):
+        import io
+        import pandas as pd
+        
+        try:
+            pa = _pyarrow()
+        except ImportError:
+            pa = None
+        parametros = {'simbolo': simbolo, 'temporalidad': temporalidad, 'ajuste': ajuste,
+                      'formato': 'arrow' if pa else 'csv'}
+        if fin is not None:
+            parametros['hasta'] = str(fin)
+        if columnas:
+            parametros['columnas'] = ','.join(columnas)
+        if self.limite:
+            parametros['limite'] = self.limite
+        
+        paginas = []
+        desde = inicio
+        while True:
+            if desde is not None:
+                parametros['desde'] = str(desde)
+            encabezados, cuerpo = self._pedir('/series', parametros)
+            if pa:
+                paginas.append(pa.ipc.open_stream(cuerpo).read_all().to_pandas())
+            else:
+                pagina = pd.read_csv(io.BytesIO(cuerpo), index_col=0, float_precision='round_trip')
+                pagina.index = pd.to_datetime(pagina.index, utc=True)
+                paginas.append(pagina)
+            desde = encabezados.get('x-siguiente')
+            if not desde:
+                break
+        return paginas[0] if len(paginas) == 1 else pd.concat(paginas)
+    
+    def catalogo(self):
+        import json
+        return json.loads(self._pedir('/catalogo')[1])
+    
+    def estadisticas(self):
+        import json
+        return json.loads(self._pedir('/estadisticas')[1])
+
+
+# Capa SQL (DuckDB, opcional): cada temporalidad del catálogo queda como una
+# vista con columna simbolo sobre los archivos, que DuckDB lee al consultar
+# solo en las columnas y archivos que la consulta necesita.
+PATRONES_SIMBOLO_SQL = (
+    r'symbol=([^/\\]+)',         # particionado: .../symbol=AAPL/...
+    r'([^/\\]+?)_[^/\\]*$',     # AAPL_1d_2020-01-01_to_2024-01-01.csv
+    r'([^/\\]+?)-[^/\\]*$',     # EURUSD-2024_01_01-2024_02_01.csv (duka)
+)
+TIPOS_SQL_COMPACTO = {'float32': 'FLOAT', 'int32': 'INTEGER', 'uint32': 'UINTEGER', 'texto': 'VARCHAR'}
+
+
+def _duckdb():
+    """Importa duckdb (dependencia opcional de la capa SQL)"""
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("duckdb no está instalado (pip install duckdb)")
+    return duckdb
+
+
+def _literal_sql(valor):
+    return "'" + str(valor).replace("'", "''") + "'"
+
+
+def _identificador_sql(nombre):
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+
+def _columnas_csv(ruta_archivo, muestras=20):
+    """
+    Columnas de un CSV normal como [(nombre normalizado, tipo DuckDB)] leyendo
+    solo la cabecera y unas filas: con los tipos declarados DuckDB no tiene
+    que inspeccionar cada archivo al registrar la vista.
+    """
+    import csv
+    
+    with open(ruta_archivo, newline='', encoding='utf-8') as f:
+        lector = csv.reader(f)
+        cabecera = next(lector, [])
+        filas = [fila for _, fila in zip(range(muestras), lector)]
+    
+    nombres = [c.strip().lower().replace(' ', '_') for c in cabecera]
+    tiempo = next((i for i, c in enumerate(nombres) if c in ('timestamp', 'time', 'datetime', 'date')), 0)
+    columnas = []
+    for i, nombre in enumerate(nombres):
+        valores = [fila[i] for fila in filas if i < len(fila) and fila[i] != '']
+        try:
+            [float(v) for v in valores]
+            numerico = True
+        except ValueError:
+            numerico = False
+        if i == tiempo:
+            columnas.append(('timestamp', 'BIGINT' if numerico else 'TIMESTAMPTZ'))
+        else:
+            columnas.append((nombre, 'DOUBLE' if numerico else 'VARCHAR'))
+    return columnas
+
+
+def _expresion_simbolo(archivos, simbolos):
+    """
+    Expresión SQL del símbolo en función de `filename`: un regexp por archivo
+    es barato y DuckDB lo evalúa sobre la lista de archivos antes de leerlos
+    (WHERE simbolo = 'X' abre solo los archivos de X). Los archivos cuyo
+    nombre no da el símbolo van como excepciones.
+    """
+    import re
+    
+    mejor = None
+    for patron in PATRONES_SIMBOLO_SQL:
+        excepciones = {}
+        for archivo, simbolo in zip(archivos, simbolos):
+            coincidencia = re.search(patron, archivo)
+            if (coincidencia.group(1) if coincidencia else '') != simbolo:
+                excepciones[archivo] = simbolo
+        if mejor is None or len(excepciones) < len(mejor[1]):
+            mejor = (patron, excepciones)
+    
+    patron, excepciones = mejor
+    expresion = f"regexp_extract(filename, {_literal_sql(patron)}, 1)"
+    if excepciones:
+        casos = ' '.join(f"WHEN {_literal_sql(a)} THEN {_literal_sql(s)}" for a, s in excepciones.items())
+        expresion = f"CASE filename {casos} ELSE {expresion} END"
+    return expresion
+
+
+def _describir_archivo(ruta_archivo):
+    """
+    (formato, columnas, esquema compacto) de un archivo de serie, o None si
+    DuckDB no lo puede leer (.dtk).
+    """
+    if ruta_archivo.endswith('.parquet'):
+        return 'parquet', (), None
+    if not ruta_archivo.endswith('.csv'):
+        return None
+    esquema = leer_esquema(ruta_archivo)
+    if esquema is None:
+        return 'csv', tuple(_columnas_csv(ruta_archivo)), None
+    columnas = [('timestamp', 'BIGINT')] + [(c, TIPOS_SQL_COMPACTO.get(t, 'DOUBLE'))
+                                            for c, t in esquema['columnas'].items()]
+    return 'compacto', tuple(columnas), esquema
+
+
+def _sql_grupo(formato, columnas, archivos, simbolos, esquema):
+    """SELECT con columna simbolo sobre un grupo de archivos con el mismo esquema"""
+    lista = '[' + ', '.join(_literal_sql(a) for a in archivos) + ']'
+    simbolo = _expresion_simbolo(archivos, simbolos)
+    if formato == 'parquet':
+        return (f"SELECT {simbolo} AS simbolo, * EXCLUDE (filename) "
+                f"FROM read_parquet({lista}, filename = true, union_by_name = true)")
+    
+    tipos = '{' + ', '.join(f"{_literal_sql(c)}: {_literal_sql(t)}" for c, t in columnas) + '}'
+    fuente = f"read_csv({lista}, header = true, columns = {tipos}, filename = true)"
+    expresiones = [f"{simbolo} AS simbolo"]
+    for nombre, tipo in columnas:
+        columna = _identificador_sql(nombre)
+        if nombre == 'timestamp' and tipo == 'BIGINT':
+            unidad = esquema['unidad_tiempo'] if esquema else 'ms'
+            funcion = 'make_timestamp_ns' if unidad == 'ns' else 'epoch_ms'
+            expresiones.append(f"{funcion}({columna})::TIMESTAMPTZ AS timestamp")
+        elif esquema and nombre in COLUMNAS_PRECIO and esquema['precios'] == 'int32':
+            # Precio entero escalado (los grupos comparten tamaño de punto)
+            expresiones.append(f"{columna} * {float(esquema['punto'])!r} AS {columna}")
+        else:
+            expresiones.append(columna)
+    return f"SELECT {', '.join(expresiones)} FROM {fuente}"
+
+
+def _sql_archivos(archivos, simbolos):
+    """
+    SQL de una vista sobre varios archivos: los agrupa por formato y columnas
+    (una lectura multiarchivo por grupo) y une los grupos por nombre.
+    Devuelve (sql, archivos omitidos).
+    """
+    grupos = {}
+    omitidos = []
+    for archivo, simbolo in zip(archivos, simbolos):
+        descripcion = _describir_archivo(archivo)
+        if descripcion is None:
+            omitidos.append(archivo)
+            continue
+        formato, columnas, esquema = descripcion
+        clave = (formato, columnas, esquema and (esquema['unidad_tiempo'], esquema['precios'], esquema['punto']))
+        grupo = grupos.setdefault(clave, ([], [], esquema))
+        grupo[0].append(archivo)
+        grupo[1].append(simbolo)
+    if not grupos:
+        return None, omitidos
+    partes = [_sql_grupo(formato, columnas, *grupo) for (formato, columnas, _), grupo in grupos.items()]
+    return '\nUNION ALL BY NAME\n'.join(partes), omitidos
+
+
+class CapaSQL:
+    """
+    SQL embebido (DuckDB) sobre las carpetas de descarga. Cada temporalidad
+    del catálogo queda como una vista {carpeta}_{temporalidad} (p. ej.
+    indices_1d, forex_M1, forex_tick) con columna simbolo; DuckDB lee de
+    cada archivo solo las columnas usadas, descarta los archivos de otros
+    símbolos y, en Parquet, los bloques fuera del rango filtrado.
+    
+        sql = CapaSQL()
+        sql.consultar("SELECT simbolo, avg(close) FROM indices_1d WHERE timestamp >= '2024-01-01' GROUP BY 1")
+    
+    Con tablas de acciones, la vista aplica `ajuste` (como ClienteDatos) y
+    {vista}_crudo conserva los precios operados; acciones_{carpeta} tiene
+    los dividendos y splits.
+    """
+    
+    def __init__(self, carpetas=('datos_indices', 'datos_forex'), ajuste='total', base=':memory:'):
+        if ajuste not in MODOS_AJUSTE:
+            raise ValueError(f"Modo de ajuste desconocido: {ajuste}")
+        duckdb = _duckdb()
+        self.carpetas = list(carpetas)
+        self.ajuste = ajuste
+        self.conexion = duckdb.connect(base)
+        self.conexion.execute("SET TimeZone = 'UTC'")
+        self.vistas = {}  # nombre -> {'series': n, 'columnas': [...]}
+        self.omitidos = []
+        self.registrar()
+    
+    @staticmethod
+    def nombre_vista(carpeta, temporalidad):
+        """indices_1d para datos_indices + 1d"""
+        import re
+        
+        prefijo = os.path.basename(os.path.normpath(carpeta))
+        prefijo = prefijo[len('datos_'):] if prefijo.startswith('datos_') else prefijo
+        return re.sub(r'\W', '_', f"{prefijo}_{temporalidad}")
+    
+    def registrar(self):
+        """(Re)crea las vistas desde los catálogos; devuelve {vista: número de series}"""
+        import glob
+        
+        self.vistas, self.omitidos = {}, []
+        for carpeta in self.carpetas:
+            series = {}
+            for entrada in Catalogo(carpeta).series.values():
+                ruta = os.path.abspath(os.path.join(carpeta, entrada['archivo']))
+                if entrada.get('particionado') and os.path.isdir(ruta):
+                    patron = os.path.join(glob.escape(ruta), 'year=*', 'month=*', 'part.*')
+                    archivos = sorted(a for a in glob.glob(patron) if not a.endswith('.json'))
+                elif os.path.exists(ruta):
+                    archivos = [ruta]
+                else:
+                    continue
+                destino = series.setdefault(entrada['temporalidad'], ([], [], set()))
+                destino[0].extend(archivos)
+                destino[1].extend([entrada['simbolo']] * len(archivos))
+                if serie_cruda(entrada):
+                    destino[2].add(entrada['simbolo'])
+            
+            acciones = self._registrar_acciones(carpeta, {s for _, simbolos, _ in series.values() for s in simbolos})
+            for temporalidad, (archivos, simbolos, crudos) in series.items():
+                sql, omitidos = _sql_archivos(archivos, simbolos)
+                self.omitidos += omitidos
+                if sql is None:
+                    continue
+                vista = self.nombre_vista(carpeta, temporalidad)
+                distintos = {s for a, s in zip(archivos, simbolos) if a not in omitidos}
+                columnas = self._crear_vista(vista, sql, len(distintos))
+                # Solo se ajustan las series guardadas sin ajustar; las demás ya lo están
+                if acciones and crudos and self.ajuste != 'ninguno' and 'close' in columnas:
+                    self._crear_vista(vista + '_crudo', sql, len(distintos))
+                    self._crear_vista(vista, self._sql_ajustado(vista + '_crudo', acciones, columnas, crudos),
+                                      len(distintos))
+        return {vista: datos['series'] for vista, datos in self.vistas.items()}
+    
+    def _registrar_acciones(self, carpeta, simbolos):
+        """Vista acciones_{carpeta} con los dividendos y splits por símbolo (None si no hay)"""
+        import glob
+        
+        por_ruta = {os.path.abspath(ruta_acciones(carpeta, s)): s for s in simbolos}
+        patron = os.path.join(glob.escape(carpeta), 'acciones', '*.csv')
+        archivos = sorted(os.path.abspath(a) for a in glob.glob(patron))
+        if not archivos:
+            return None
+        nombres = [por_ruta.get(a, os.path.splitext(os.path.basename(a))[0]) for a in archivos]
+        vista = 'acciones_' + self.nombre_vista(carpeta, '').rstrip('_')
+        self._crear_vista(vista, _sql_archivos(archivos, nombres)[0], len(archivos))
+        return vista
+    
+    def _crear_vista(self, vista, sql, series):
+        """Crea (o reemplaza) la vista y devuelve sus columnas"""
+        self.conexion.execute(f"CREATE OR REPLACE VIEW {_identificador_sql(vista)} AS {sql}")
+        columnas = [fila[0] for fila in self.conexion.execute(f"DESCRIBE {_identificador_sql(vista)}").fetchall()]
+        self.vistas[vista] = {'series': series, 'columnas': columnas}
+        return columnas
+    
+    def _sql_ajustado(self, crudo, acciones, columnas, simbolos):
+        """
+        Vista ajustada con los mismos factores que factores_ajuste: producto,
+        desde el final, de las acciones con fecha ex posterior a cada vela;
+        el dividendo usa el cierre sin ajustar de la vela anterior (ASOF JOIN).
+        Solo se aplican las acciones de `simbolos` (las series sin ajustar).
+        """
+        crudo, acciones = _identificador_sql(crudo), _identificador_sql(acciones)
+        lista = ', '.join("'" + s.replace("'", "''") + "'" for s in sorted(simbolos))
+        factor = "CASE WHEN e.split > 0 THEN 1.0 / e.split ELSE 1.0 END"
+        if self.ajuste == 'total':
+            factor += (" * CASE WHEN e.dividendo > 0 AND e.cierre_previo > 0 "
+                       "THEN 1.0 - e.dividendo / e.cierre_previo ELSE 1.0 END")
+        ventana = "OVER (PARTITION BY e.simbolo ORDER BY e.timestamp DESC ROWS UNBOUNDED PRECEDING)"
+        reemplazos = [f"c.{c} * coalesce(f.f_precio, 1.0) AS {c}" for c in ('open', 'high', 'low', 'close')
+                      if c in columnas]
+        if 'volume' in columnas:
+            reemplazos.append("c.volume * coalesce(f.f_volumen, 1.0) AS volume")
+        return f"""
+            WITH eventos AS (
+                SELECT a.simbolo, a.timestamp, a.dividendo, a.split, p.close AS cierre_previo
+                FROM {acciones} a ASOF LEFT JOIN {crudo} p
+                  ON a.simbolo = p.simbolo AND a.timestamp > p.timestamp
+                WHERE a.simbolo IN ({lista})
+            ), factores AS (
+                SELECT e.simbolo, e.timestamp,
+                       product({factor}) {ventana} AS f_precio,
+                       product(CASE WHEN e.split > 0 THEN e.split ELSE 1.0 END) {ventana} AS f_volumen
+                FROM eventos e
+            )
+            SELECT c.* REPLACE ({', '.join(reemplazos)})
+            FROM {crudo} c ASOF LEFT JOIN factores f
+              ON c.simbolo = f.simbolo AND c.timestamp < f.timestamp
+        """
+    
+    def consultar(self, sql, parametros=None):
+        """Ejecuta una consulta y devuelve un DataFrame"""
+        return self.conexion.execute(sql, parametros or []).df()
+    
+    def cerrar(self):
+        self.conexion.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+def remuestrear_ohlc(df, frecuencia):
+    """Agrupa velas a una frecuencia mayor (open primero, high máx, low mín, close último)"""
+    reglas = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+    reglas = {c: r for c, r in reglas.items() if c in df.columns}
+    return df.resample(frecuencia, label='left', closed='left').agg(reglas).dropna(subset=['close'])
+
+
+def fusionar_con_respaldo(primario, respaldo, temporalidad, zona=None):
+    """
+    Alinea el respaldo de Yahoo al esquema de duka (timestamp UTC, OHLC,
+    volume, fuente) y lo usa solo para los timestamps que faltan en el primario.
+    Con zona (clave de ZONAS_CANONICAS) las velas diarias de ambos lados se
+    comparan por fecha de sesión y el resultado queda a medianoche de esa zona.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    columnas = ['open', 'high', 'low', 'close', 'volume']
+    frecuencia = FRECUENCIAS_PANDAS.get(temporalidad)
+    
+    def fechar(df):
+        df = df.copy(deep=False)
+        if zona:
+            df.index = dia_sesion(df.index, zona).tz_localize(ZONAS_CANONICAS[zona][0])
+        else:
+            # duka fecha a medianoche UTC y Yahoo a medianoche de Londres
+            df.index = (df.index + pd.Timedelta('12h')).floor('D')
+        return df
+    
+    respaldo = respaldo[[c for c in columnas if c in respaldo.columns]]
+    diarias = frecuencia is not None and pd.Timedelta(frecuencia) >= pd.Timedelta('1D')
+    if diarias:
+        respaldo = fechar(respaldo)
+        if primario is not None and not primario.empty:
+            primario = fechar(primario)
+    elif frecuencia is not None:
+        respaldo = remuestrear_ohlc(respaldo, frecuencia)
+    respaldo = respaldo[~respaldo.index.duplicated(keep='last')].reindex(columns=columnas)
+    respaldo['fuente'] = 'yahoo'
+    
+    if primario is None or primario.empty:
+        resultado = respaldo
+    else:
+        primario = primario.reindex(columns=columnas)
+        primario['fuente'] = 'duka'
+        tiempos_primario = _tiempos_ns(primario.index)
+        nuevos = ~np.isin(_tiempos_ns(respaldo.index), tiempos_primario)
+        resultado = pd.concat([primario, respaldo[nuevos]])
+    
+    resultado = resultado.sort_index()
+    resultado.index.name = 'timestamp'
+    return resultado
+
+
+def guardar_reporte_calidad(ruta_archivo, reporte):
+    """Escribe el reporte junto al archivo de datos (archivo.calidad.json)"""
+    import json
+    
+    ruta_reporte = os.path.splitext(ruta_archivo)[0] + '.calidad.json'
+    with open(ruta_reporte, 'w', encoding='utf-8') as f:
+        json.dump(reporte, f, ensure_ascii=False, separators=(',', ':'))
+    return ruta_reporte
+
+
+class ColaTrabajo:
+    """
+    Cola de tareas en SQLite con leases para repartir descargas entre
+    varios procesos o máquinas que compartan el archivo de la cola.
+    """
+    
+    def __init__(self, ruta_cola, max_intentos=3):
+        self.ruta_cola = ruta_cola
+        self.max_intentos = max_intentos
+        
+        carpeta = os.path.dirname(os.path.abspath(ruta_cola))
+        os.makedirs(carpeta, exist_ok=True)
+        
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tareas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    clave TEXT UNIQUE,
+                    tipo TEXT NOT NULL,
+                    simbolo TEXT NOT NULL,
+                    temporalidad TEXT NOT NULL,
+                    fecha_inicio TEXT NOT NULL,
+                    fecha_fin TEXT NOT NULL,
+                    ruta_guardado TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendiente',
+                    worker TEXT,
+                    lease_hasta REAL,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    actualizado REAL,
+                    filas INTEGER NOT NULL DEFAULT 0,
+                    bytes INTEGER NOT NULL DEFAULT 0,
+                    series TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tareas_estado ON tareas (estado, lease_hasta)")
+            # Símbolos cuyas ventanas ya unió algún worker (clave -> cuándo)
+            conn.execute("CREATE TABLE IF NOT EXISTS consolidaciones (clave TEXT PRIMARY KEY, actualizado REAL)")
+            # Colas creadas por versiones anteriores no tienen las métricas ni las series
+            columnas = {fila['name'] for fila in conn.execute("PRAGMA table_info(tareas)")}
+            for columna in ('filas', 'bytes'):
+                if columna not in columnas:
+                    conn.execute(f"ALTER TABLE tareas ADD COLUMN {columna} INTEGER NOT NULL DEFAULT 0")
+            if 'series' not in columnas:
+                conn.execute("ALTER TABLE tareas ADD COLUMN series TEXT")
+    
+    def _conectar(self):
+        """Abre una conexión con autocommit y espera si otro proceso tiene el lock"""
+        conn = sqlite3.connect(self.ruta_cola, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _ConexionCola(conn)
+    
+    @staticmethod
+    def expandir_manifiesto(manifiesto):
+        """
+        Convierte un manifiesto en tareas (simbolo, temporalidad, ventana).
+        "universo" (nombre o lista) se suma a "instrumentos"; con "lote" > 1
+        cada tarea lleva hasta ese número de símbolos separados por comas.
+        """
+        tipo = manifiesto.get('tipo', 'indices')
+        if tipo not in ('forex', 'indices'):
+            raise ValueError(f"Tipo de descarga inválido en el manifiesto: {tipo}")
+        
+        temporalidades = manifiesto.get('temporalidades') or [manifiesto['temporalidad']]
+        fecha_inicio = datetime.strptime(manifiesto['fecha_inicio'], "%Y-%m-%d")
+        if manifiesto.get('fecha_fin'):
+            fecha_fin = datetime.strptime(manifiesto['fecha_fin'], "%Y-%m-%d")
+        else:
+            fecha_fin = datetime.now()
+        if fecha_inicio >= fecha_fin:
+            raise ValueError("La fecha de inicio debe ser anterior a la fecha de fin")
+        
+        ventana = timedelta(days=max(int(manifiesto.get('ventana_dias', (fecha_fin - fecha_inicio).days)), 1))
+        carpeta = 'datos_forex' if tipo == 'forex' else 'datos_indices'
+        ruta_guardado = manifiesto.get('ruta_guardado') or os.path.join(os.getcwd(), carpeta)
+        
+        universos = manifiesto.get('universo') or []
+        entradas = [f"@{u}" for u in ([universos] if isinstance(universos, str) else universos)]
+        if tipo == 'forex':
+            simbolos = list(dict.fromkeys(s.strip().upper() for s in manifiesto.get('instrumentos', [])))
+        else:
+            simbolos = resolver_instrumentos(entradas + list(manifiesto.get('instrumentos', [])))
+        if not simbolos:
+            raise ValueError("El manifiesto no tiene instrumentos ni universo")
+        lote = max(int(manifiesto.get('lote', 1)), 1)
+        
+        # duka incluye el día final y Yahoo no: en Forex las ventanas terminan
+        # el día anterior al inicio de la siguiente para no bajarlo dos veces
+        inclusivo = timedelta(days=1) if tipo == 'forex' else timedelta(0)
+        tareas = []
+        for i in range(0, len(simbolos), lote):
+            simbolo = ','.join(simbolos[i:i + lote])
+            for temporalidad in temporalidades:
+                desde = fecha_inicio
+                while desde < fecha_fin + inclusivo:
+                    hasta = min(desde + ventana - inclusivo, fecha_fin)
+                    tareas.append({
+                        'tipo': tipo,
+                        'simbolo': simbolo,
+                        'temporalidad': temporalidad,
+                        'fecha_inicio': desde.strftime("%Y-%m-%d"),
+                        'fecha_fin': hasta.strftime("%Y-%m-%d"),
+                        'ruta_guardado': ruta_guardado
+                    })
+                    desde = hasta + inclusivo
+        return tareas
+    
+    def encolar(self, tareas):
+        """Agrega tareas a la cola. Las tareas ya existentes se ignoran"""
+        nuevas = 0
+        ahora = time.time()
+        with self._conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for t in tareas:
+                clave = "|".join([t['tipo'], t['simbolo'], t['temporalidad'],
+                                  t['fecha_inicio'], t['fecha_fin'], t['ruta_guardado']])
+                cursor = conn.execute("""
+                    INSERT OR IGNORE INTO tareas
+                        (clave, tipo, simbolo, temporalidad, fecha_inicio, fecha_fin, ruta_guardado, actualizado)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (clave, t['tipo'], t['simbolo'], t['temporalidad'],
+                      t['fecha_inicio'], t['fecha_fin'], t['ruta_guardado'], ahora))
+                nuevas += cursor.rowcount
+            conn.execute("COMMIT")
+        return nuevas
+    
+    def reclamar(self, worker, lease_segundos=600):
+        """
+        Toma la siguiente tarea pendiente (o con lease vencido) para un worker.
+        Devuelve un dict con la tarea o None si no queda trabajo disponible.
+        """
+        ahora = time.time()
+        with self._conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Los leases vencidos sin intentos restantes pasan a fallidos
+            conn.execute("""
+                UPDATE tareas SET estado = 'fallida', error = 'lease vencido', actualizado = ?
+                WHERE estado = 'en_curso' AND lease_hasta < ? AND intentos >= ?
+            """, (ahora, ahora, self.max_intentos))
+            fila = conn.execute("""
+                SELECT * FROM tareas
+                WHERE estado = 'pendiente'
+                   OR (estado = 'en_curso' AND lease_hasta < ?)
+                ORDER BY id LIMIT 1
+            """, (ahora,)).fetchone()
+            if fila is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("""
+                UPDATE tareas
+                SET estado = 'en_curso', worker = ?, lease_hasta = ?,
+                    intentos = intentos + 1, actualizado = ?
+                WHERE id = ?
+            """, (worker, ahora + lease_segundos, ahora, fila['id']))
+            conn.execute("COMMIT")
+        tarea = dict(fila)
+        tarea['intentos'] += 1
+        return tarea
+    
+    def renovar(self, id_tarea, worker, lease_segundos=600):
+        """Extiende el lease de una tarea en curso. Devuelve False si se perdió"""
+        with self._conectar() as conn:
+            cursor = conn.execute("""
+                UPDATE tareas SET lease_hasta = ?
+                WHERE id = ? AND worker = ? AND estado = 'en_curso'
+            """, (time.time() + lease_segundos, id_tarea, worker))
+            return cursor.rowcount == 1
+    
+    def completar(self, id_tarea, worker, filas=0, bytes_=0, series=None):
+        """Marca una tarea como completada con las series que registró en el catálogo"""
+        import json
+        
+        with self._conectar() as conn:
+            conn.execute("""
+                UPDATE tareas SET estado = 'completada', lease_hasta = NULL, error = NULL, actualizado = ?,
+                                  filas = ?, bytes = ?, series = ?
+                WHERE id = ? AND worker = ?
+            """, (time.time(), filas, bytes_, json.dumps(series or [], default=str), id_tarea, worker))
+    
+    def ventanas_terminadas(self, tarea):
+        """
+        Símbolos de la tarea con todas sus ventanas terminadas, como
+        {simbolo: [series registradas por las ventanas completadas]}. Cada
+        conjunto de ventanas se entrega a un solo worker, que es quien las une.
+        """
+        import json
+        
+        listos = {}
+        with self._conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            filas = conn.execute("""
+                SELECT id, simbolo, estado, series FROM tareas
+                WHERE tipo = ? AND temporalidad = ? AND ruta_guardado = ?
+            """, (tarea['tipo'], tarea['temporalidad'], tarea['ruta_guardado'])).fetchall()
+            for simbolo in tarea['simbolo'].split(','):
+                propias = [f for f in filas if simbolo in f['simbolo'].split(',')]
+                if len(propias) < 2 or any(f['estado'] not in ('completada', 'fallida') for f in propias):
+                    continue
+                # Con la última tarea en la clave, ventanas encoladas más tarde se vuelven a unir
+                clave = '|'.join([tarea['tipo'], simbolo, tarea['temporalidad'], tarea['ruta_guardado'],
+                                  str(max(f['id'] for f in propias))])
+                cursor = conn.execute("INSERT OR IGNORE INTO consolidaciones (clave, actualizado) VALUES (?, ?)",
+                                      (clave, time.time()))
+                if cursor.rowcount:
+                    listos[simbolo] = [serie for f in propias if f['estado'] == 'completada'
+                                       for serie in json.loads(f['series'] or '[]') if serie['simbolo'] == simbolo]
+            conn.execute("COMMIT")
+        return listos
+    
+    def fallar(self, id_tarea, worker, error):
+        """Devuelve la tarea a la cola o la marca como fallida si agotó sus intentos"""
+        with self._conectar() as conn:
+            conn.execute("""
+                UPDATE tareas
+                SET estado = CASE WHEN intentos >= ? THEN 'fallida' ELSE 'pendiente' END,
+                    lease_hasta = NULL, error = ?, actualizado = ?
+                WHERE id = ? AND worker = ?
+            """, (self.max_intentos, str(error), time.time(), id_tarea, worker))
+    
+    def progreso(self):
+        """Estado para el reporte de progreso: contadores, métricas y tareas en curso"""
+        with self._conectar() as conn:
+            totales = conn.execute("""
+                SELECT COUNT(*) AS total,
+                       SUM(estado = 'completada') AS completadas,
+                       SUM(estado = 'fallida') AS fallidas,
+                       COALESCE(SUM(filas), 0) AS filas,
+                       COALESCE(SUM(bytes), 0) AS bytes
+                FROM tareas
+            """).fetchone()
+            en_curso = conn.execute("""
+                SELECT worker, simbolo, temporalidad, fecha_inicio, actualizado FROM tareas
+                WHERE estado = 'en_curso' AND lease_hasta >= ?
+            """, (time.time(),)).fetchall()
+        activos = {
+            f['worker']: (f"{f['simbolo']} {f['temporalidad']} desde {f['fecha_inicio']}", f['actualizado'])
+            for f in en_curso
+        }
+        return {
+            'total': totales['total'] or 0,
+            'completadas': totales['completadas'] or 0,
+            'fallidas': totales['fallidas'] or 0,
+            'filas': totales['filas'],
+            'bytes_': totales['bytes'],
+            'activos': activos,
+        }
+    
+    def resumen(self):
+        """Cuenta las tareas por estado"""
+        with self._conectar() as conn:
+            filas = conn.execute("SELECT estado, COUNT(*) AS n FROM tareas GROUP BY estado").fetchall()
+        return {fila['estado']: fila['n'] for fila in filas}
+
+
+class _ConexionCola:
+    """Context manager que cierra la conexión SQLite (y revierte si hubo error)"""
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def __enter__(self):
+        return self.conn
+    
+    def __exit__(self, tipo_error, error, tb):
+        if tipo_error is not None and self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+        self.conn.close()
+        return False
+
+
+def ejecutar_tarea(tarea, compartido=None):
+    """
+    Ejecuta una tarea de la cola con la lógica existente de descargar_*.
+    `compartido` (sesion, cache_crudo) se reutiliza entre tareas del mismo
+    worker para no reabrir conexiones. Devuelve (exito, filas, bytes, series
+    registradas en el catálogo).
+    """
+    downloader = DataDownloader(**(compartido or {}))
+    downloader.tipo_descarga = tarea['tipo']
+    downloader.instrumentos = [tarea['simbolo']]
+    downloader.temporalidad = tarea['temporalidad']
+    downloader.fecha_inicio = datetime.strptime(tarea['fecha_inicio'], "%Y-%m-%d")
+    downloader.fecha_fin = datetime.strptime(tarea['fecha_fin'], "%Y-%m-%d")
+    downloader.ruta_guardado = tarea['ruta_guardado']
+    os.makedirs(downloader.ruta_guardado, exist_ok=True)
+    
+    if downloader.tipo_descarga == 'forex':
+        exitosos = downloader.descargar_forex()
+    else:
+        exitosos = downloader.descargar_indices()
+    return (exitosos == len(downloader.instrumentos), downloader.progreso.filas, downloader.progreso.bytes,
+            list(downloader.registradas.values()))
+
+
+def ejecutar_lote(tarea, compartido=None):
+    """
+    Ejecuta una tarea de uno o varios símbolos, uno por uno con la misma
+    sesión. Devuelve (exito, filas, bytes, fallidos, series): el lote cuenta
+    como exitoso si algún símbolo lo fue.
+    """
+    filas = bytes_ = 0
+    fallidos, series = [], []
+    for simbolo in tarea['simbolo'].split(','):
+        try:
+            exito, f, b, registradas = ejecutar_tarea(dict(tarea, simbolo=simbolo), compartido)
+        except Exception as e:
+            exito, f, b, registradas = False, 0, 0, []
+            print(f"  ✗ Error con {simbolo}: {e}")
+        filas, bytes_ = filas + f, bytes_ + b
+        if exito:
+            series.extend(registradas)
+        else:
+            fallidos.append(simbolo)
+    return len(fallidos) < len(tarea['simbolo'].split(',')), filas, bytes_, fallidos, series
+
+
+def consolidar_ventanas(ruta_guardado, simbolo, series):
+    """
+    Une en un solo archivo por temporalidad las ventanas de un símbolo que
+    bajó la cola (cada tarea escribe su propio {inicio}_to_{fin}) y deja en
+    el catálogo una entrada con el rango completo. Los archivos de las
+    ventanas se borran. Devuelve las rutas unidas.
+    """
+    import pandas as pd
+    
+    catalogo = Catalogo(ruta_guardado)
+    por_temporalidad = {}
+    for serie in series:
+        por_temporalidad.setdefault(serie['temporalidad'], []).append(serie)
+    
+    unidas = []
+    for temporalidad, grupo in por_temporalidad.items():
+        # La entrada actual puede ser una unión anterior de otras ventanas
+        actual = catalogo.obtener(simbolo, temporalidad)
+        if actual is not None:
+            grupo = grupo + [actual]
+        if all(serie.get('particionado') for serie in grupo):
+            # Las ventanas ya escribieron en las mismas particiones: solo falta el catálogo
+            ventanas = [serie for serie in grupo if serie is not actual]
+            datos = {'inicio': min((s['inicio'] for s in grupo if s.get('inicio')), key=_a_utc, default=None),
+                     'fin': max((s['fin'] for s in grupo if s.get('fin')), key=_a_utc, default=None),
+                     'filas': sum(s.get('filas') or 0 for s in ventanas)}
+            catalogo.registrar(simbolo, temporalidad, ventanas[-1]['ruta'],
+                               **dict(_datos_ventana(ventanas[-1]), **datos))
+            continue
+        
+        vistas = {}
+        for serie in grupo:
+            ruta = os.path.abspath(serie['ruta'])
+            if os.path.isfile(ruta) and not serie.get('particionado'):
+                vistas.setdefault(ruta, serie)
+        if len(vistas) < 2:
+            continue
+        partes = sorted(vistas.items(), key=lambda item: (_a_utc(item[1]['inicio']) if item[1].get('inicio')
+                                                          else _a_utc(leer_primer_timestamp(item[0]))))
+        rutas = [ruta for ruta, _ in partes]
+        inicio = partes[0][1].get('inicio') or leer_primer_timestamp(rutas[0])
+        fin = partes[-1][1].get('fin') or leer_ultimo_timestamp(rutas[-1])
+        extension = os.path.splitext(rutas[-1])[1]
+        nombre = (f"{simbolo.replace('^', '')}_{temporalidad}_{_a_utc(inicio):%Y-%m-%d}"
+                  f"_to_{_a_utc(fin):%Y-%m-%d}{extension}")
+        ruta_final = os.path.join(ruta_guardado, nombre)
+        
+        cabeceras = set()
+        if all(r.endswith('.csv') and leer_esquema(r) is None for r in rutas):
+            for ruta in rutas:
+                with open(ruta, 'rb') as f:
+                    cabeceras.add(f.readline())
+        if len(cabeceras) == 1:
+            # CSV del proveedor con la misma cabecera: se concatenan tal cual, sin parsear
+            filas = 0
+            temporal = ruta_final + '.tmp'
+            with open(temporal, 'wb') as salida:
+                salida.write(cabeceras.pop())
+                for ruta in rutas:
+                    with open(ruta, 'rb') as entrada:
+                        entrada.readline()
+                        ultimo = b''
+                        for bloque in iter(lambda: entrada.read(1 << 20), b''):
+                            filas += bloque.count(b'\n')
+                            salida.write(bloque)
+                            ultimo = bloque[-1:]
+                        if ultimo and ultimo != b'\n':
+                            salida.write(b'\n')
+                            filas += 1
+            os.replace(temporal, ruta_final)
+        else:
+            df = pd.concat([leer_datos(ruta) for ruta in rutas])
+            df = df[~df.index.duplicated(keep='last')].sort_index()
+            esquema = leer_esquema(rutas[-1])
+            if extension == '.dtk':
+                escribir_archivo_ticks(df, ruta_final, simbolo)
+            elif extension == '.parquet':
+                df.to_parquet(ruta_final)
+            elif esquema is not None:
+                guardar_compacto(df, ruta_final, simbolo, precios=esquema['precios'],
+                                 unidad_tiempo=esquema['unidad_tiempo'])
+            else:
+                df.to_csv(ruta_final)
+            filas = len(df)
+        
+        for ruta in rutas:
+            if ruta == os.path.abspath(ruta_final):
+                continue
+            base = os.path.splitext(ruta)[0]
+            for archivo in (ruta, base + '.esquema.json', base + '.calidad.json'):
+                if os.path.exists(archivo):
+                    os.remove(archivo)
+        catalogo.registrar(simbolo, temporalidad, ruta_final,
+                           **dict(_datos_ventana(partes[-1][1]), inicio=str(inicio), fin=str(fin), filas=filas,
+                                  bytes=os.path.getsize(ruta_final)))
+        print(f"  🧩 {simbolo} {temporalidad}: {len(rutas)} ventanas unidas en {nombre} ({filas:,} filas)")
+        unidas.append(ruta_final)
+    return unidas
+
+
+def _datos_ventana(serie):
+    """Datos de catálogo de una ventana sin los campos que se recalculan al unir"""
+    return {k: v for k, v in serie.items()
+            if k not in ('ruta', 'archivo', 'simbolo', 'temporalidad', 'actualizado', 'inicio', 'fin', 'filas',
+                         'bytes')}
+
+
+def ejecutar_worker(ruta_cola, worker=None, lease_segundos=600, esperar=False):
+    """Reclama y ejecuta tareas de la cola hasta que no quede trabajo"""
+    import socket
+    import threading
+    
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    cola = ColaTrabajo(ruta_cola)
+    completadas = 0
+    limite_cache = os.environ.get('DESCARGAR_CACHE_CRUDO_GB')
+    compartido = {'sesion': SesionHTTP(),
+                  'cache_crudo': CacheCrudo(limite_bytes=float(limite_cache) * 1024**3) if limite_cache else None}
+    
+    print(f"\n👷 Worker {worker} conectado a {ruta_cola}")
+    
+    while True:
+        tarea = cola.reclamar(worker, lease_segundos)
+        if tarea is None:
+            estado = cola.resumen()
+            if esperar and estado.get('en_curso', 0) > 0:
+                # Otro worker puede morir y liberar su lease
+                time.sleep(min(30, lease_segundos / 4))
+                continue
+            break
+        
+        print(f"\n[{worker}] Tarea #{tarea['id']}: {tarea['simbolo']} {tarea['temporalidad']} "
+              f"{tarea['fecha_inicio']} -> {tarea['fecha_fin']} (intento {tarea['intentos']})")
+        
+        # Renovar el lease mientras la descarga está en marcha
+        detener = threading.Event()
+        
+        def latido():
+            while not detener.wait(lease_segundos / 3):
+                if not cola.renovar(tarea['id'], worker, lease_segundos):
+                    break
+        
+        hilo = threading.Thread(target=latido, daemon=True)
+        hilo.start()
+        filas = bytes_ = 0
+        fallidos, series = [], []
+        try:
+            exito, filas, bytes_, fallidos, series = ejecutar_lote(tarea, compartido)
+        except Exception as e:
+            exito = False
+            print(f"  ✗ Error en la tarea #{tarea['id']}: {e}")
+        finally:
+            detener.set()
+            hilo.join()
+        
+        if exito:
+            cola.completar(tarea['id'], worker, filas, bytes_, series)
+            completadas += 1
+            if fallidos:
+                # Los símbolos que fallaron dentro de un lote se reintentan por separado
+                nuevas = cola.encolar([dict(tarea, simbolo=s) for s in fallidos])
+                print(f"  ↻ {nuevas} símbolos del lote vuelven a la cola por separado: {resumir_lista(fallidos)}")
+        else:
+            cola.fallar(tarea['id'], worker, "descarga sin datos")
+        
+        # Cuando termina la última ventana de un símbolo, sus archivos se unen en una serie
+        try:
+            for simbolo, registradas in cola.ventanas_terminadas(tarea).items():
+                consolidar_ventanas(tarea['ruta_guardado'], simbolo, registradas)
+        except Exception as e:
+            print(f"  ⚠️ No se pudieron unir las ventanas de {tarea['simbolo']}: {e}")
+    
+    print(f"\n✓ Worker {worker} terminado: {completadas} tareas completadas")
+    return completadas
+
+
+def _proceso_worker(ruta_cola, lease_segundos, esperar):
+    """Punto de entrada de cada proceso worker lanzado con multiprocessing"""
+    ReporteProgreso.solo_lineas = True
+    try:
+        ejecutar_worker(ruta_cola, lease_segundos=lease_segundos, esperar=esperar)
+    except KeyboardInterrupt:
+        pass
+
+
+def seguir_cola(ruta_cola, procesos, intervalo=1.0):
+    """Muestra el progreso de la cola mientras los procesos worker siguen vivos"""
+    cola = ColaTrabajo(ruta_cola)
+    base = cola.progreso()
+    # La salida de los workers va al mismo terminal; el reporte se dibuja debajo.
+    # ETA y rendimiento se miden solo sobre lo procesado en esta ejecución.
+    pendientes = base['total'] - base['completadas'] - base['fallidas']
+    progreso = ReporteProgreso(pendientes, "Cola", intervalo=intervalo)
+    
+    with progreso:
+        while True:
+            vivos = any(p.is_alive() for p in procesos)
+            estado = cola.progreso()
+            progreso.actualizar(
+                completadas=estado['completadas'] - base['completadas'],
+                fallidas=estado['fallidas'] - base['fallidas'],
+                filas=estado['filas'] - base['filas'],
+                bytes_=estado['bytes_'] - base['bytes_'],
+                activos=estado['activos'],
+            )
+            if not vivos:
+                break
+            for p in procesos:
+                p.join(timeout=intervalo / len(procesos))
+
+
+def mostrar_estado_cola(ruta_cola):
+    """Imprime el avance de la cola de tareas"""
+    estado = ColaTrabajo(ruta_cola).resumen()
+    total = sum(estado.values())
+    print("\n" + "="*60)
+    print(f"ESTADO DE LA COLA: {ruta_cola}")
+    print("="*60)
+    for nombre in ('pendiente', 'en_curso', 'completada', 'fallida'):
+        print(f"  {nombre:12s} {estado.get(nombre, 0):6d}")
+    print(f"  {'total':12s} {total:6d}")
+    print("="*60)
+
+
+# Sesión regular de cada mercado en hora local (apertura, cierre)
+SESIONES_MERCADO = {
+    'NYSE': ('America/New_York', (9, 30), (16, 0)),
+    'LSE': ('Europe/London', (8, 0), (16, 30)),
+    'XETRA': ('Europe/Berlin', (9, 0), (17, 30)),
+    'TSE': ('Asia/Tokyo', (9, 0), (15, 30)),
+}
+
+
+def proxima_ejecucion(temporalidad, mercado, despues, cada_segundos=None, margen_segundos=5,
+                      margen_cierre_minutos=30):
+    """
+    Próximo momento (Timestamp UTC) en que conviene refrescar una serie:
+    intradía, al cerrar cada barra dentro de la sesión; diaria o mayor,
+    una vez por día hábil después del cierre del mercado.
+    """
+    import pandas as pd
+    
+    despues = _a_utc(despues)
+    if cada_segundos:
+        return despues + pd.Timedelta(seconds=cada_segundos)
+    
+    zona, (h_apertura, m_apertura), (h_cierre, m_cierre) = SESIONES_MERCADO.get(mercado, SESIONES_MERCADO['NYSE'])
+    frecuencia = FRECUENCIAS_PANDAS.get(temporalidad)
+    paso = pd.Timedelta(frecuencia) if frecuencia else pd.Timedelta('1D')
+    margen = pd.Timedelta(seconds=margen_segundos)
+    local = despues.tz_convert(zona)
+    
+    for dias in range(15):
+        dia = (local + pd.Timedelta(days=dias)).normalize()
+        if not dias_habiles(mercado, dia.tz_localize(None).to_pydatetime(),
+                            (dia + pd.Timedelta(days=1)).tz_localize(None).to_pydatetime()).size:
+            continue
+        apertura = dia.replace(hour=h_apertura, minute=m_apertura)
+        cierre = dia.replace(hour=h_cierre, minute=m_cierre)
+        
+        if paso >= pd.Timedelta('1D'):
+            candidato = cierre + pd.Timedelta(minutes=margen_cierre_minutos)
+        else:
+            # Fin de la primera barra de la sesión que cierra después de `despues`
+            barras = max(1, (despues - margen - apertura) // paso + 1)
+            candidato = apertura + barras * paso + margen
+            # Última pasada justo después de la barra del cierre
+            if candidato > cierre + paso + margen:
+                continue
+        if candidato > despues:
+            return candidato.tz_convert('UTC')
+    raise ValueError(f"No se encontró una sesión de {mercado} en los próximos 15 días")
+
+
+class Demonio:
+    """
+    Refresco continuo de universos de Índices/Acciones. Cada grupo de la
+    configuración se despierta según su temporalidad, pide solo la ventana
+    reciente (modo actualizar + frescura) y agrega lo nuevo. La sesión HTTP,
+    la caché cruda y los DataDownloader se mantienen vivos entre ciclos.
+    
+    Configuración (JSON):
+        {"grupos": [
+            {"nombre": "intradia", "instrumentos": ["SPY", "QQQ"], "temporalidad": "1m",
+             "ruta_guardado": "datos_indices"},
+            {"nombre": "cierre", "instrumentos": ["^GSPC"], "temporalidad": "1d",
+             "ruta_guardado": "datos_indices", "fecha_inicio": "2015-01-01"}
+        ], "arrow": true}
+    
+    "arrow" (en la raíz o por grupo; true = memoria compartida, o una carpeta)
+    publica tras cada ciclo las series que cambiaron como {simbolo}_{temporalidad}.arrow.
+    """
+    
+    # Historia inicial cuando la serie aún no existe (límites de Yahoo)
+    DIAS_INICIALES = {'1m': 7, '5m': 59, '15m': 59, '30m': 59, '1h': 700}
+    # Lotes por .arrow antes de compactarlos en uno (cada ciclo agrega uno)
+    LOTES_ARROW = 64
+    
+    def __init__(self, configuracion):
+        limite_cache = float(os.environ.get('DESCARGAR_CACHE_CRUDO_GB') or 5)
+        self.sesion = SesionHTTP()
+        self.cache_crudo = CacheCrudo(limite_bytes=limite_cache * 1024**3)
+        self.detenido = False
+        self.arrow = configuracion.get('arrow')
+        self.grupos = [self._crear_grupo(i, grupo) for i, grupo in enumerate(configuracion['grupos'])]
+    
+    def _crear_grupo(self, numero, grupo):
+        if grupo.get('tipo', 'indices') != 'indices':
+            raise ValueError("El modo demonio solo refresca Índices/Acciones (usa 'EURUSD=X' para Forex)")
+        temporalidad = grupo['temporalidad']
+        if temporalidad not in FRECUENCIAS_PANDAS:
+            raise ValueError(f"Temporalidad inválida en el grupo {numero + 1}: {temporalidad}")
+        
+        downloader = DataDownloader()
+        downloader.tipo_descarga = 'indices'
+        universos = grupo.get('universo') or []
+        downloader.instrumentos = resolver_instrumentos(
+            [f"@{u}" for u in ([universos] if isinstance(universos, str) else universos)]
+            + list(grupo.get('instrumentos', [])))
+        if not downloader.instrumentos:
+            raise ValueError(f"El grupo {numero + 1} no tiene instrumentos ni universo")
+        downloader.temporalidad = temporalidad
+        downloader.ruta_guardado = grupo.get('ruta_guardado', 'datos_indices')
+        downloader.modo_actualizar = True
+        # El demonio siempre usa los clientes propios: la sesión y la caché duran entre ciclos
+        downloader.directo = True
+        downloader.sesion = self.sesion
+        downloader.cache_crudo = self.cache_crudo
+        if grupo.get('fecha_inicio'):
+            downloader.fecha_inicio = datetime.strptime(grupo['fecha_inicio'], "%Y-%m-%d")
+        else:
+            dias = self.DIAS_INICIALES.get(temporalidad, 365)
+            downloader.fecha_inicio = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=dias)
+        os.makedirs(downloader.ruta_guardado, exist_ok=True)
+        
+        arrow = grupo.get('arrow', self.arrow)
+        if arrow:
+            _pyarrow()
+            arrow = carpeta_arrow() if arrow is True else arrow
+            os.makedirs(arrow, exist_ok=True)
+        
+        return {
+            'nombre': grupo.get('nombre') or f"grupo{numero + 1}",
+            'downloader': downloader,
+            'arrow': arrow,
+            'cliente': ClienteDatos([downloader.ruta_guardado], sesion=self.sesion) if arrow else None,
+            'publicados': {},
+            'mercado': mercado_de(downloader.instrumentos[0]),
+            'cada_segundos': grupo.get('cada_segundos'),
+            'proxima': None,
+            'ciclos': 0,
+        }
+    
+    def programar(self, grupo, despues=None):
+        grupo['proxima'] = proxima_ejecucion(grupo['downloader'].temporalidad, grupo['mercado'],
+                                             despues if despues is not None else datetime.now().astimezone(),
+                                             grupo['cada_segundos'])
+    
+    def ejecutar_ciclo(self, grupo):
+        """Refresca todos los instrumentos del grupo y devuelve el tiempo de CPU usado"""
+        downloader = grupo['downloader']
+        # Mañana a medianoche: incluye la sesión en curso
+        downloader.fecha_fin = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        downloader.anexadas.clear()
+        cpu, reloj = time.process_time(), time.perf_counter()
+        exitosos = downloader.descargar_indices()
+        cpu, reloj = time.process_time() - cpu, time.perf_counter() - reloj
+        grupo['ciclos'] += 1
+        print(f"⏱ {grupo['nombre']}: {exitosos}/{len(downloader.instrumentos)} al día en {reloj:.2f}s "
+              f"({cpu * 1000:.0f} ms de CPU, ciclo {grupo['ciclos']})")
+        if grupo['arrow']:
+            self.publicar_arrow(grupo)
+        return cpu
+    
+    def publicar_arrow(self, grupo):
+        """
+        Publica el .arrow de las series cuyo catálogo cambió en el ciclo. Si
+        solo se anexaron barras, lee del archivo nada más que la ventana
+        reescrita y la agrega como un lote nuevo a los ya publicados (mapeados,
+        sin releer ni convertir el resto); si no, la serie se publica completa.
+        """
+        downloader, cliente = grupo['downloader'], grupo['cliente']
+        catalogo = Catalogo(downloader.ruta_guardado)
+        publicados = 0
+        for simbolo in downloader.instrumentos:
+            entrada = catalogo.obtener(simbolo, downloader.temporalidad)
+            if not entrada:
+                continue
+            firma = (entrada.get('fin'), entrada.get('filas'), entrada.get('bytes'))
+            ruta = os.path.join(grupo['arrow'], nombre_arrow(simbolo, downloader.temporalidad))
+            anterior = grupo['publicados'].get(simbolo)
+            if anterior and anterior['firma'] == firma and os.path.exists(ruta):
+                continue
+            try:
+                cliente.cache.invalidar(lambda clave: clave[0] == simbolo)
+                acciones = leer_acciones(downloader.ruta_guardado, simbolo) if serie_cruda(entrada) else None
+                tabla = None
+                desde = downloader.anexadas.get((simbolo, downloader.temporalidad))
+                # Una acción corporativa nueva cambia los factores de toda la historia
+                if (anterior and desde is not None and os.path.exists(ruta)
+                        and _mismas_acciones(anterior['acciones'], acciones)):
+                    tabla = self._anexar_arrow(cliente, simbolo, downloader.temporalidad, desde, ruta)
+                if tabla is None:
+                    tabla = cliente.obtener(simbolo, downloader.temporalidad)
+                escribir_arrow(tabla, ruta)
+                grupo['publicados'][simbolo] = {'firma': firma, 'acciones': acciones}
+                publicados += 1
+            except Exception as e:
+                print(f"  ⚠️ No se pudo publicar {simbolo} en Arrow: {e}")
+        if publicados:
+            print(f"🏹 {publicados} series publicadas en Arrow ({grupo['arrow']})")
+    
+    def _anexar_arrow(self, cliente, simbolo, temporalidad, desde, ruta):
+        """
+        Tabla publicada hasta `desde` más las barras leídas desde ahí, o None
+        si no encajan (otro esquema) y hay que publicar la serie completa.
+        """
+        import numpy as np
+        
+        pa = _pyarrow()
+        publicada = mapear_arrow(ruta)
+        ventana = cliente.obtener_cola(simbolo, temporalidad, desde)
+        try:
+            ventana = a_arrow(ventana).cast(publicada.schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError):
+            return None
+        # Las barras desde `desde` pudieron corregirse: se reemplazan con la ventana
+        limite = np.datetime64(desde.tz_convert(None))
+        conservadas = int(np.searchsorted(publicada.column(0).to_numpy(), limite, side='left'))
+        tabla = pa.concat_tables([publicada.slice(0, conservadas), ventana])
+        if tabla.column(0).num_chunks > self.LOTES_ARROW:
+            tabla = tabla.combine_chunks()
+        return tabla
+    
+    def ejecutar(self, ciclos=None, inmediato=True):
+        """Bucle principal: duerme hasta el próximo grupo pendiente y lo refresca"""
+        import signal
+        
+        try:
+            signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'detenido', True))
+        except ValueError:
+            pass  # fuera del hilo principal
+        
+        for grupo in self.grupos:
+            if inmediato:
+                grupo['proxima'] = _a_utc(datetime.now().astimezone())
+            else:
+                self.programar(grupo)
+        
+        realizados = 0
+        while not self.detenido and (ciclos is None or realizados < ciclos):
+            grupo = min(self.grupos, key=lambda g: g['proxima'])
+            espera = (grupo['proxima'] - _a_utc(datetime.now().astimezone())).total_seconds()
+            if espera > 0:
+                print(f"💤 Próximo: {grupo['nombre']} a las "
+                      f"{grupo['proxima'].tz_convert(None):%Y-%m-%d %H:%M:%S} UTC")
+                # Dormir en tramos cortos para atender SIGTERM
+                limite = time.monotonic() + espera
+                while not self.detenido and time.monotonic() < limite:
+                    time.sleep(min(1.0, limite - time.monotonic()))
+                if self.detenido:
+                    break
+            
+            try:
+                self.ejecutar_ciclo(grupo)
+            except Exception as e:
+                print(f"✗ Error en el ciclo de {grupo['nombre']}: {e}")
+            self.programar(grupo)
+            realizados += 1
+        
+        self.sesion.cerrar()
+        print("✓ Demonio detenido")
+
+
+def _mismas_acciones(anteriores, acciones):
+    """True si la tabla de acciones no cambió desde la última publicación"""
+    if anteriores is None or acciones is None:
+        return anteriores is None and acciones is None
+    return anteriores.equals(acciones)
+
+
+def ejecutar_demonio(ruta_configuracion, ciclos=None):
+    """Punto de entrada del modo demonio (junto a main)"""
+    import json
+    
+    with open(ruta_configuracion, encoding='utf-8') as f:
+        configuracion = json.load(f)
+    Demonio(configuracion).ejecutar(ciclos=ciclos)
+
+
+# Instalación sin red: un wheelhouse (carpeta de wheels + get-pip.py) se
+# construye una vez con conexión y se copia a los workers aislados.
+DUKA_ZIP_URL = "https://github.com/giuse88/duka/archive/refs/heads/master.zip"
+PAQUETES_REQUERIDOS = ('pandas', 'yfinance')
+PAQUETES_PIP = ('pip', 'setuptools', 'wheel')
+GET_PIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'get-pip.py')
+
+
+def paquete_instalado(nombre):
+    """True si el paquete está instalado en este intérprete (no requiere pip)"""
+    from importlib import metadata
+    
+    try:
+        metadata.version(nombre)
+        return True
+    except metadata.PackageNotFoundError:
+        return False
+
+
+def _opciones_sin_red(wheelhouse):
+    """Opciones de pip para resolver solo contra la carpeta local"""
+    return ['--no-index', '--find-links', os.path.abspath(wheelhouse)] if wheelhouse else []
+
+
+def asegurar_pip(wheelhouse=None):
+    """Instala pip con el get-pip.py incluido si este intérprete no lo tiene"""
+    import importlib.util
+    
+    if importlib.util.find_spec('pip') is not None:
+        return
+    get_pip = GET_PIP
+    if wheelhouse and os.path.exists(os.path.join(wheelhouse, 'get-pip.py')):
+        get_pip = os.path.join(wheelhouse, 'get-pip.py')
+    print("  Instalando pip con get-pip.py...")
+    subprocess.check_call([sys.executable, get_pip] + _opciones_sin_red(wheelhouse))
+
+
+def instalar_paquetes(paquetes, wheelhouse=None):
+    """pip install de los paquetes; con wheelhouse no toca la red"""
+    asegurar_pip(wheelhouse)
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install'] + _opciones_sin_red(wheelhouse) + list(paquetes))
+
+
+def obtener_wheel_duka(actualizar=False):
+    """
+    Wheel de duka guardado en la caché del usuario. Solo la primera vez (o con
+    actualizar=True) se descarga el ZIP de GitHub, que se guarda con su hash
+    SHA-256 junto al wheel compilado; los demás venvs reutilizan ese wheel.
+    """
+    import hashlib
+    import json
+    import urllib.request
+    
+    carpeta = os.path.join(carpeta_usuario(), 'duka')
+    os.makedirs(carpeta, exist_ok=True)
+    ruta_indice = os.path.join(carpeta, 'actual.json')
+    
+    with _BloqueoArchivo(os.path.join(carpeta, '.lock')):
+        actual = None
+        if os.path.exists(ruta_indice):
+            with open(ruta_indice, encoding='utf-8') as f:
+                actual = json.load(f)
+        
+        if actual and not actualizar:
+            ruta_wheel = os.path.join(carpeta, actual['wheel'])
+            if os.path.exists(ruta_wheel):
+                print(f"  ✓ Usando duka de la caché ({actual['sha256'][:12]})")
+                return ruta_wheel
+        
+        ruta_zip = os.path.join(carpeta, actual['zip']) if actual and not actualizar else None
+        if not ruta_zip or not os.path.exists(ruta_zip):
+            print("  Descargando duka...")
+            temporal = os.path.join(carpeta, f".descarga_{os.getpid()}.zip")
+            urllib.request.urlretrieve(DUKA_ZIP_URL, temporal)
+            resumen = hashlib.sha256()
+            with open(temporal, 'rb') as f:
+                for bloque in iter(lambda: f.read(1 << 20), b''):
+                    resumen.update(bloque)
+            sha256 = resumen.hexdigest()
+            ruta_zip = os.path.join(carpeta, f"duka-{sha256[:16]}.zip")
+            os.replace(temporal, ruta_zip)
+        else:
+            sha256 = actual['sha256']
+        
+        # Un wheel por versión del código fuente (el hash identifica el ZIP)
+        carpeta_wheel = os.path.join(carpeta, 'wheels', sha256[:16])
+        wheels = [f for f in os.listdir(carpeta_wheel) if f.endswith('.whl')] if os.path.isdir(carpeta_wheel) else []
+        if not wheels:
+            print("  Compilando wheel de duka...")
+            subprocess.check_call([sys.executable, '-m', 'pip', 'wheel', '--no-deps',
+                                   '--wheel-dir', carpeta_wheel, ruta_zip])
+            wheels = [f for f in os.listdir(carpeta_wheel) if f.endswith('.whl')]
+        
+        actual = {
+            'sha256': sha256,
+            'zip': os.path.basename(ruta_zip),
+            'wheel': os.path.relpath(os.path.join(carpeta_wheel, wheels[0]), carpeta),
+            'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        temporal = ruta_indice + f".{os.getpid()}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(actual, f, indent=2)
+        os.replace(temporal, ruta_indice)
+        return os.path.join(carpeta, actual['wheel'])
+
+
+def construir_wheelhouse(destino):
+    """
+    Descarga/compila en `destino` los wheels de pandas, yfinance, duka y sus
+    dependencias, más pip y get-pip.py, para instalar después sin red en
+    máquinas con la misma plataforma y versión de Python.
+    """
+    import shutil
+    
+    os.makedirs(destino, exist_ok=True)
+    print(f"Construyendo wheelhouse en {destino}...")
+    
+    print("  Wheels de pandas, yfinance y duka (con dependencias)...")
+    subprocess.check_call([sys.executable, '-m', 'pip', 'wheel', '--wheel-dir', destino,
+                           *PAQUETES_REQUERIDOS, obtener_wheel_duka()])
+    print("  Wheels de pip, setuptools y wheel...")
+    subprocess.check_call([sys.executable, '-m', 'pip', 'download', '--only-binary=:all:',
+                           '--dest', destino, *PAQUETES_PIP])
+    if os.path.exists(GET_PIP):
+        shutil.copy2(GET_PIP, os.path.join(destino, 'get-pip.py'))
+    
+    wheels = [f for f in os.listdir(destino) if f.endswith('.whl')]
+    tamano = sum(os.path.getsize(os.path.join(destino, f)) for f in wheels)
+    print(f"✓ Wheelhouse listo: {len(wheels)} wheels ({formatear_bytes(tamano)})")
+    print(f"💡 En el worker: python descargar_pro.py --wheelhouse {destino} instalar")
+    return wheels
+
+
+def crear_parser():
+    """Define los modos de línea de comandos (sin argumentos: modo interactivo)"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Descargador de datos históricos (Forex, Índices y Acciones)")
+    parser.add_argument('--max-gb', type=float, help="Presupuesto de disco: rechaza descargas estimadas mayores")
+    parser.add_argument('--max-horas', type=float, help="Presupuesto de tiempo: rechaza descargas estimadas más largas")
+    parser.add_argument('--wheelhouse', default=os.environ.get('DESCARGAR_WHEELHOUSE'),
+                        help="Instalar dependencias sin red desde esta carpeta de wheels")
+    parser.add_argument('--directo', action='store_true', default=os.environ.get('DESCARGAR_DIRECTO') == '1',
+                        help="Hablar directo con Yahoo/Dukascopy con clientes propios en vez de yfinance/duka")
+    parser.add_argument('--cache-crudo', type=float, metavar='GB',
+                        help="Con --directo, guardar las respuestas crudas en disco (límite en GB)")
+    parser.add_argument('--zona', choices=sorted(ZONAS_CANONICAS), default=os.environ.get('DESCARGAR_ZONA'),
+                        help="Zona horaria canónica de los archivos (NY17 = sesión Forex de Nueva York)")
+    subparsers = parser.add_subparsers(dest='comando')
+    
+    p_encolar = subparsers.add_parser('encolar', help="Expande un manifiesto JSON en tareas de la cola")
+    p_encolar.add_argument('manifiesto', help="Archivo JSON con tipo, instrumentos, temporalidad(es), fechas y ventana_dias")
+    p_encolar.add_argument('--cola', default='cola_descargas.db', help="Archivo SQLite de la cola")
+    # SUPPRESS: sin el flag después del subcomando se conserva el valor global
+    p_encolar.add_argument('--max-gb', type=float, default=argparse.SUPPRESS,
+                           help="Rechazar el manifiesto si el disco estimado supera este límite")
+    p_encolar.add_argument('--max-horas', type=float, default=argparse.SUPPRESS,
+                           help="Rechazar el manifiesto si el tiempo estimado supera este límite")
+    
+    p_estimar = subparsers.add_parser('estimar', help="Estima peticiones, filas, disco y tiempo de un manifiesto")
+    p_estimar.add_argument('manifiesto', help="Archivo JSON del manifiesto")
+    
+    p_worker = subparsers.add_parser('worker', help="Procesa tareas de la cola hasta vaciarla")
+    p_worker.add_argument('--cola', default='cola_descargas.db', help="Archivo SQLite de la cola")
+    p_worker.add_argument('--procesos', type=int, default=1, help="Número de workers en esta máquina")
+    p_worker.add_argument('--lease', type=int, default=600, help="Segundos de lease por tarea")
+    p_worker.add_argument('--esperar', action='store_true', help="Esperar tareas en curso de otros workers")
+    
+    p_estado = subparsers.add_parser('estado', help="Muestra el avance de la cola")
+    p_estado.add_argument('--cola', default='cola_descargas.db', help="Archivo SQLite de la cola")
+    
+    p_wheelhouse = subparsers.add_parser('wheelhouse', help="Construye una carpeta de wheels para instalar sin red")
+    p_wheelhouse.add_argument('destino', nargs='?', default='wheelhouse', help="Carpeta de salida")
+    
+    subparsers.add_parser('instalar', help="Solo instala las dependencias (con --wheelhouse, sin red)")
+    
+    p_barras = subparsers.add_parser('barras', help="Construye barras de ticks/volumen/dólar/rango/renko")
+    p_barras.add_argument('archivos', nargs='+', help="Archivos de ticks (.csv de duka, .dtk, compactos) en orden")
+    p_barras.add_argument('--tipo', choices=TIPOS_BARRA, required=True, help="Regla de cierre de cada barra")
+    p_barras.add_argument('--umbral', type=float, required=True, help="N ticks, volumen, valor, rango o ladrillo")
+    p_barras.add_argument('--precio', choices=('mid', 'bid', 'ask'), default='mid', help="Precio de las barras")
+    p_barras.add_argument('--salida', help="CSV de salida (por defecto junto al primer archivo)")
+    
+    p_universos = subparsers.add_parser('universos', help="Lista los universos o los símbolos de uno")
+    p_universos.add_argument('nombre', nargs='?', help="Universo (nombre en universos/ o ruta a .csv/.txt)")
+    
+    p_sintetizar = subparsers.add_parser('sintetizar', help="Calcula cruces desde los majors USD ya guardados")
+    p_sintetizar.add_argument('cruces', nargs='+', help="Cruces a sintetizar (ej: EURGBP EURJPY)")
+    p_sintetizar.add_argument('--carpeta', default='datos_forex', help="Carpeta con el catálogo de los majors")
+    p_sintetizar.add_argument('--temporalidad', default='M1', help="Temporalidad de las series (tick, M1, H1...)")
+    p_sintetizar.add_argument('--desde', required=True, help="Fecha inicio YYYY-MM-DD")
+    p_sintetizar.add_argument('--hasta', required=True, help="Fecha fin YYYY-MM-DD")
+    
+    p_arrow = subparsers.add_parser('arrow', help="Exporta una serie guardada como archivo Arrow IPC")
+    p_arrow.add_argument('simbolo', help="Símbolo (ej: EURUSD, SPY)")
+    p_arrow.add_argument('temporalidad', help="Temporalidad de la serie (tick, M1, 1d...)")
+    p_arrow.add_argument('--desde', help="Fecha inicio YYYY-MM-DD")
+    p_arrow.add_argument('--hasta', help="Fecha fin YYYY-MM-DD (exclusiva)")
+    p_arrow.add_argument('--carpetas', nargs='+', default=['datos_indices', 'datos_forex'],
+                         help="Carpetas con catálogo donde buscar la serie")
+    p_arrow.add_argument('--ajuste', choices=MODOS_AJUSTE, default='total', help="Ajuste por acciones corporativas")
+    p_arrow.add_argument('--salida', help="Archivo .arrow (por defecto en memoria compartida)")
+    
+    p_servir = subparsers.add_parser('servir', help="Servidor HTTP local de consultas por rango con caché compartida")
+    p_servir.add_argument('--host', default='127.0.0.1', help="Interfaz de escucha (por defecto solo localhost)")
+    p_servir.add_argument('--puerto', type=int, default=PUERTO_SERVIDOR, help="Puerto TCP")
+    p_servir.add_argument('--carpetas', nargs='+', default=['datos_indices', 'datos_forex'],
+                          help="Carpetas con catálogo a servir")
+    p_servir.add_argument('--cache-gb', type=float, default=2.0, help="Memoria máxima de la caché de series")
+    p_servir.add_argument('--politica', choices=('lru', 'lfu'), default='lru', help="Expulsión de la caché")
+    
+    p_sql = subparsers.add_parser('sql', help="Consulta SQL (DuckDB) sobre todas las series descargadas")
+    p_sql.add_argument('consulta', nargs='?', help="Consulta SQL (sin consulta: lista las vistas)")
+    p_sql.add_argument('--carpetas', nargs='+', default=['datos_indices', 'datos_forex'],
+                       help="Carpetas con catálogo a registrar como vistas")
+    p_sql.add_argument('--ajuste', choices=MODOS_AJUSTE, default='total', help="Ajuste por acciones corporativas")
+    p_sql.add_argument('--salida', help="Guardar el resultado en .csv o .parquet")
+    
+    p_spread = subparsers.add_parser('spread', help="Serie de mid y spread bid/ask por barra desde ticks")
+    p_spread.add_argument('archivos', nargs='+', help="Archivos de ticks (.csv de duka, .dtk, compactos) en orden")
+    p_spread.add_argument('--temporalidad', choices=[t for t, f in FRECUENCIAS_PANDAS.items() if f], default='M1', help="Tamaño de barra")
+    p_spread.add_argument('--salida', help="CSV de salida (por defecto junto al primer archivo)")
+    
+    p_demonio = subparsers.add_parser('demonio', help="Refresca universos de forma continua según su temporalidad")
+    p_demonio.add_argument('configuracion', help="Archivo JSON con los grupos de instrumentos a refrescar")
+    p_demonio.add_argument('--ciclos', type=int, help="Terminar después de N ciclos (por defecto, sin fin)")
+    
+    return parser
+
+
+def ejecutar_comando(args):
+    """Ejecuta un modo no interactivo de la línea de comandos"""
+    if args.comando == 'encolar':
+        import json
+        with open(args.manifiesto, encoding='utf-8') as f:
+            manifiesto = json.load(f)
+        tareas = ColaTrabajo.expandir_manifiesto(manifiesto)
+        if args.max_gb is not None or args.max_horas is not None:
+            estimacion = estimar_tareas(tareas)
+            if args.max_gb is not None and estimacion['bytes'] > args.max_gb * 1024**3:
+                print(f"✗ Manifiesto rechazado: disco estimado {formatear_bytes(estimacion['bytes'])} > {args.max_gb} GB")
+                return
+            if args.max_horas is not None and estimacion['segundos'] > args.max_horas * 3600:
+                print(f"✗ Manifiesto rechazado: tiempo estimado {formatear_duracion(estimacion['segundos'])} "
+                      f"> {args.max_horas} h")
+                return
+        nuevas = ColaTrabajo(args.cola).encolar(tareas)
+        print(f"✓ {nuevas} tareas nuevas encoladas ({len(tareas) - nuevas} ya existían)")
+        mostrar_estado_cola(args.cola)
+    
+    elif args.comando == 'estimar':
+        import json
+        with open(args.manifiesto, encoding='utf-8') as f:
+            manifiesto = json.load(f)
+        estimacion = estimar_tareas(ColaTrabajo.expandir_manifiesto(manifiesto))
+        print(f"Tareas:      {estimacion['tareas']:,}")
+        print(f"Peticiones:  {estimacion['peticiones']:,}")
+        print(f"Filas:       {estimacion['filas']:,}")
+        print(f"Disco:       {formatear_bytes(estimacion['bytes'])}")
+        print(f"Tiempo:      {formatear_duracion(estimacion['segundos'])} (un solo worker)")
+    
+    elif args.comando == 'worker':
+        downloader = DataDownloader()
+        downloader.wheelhouse = args.wheelhouse
+        if not downloader.instalar_dependencias():
+            print("\n✗ Error al instalar dependencias. Saliendo...")
+            return
+        if args.procesos <= 1:
+            ejecutar_worker(args.cola, lease_segundos=args.lease, esperar=args.esperar)
+        else:
+            import multiprocessing
+            procesos = [
+                multiprocessing.Process(target=_proceso_worker, args=(args.cola, args.lease, args.esperar))
+                for _ in range(args.procesos)
+            ]
+            for p in procesos:
+                p.start()
+            seguir_cola(args.cola, procesos)
+        mostrar_estado_cola(args.cola)
+    
+    elif args.comando == 'estado':
+        mostrar_estado_cola(args.cola)
+    
+    elif args.comando == 'wheelhouse':
+        construir_wheelhouse(args.destino)
+    
+    elif args.comando == 'barras':
+        inicio = time.perf_counter()
+        barras = construir_barras(args.archivos, args.tipo, args.umbral, args.precio, incluir_ultima=True)
+        duracion = time.perf_counter() - inicio
+        salida = args.salida or f"{os.path.splitext(args.archivos[0])[0]}_{args.tipo}{args.umbral:g}.csv"
+        barras.to_csv(salida)
+        ticks = int(barras['ticks'].sum()) if len(barras) else 0
+        print(f"✓ {len(barras):,} barras de {args.tipo} desde {ticks:,} ticks en {duracion:.2f}s "
+              f"({ticks / max(duracion, 1e-9) / 1e6:.1f} M ticks/s) -> {salida}")
+    
+    elif args.comando == 'universos':
+        if args.nombre:
+            print('\n'.join(leer_universo(args.nombre)))
+        else:
+            universos = listar_universos()
+            if not universos:
+                print("✗ No hay universos: cree la carpeta universos/ con listas .csv o .txt")
+            for nombre, ruta in universos.items():
+                print(f"  {nombre:20s} {len(leer_universo(ruta)):6,} símbolos  {ruta}")
+    
+    elif args.comando == 'sintetizar':
+        downloader = DataDownloader()
+        downloader.tipo_descarga = 'forex'
+        downloader.temporalidad = args.temporalidad
+        downloader.ruta_guardado = args.carpeta
+        downloader.fecha_inicio = datetime.strptime(args.desde, "%Y-%m-%d")
+        downloader.fecha_fin = datetime.strptime(args.hasta, "%Y-%m-%d")
+        invalidos = [c for c in args.cruces if not patas_cruce(c)]
+        if invalidos:
+            print(f"✗ No se pueden sintetizar desde los majors USD: {', '.join(invalidos)}")
+        downloader.sintetizar_cruces_forex([c.upper() for c in args.cruces if patas_cruce(c)])
+    
+    elif args.comando == 'arrow':
+        cliente = ClienteDatos(args.carpetas)
+        inicio = time.perf_counter()
+        ruta = cliente.exportar_arrow(args.simbolo.upper(), args.temporalidad, args.desde, args.hasta,
+                                      ajuste=args.ajuste, ruta=args.salida)
+        print(f"✓ {formatear_bytes(os.path.getsize(ruta))} en {time.perf_counter() - inicio:.2f}s -> {ruta}")
+        print("💡 pyarrow.ipc.open_file(pyarrow.memory_map(ruta)).read_all() la abre sin copiar")
+    
+    elif args.comando == 'servir':
+        cache = CacheFrames(limite_bytes=int(args.cache_gb * 1024**3), politica=args.politica)
+        crudo = CacheCrudo(limite_bytes=args.cache_crudo * 1024**3) if args.cache_crudo else None
+        ServidorDatos(ClienteDatos(args.carpetas, cache=cache, cache_crudo=crudo), args.host, args.puerto).iniciar()
+    
+    elif args.comando == 'sql':
+        with CapaSQL(args.carpetas, ajuste=args.ajuste) as capa:
+            for archivo in capa.omitidos:
+                print(f"  ⚠️ Omitido (formato no legible por DuckDB): {archivo}")
+            if not args.consulta:
+                if not capa.vistas:
+                    print("✗ No hay series en el catálogo de " + ', '.join(args.carpetas))
+                for vista, datos in capa.vistas.items():
+                    print(f"  {vista:24s} {datos['series']:6,} series  {', '.join(datos['columnas'])}")
+                return
+            inicio = time.perf_counter()
+            resultado = capa.consultar(args.consulta)
+            duracion = time.perf_counter() - inicio
+        if args.salida:
+            if args.salida.endswith('.parquet'):
+                resultado.to_parquet(args.salida, index=False)
+            else:
+                resultado.to_csv(args.salida, index=False)
+            print(f"✓ {len(resultado):,} filas en {duracion:.2f}s -> {args.salida}")
+        else:
+            print(resultado)
+            print(f"✓ {len(resultado):,} filas en {duracion:.2f}s")
+    
+    elif args.comando == 'spread':
+        inicio = time.perf_counter()
+        serie = series_spread(args.archivos, args.temporalidad)
+        duracion = time.perf_counter() - inicio
+        salida = args.salida or f"{os.path.splitext(args.archivos[0])[0]}_SPREAD_{args.temporalidad}.csv"
+        serie.to_csv(salida)
+        ticks = int(serie['ticks'].sum()) if len(serie) else 0
+        print(f"✓ {len(serie):,} barras de {args.temporalidad} desde {ticks:,} ticks en {duracion:.2f}s "
+              f"({ticks / max(duracion, 1e-9) / 1e6:.1f} M ticks/s) -> {salida}")
+    
+    elif args.comando == 'demonio':
+        ejecutar_demonio(args.configuracion, ciclos=args.ciclos)
+    
+    elif args.comando == 'instalar':
+        downloader = DataDownloader()
+        downloader.wheelhouse = args.wheelhouse
+        if not downloader.instalar_dependencias():
+            print("\n✗ Error al instalar dependencias.")
+
+
+def main():
+    try:
+        args = crear_parser().parse_args()
+        if args.directo:
+            # Por entorno para que también lo vean los procesos worker
+            os.environ['DESCARGAR_DIRECTO'] = '1'
+        if args.cache_crudo:
+            os.environ['DESCARGAR_CACHE_CRUDO_GB'] = str(args.cache_crudo)
+            if not args.directo and args.comando not in ('demonio', 'servir'):
+                print("⚠️ --cache-crudo solo lo usan los clientes directos: agregue --directo "
+                      "(yfinance y duka no pasan por la caché)")
+        if args.zona:
+            os.environ['DESCARGAR_ZONA'] = args.zona
+        if args.comando:
+            ejecutar_comando(args)
+            return
+        
         downloader = DataDownloader()
+        downloader.wheelhouse = args.wheelhouse
+        if args.max_gb is not None:
+            downloader.limite_bytes = args.max_gb * 1024**3
+        if args.max_horas is not None:
+            downloader.limite_segundos = args.max_horas * 3600
         downloader.ejecutar()
     except KeyboardInterrupt:
         print("\n\n✗ Programa interrumpido por el usuario")
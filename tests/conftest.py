@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def ticks():
+    """Genera ticks sintéticos de EURUSD en la grilla de puntos (ask/bid/volúmenes)"""
+    def crear(n=20_000, semilla=0, inicio='2024-01-02', paso_ms=250):
+        rng = np.random.default_rng(semilla)
+        tiempos = pd.Timestamp(inicio, tz='UTC') + pd.to_timedelta(
+            np.cumsum(rng.integers(0, paso_ms * 2, n)), unit='ms')
+        bid = 1.1 + np.cumsum(rng.integers(-3, 4, n)) * 1e-5
+        ask = bid + rng.integers(1, 20, n) * 1e-5
+        return pd.DataFrame({
+            'ask': np.round(ask, 5),
+            'bid': np.round(bid, 5),
+            'ask_volume': rng.integers(1, 500, n) / 100,
+            'bid_volume': rng.integers(1, 500, n) / 100,
+        }, index=pd.DatetimeIndex(tiempos, name='timestamp'))
+    return crear
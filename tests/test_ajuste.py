@@ -0,0 +1,85 @@
+import importlib.util
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import descargar_pro as dp
+
+
+def _serie(n=400, semilla=0):
+    rng = np.random.default_rng(semilla)
+    cierre = 100 + np.cumsum(rng.normal(0, 1, n))
+    indice = pd.date_range('2020-01-01', periods=n, freq='D', tz='UTC', name='timestamp')
+    return pd.DataFrame({'open': cierre, 'high': cierre + 1, 'low': cierre - 1, 'close': cierre,
+                         'volume': rng.integers(1_000, 9_000, n).astype('float64')}, index=indice)
+
+
+def _acciones(df):
+    fechas = df.index[[40, 150, 151, 300]]
+    return pd.DataFrame({'dividendo': [0.5, 0.0, 0.8, 0.3], 'split': [1.0, 4.0, 1.0, 2.0]},
+                        index=pd.DatetimeIndex(fechas, name='timestamp'))
+
+
+def test_factores_ajuste_como_yahoo():
+    df, acciones = _serie(), _acciones(_serie())
+    precio, volumen = dp.factores_ajuste(df, acciones, 'splits')
+    assert precio[0] == pytest.approx(1 / 8) and volumen[0] == 8
+    assert precio[-1] == 1 and volumen[-1] == 1
+    # La vela del día ex ya no lleva el factor de su propia acción
+    assert volumen[300] == 1 and volumen[299] == 2
+    
+    total, _ = dp.factores_ajuste(df, acciones, 'total')
+    cierre_previo = df['close'].iloc[299]
+    assert total[299] / total[300] == pytest.approx((1 - 0.3 / cierre_previo) / 2)
+
+
+@pytest.mark.parametrize('modo', ('splits', 'total'))
+def test_vista_sql_igual_a_factores_ajuste(tmp_path, modo):
+    pytest.importorskip('duckdb')
+    carpeta = tmp_path / 'datos_indices'
+    carpeta.mkdir()
+    for simbolo, semilla in (('AAPL', 1), ('MSFT', 2)):
+        df = _serie(semilla=semilla)
+        ruta = str(carpeta / f"{simbolo}_1d_2020-01-01_to_2021-02-04.csv")
+        df.to_csv(ruta)
+        dp.Catalogo(str(carpeta)).registrar(simbolo, '1d', ruta, ajuste='crudo')
+    dp.guardar_acciones(str(carpeta), 'AAPL', _acciones(df))
+    
+    with dp.CapaSQL([str(carpeta)], ajuste=modo) as capa:
+        for simbolo in ('AAPL', 'MSFT'):
+            vista = capa.consultar("SELECT * FROM indices_1d WHERE simbolo = ? ORDER BY timestamp", [simbolo])
+            crudo = dp.leer_datos(str(carpeta / f"{simbolo}_1d_2020-01-01_to_2021-02-04.csv"))
+            esperado = dp.ajustar_precios(crudo, dp.leer_acciones(str(carpeta), simbolo), modo)
+            for columna in ('open', 'high', 'low', 'close', 'volume'):
+                np.testing.assert_allclose(vista[columna], esperado[columna], rtol=1e-12)
+        assert capa.consultar("SELECT count(*) AS n FROM indices_1d_crudo")['n'][0] == 800
+
+
+def test_ajuste_por_serie_y_no_por_simbolo(tmp_path):
+    carpeta = str(tmp_path)
+    diaria, horaria = _serie(), _serie(semilla=3)
+    # SPY_1d se guardó ya ajustada; SPY_1h, nueva, sin ajustar con su tabla de acciones
+    for temporalidad, df, extra in (('1d', diaria, {}), ('1h', horaria, {'ajuste': 'crudo'})):
+        ruta = str(tmp_path / f"SPY_{temporalidad}_2020-01-01_to_2021-02-04.csv")
+        df.to_csv(ruta)
+        dp.Catalogo(carpeta).registrar('SPY', temporalidad, ruta, **extra)
+    dp.guardar_acciones(carpeta, 'SPY', _acciones(diaria))
+    
+    cliente = dp.ClienteDatos([carpeta])
+    np.testing.assert_allclose(cliente.obtener('SPY', '1d')['close'], diaria['close'])
+    esperado = dp.ajustar_precios(horaria, dp.leer_acciones(carpeta, 'SPY'), 'total')
+    np.testing.assert_allclose(cliente.obtener('SPY', '1h')['close'], esperado['close'])
+    
+    descargador = dp.DataDownloader()
+    descargador.ruta_guardado = carpeta
+    for temporalidad, crudo in (('1d', False), ('1h', True)):
+        descargador.temporalidad = temporalidad
+        assert descargador.buscar_serie_existente('SPY')['crudo'] is crudo
+    
+    if importlib.util.find_spec('duckdb'):
+        with dp.CapaSQL([carpeta]) as capa:
+            vista = capa.consultar(f"SELECT close FROM {capa.nombre_vista(carpeta, '1d')} ORDER BY timestamp")
+            np.testing.assert_allclose(vista['close'], diaria['close'])
+            vista = capa.consultar(f"SELECT close FROM {capa.nombre_vista(carpeta, '1h')} ORDER BY timestamp")
+            np.testing.assert_allclose(vista['close'], esperado['close'], rtol=1e-12)
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+import descargar_pro as dp
+
+UMBRALES = {'tick': 100, 'volumen': 250.0, 'dolar': 300.0, 'rango': 5e-4, 'renko': 2e-4}
+
+
+@pytest.mark.parametrize('tipo', dp.TIPOS_BARRA)
+def test_barras_no_dependen_de_los_bloques(tipo, ticks):
+    df = ticks(30_000, semilla=1)
+    completo = dp.construir_barras(df, tipo, UMBRALES[tipo], incluir_ultima=True)
+    cortes = [0, 7, 1_000, 1_001, 12_345, 29_000, len(df)]
+    bloques = [df.iloc[a:b] for a, b in zip(cortes, cortes[1:])]
+    por_bloques = dp.construir_barras(bloques, tipo, UMBRALES[tipo], incluir_ultima=True)
+    
+    assert len(completo) > 10
+    pd.testing.assert_frame_equal(completo, por_bloques)
+    assert int(completo['ticks'].sum()) == len(df)
+
+
+def _serie(precios):
+    tiempos = pd.date_range('2024-01-02', periods=len(precios), freq='s', tz='UTC', name='timestamp')
+    return pd.DataFrame({'close': precios}, index=tiempos)
+
+
+def test_renko_revierte_con_dos_ladrillos():
+    precios = [10.2, 11.1, 12.5, 11.5, 10.9, 9.9, 9.5, 12.0, 12.3]
+    barras = dp.construir_barras(_serie(precios), 'renko', 1.0, precio='close')
+    
+    assert barras[['open', 'close']].values.tolist() == [[10, 11], [11, 12], [11, 10], [11, 12]]
+    assert barras['ladrillos'].tolist() == [1, 1, -1, 1]
+    assert barras['ticks'].tolist() == [2, 1, 3, 2]
+
+
+@pytest.mark.parametrize('umbral', [3e-5, 1e-4, 2e-3])
+def test_rango_igual_a_recorrer_tick_a_tick(umbral, ticks):
+    df = ticks(20_000, semilla=3)
+    precios = ((df['ask'] + df['bid']) / 2).to_numpy()
+    esperados, alto, bajo = [], None, None
+    for i, precio in enumerate(precios):
+        alto = precio if alto is None else max(alto, precio)
+        bajo = precio if bajo is None else min(bajo, precio)
+        if alto - bajo >= umbral:
+            esperados.append(i + 1)
+            alto = bajo = None
+    
+    barras = dp.construir_barras(df, 'rango', umbral)
+    assert barras['ticks'].cumsum().tolist() == esperados
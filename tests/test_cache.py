@@ -0,0 +1,49 @@
+import random
+
+import pandas as pd
+import pytest
+
+import descargar_pro as dp
+
+
+def frame(filas=10):
+    return pd.DataFrame({'close': [1.0] * filas})
+
+
+TAMANO = int(frame().memory_usage(index=True).sum())
+
+
+def victima_referencia(cache):
+    """La regla LFU original: menos usos y, a igualdad, la de acceso más antiguo"""
+    return min(cache._entradas, key=lambda clave: cache._entradas[clave][3])
+
+
+@pytest.mark.parametrize('semilla', range(5))
+def test_lfu_por_grupos_equivale_al_minimo(semilla):
+    rng = random.Random(semilla)
+    cache = dp.CacheFrames(limite_bytes=TAMANO * 8, politica='lfu')
+    df = frame()
+    for _ in range(1500):
+        clave = rng.randrange(30)
+        operacion = rng.random()
+        if operacion < 0.02:
+            cache.invalidar(lambda c: c % 7 == clave % 7)
+        elif cache.obtener(clave) is None:
+            if len(cache._entradas) == 8:
+                esperada = victima_referencia(cache)
+                assert cache._victima() == esperada
+            cache.guardar(clave, df)
+        assert set(cache._entradas) == {c for grupo in cache._por_usos.values() for c in grupo}
+        assert cache.bytes <= cache.limite_bytes
+
+
+def test_lfu_conserva_las_claves_frecuentes():
+    cache = dp.CacheFrames(limite_bytes=TAMANO * 3, politica='lfu')
+    for clave in ('a', 'b', 'c'):
+        cache.guardar(clave, frame())
+    for _ in range(3):
+        cache.obtener('a')
+        cache.obtener('b')
+    cache.guardar('d', frame())
+    assert set(cache._entradas) == {'a', 'b', 'd'}
+    assert cache.estadisticas()['expulsiones'] == 1
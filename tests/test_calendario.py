@@ -0,0 +1,61 @@
+from datetime import date, datetime
+
+import descargar_pro as dp
+
+
+def test_feriados_nyse():
+    feriados = dp.feriados_mercado('NYSE', 2024)
+    assert date(2024, 3, 29) in feriados    # Viernes Santo
+    assert date(2024, 6, 19) in feriados    # Juneteenth
+    assert date(2024, 7, 4) in feriados
+    assert date(2024, 11, 28) in feriados   # Thanksgiving
+    # 4 de julio de 2021 fue domingo: se observa el lunes
+    assert date(2021, 7, 5) in dp.feriados_mercado('NYSE', 2021)
+    # Año nuevo en sábado no se traslada al viernes
+    assert date(2021, 12, 31) not in dp.feriados_mercado('NYSE', 2022)
+
+
+def test_feriados_lse_xetra_tse():
+    assert {date(2020, 12, 25), date(2020, 12, 28)} <= dp.feriados_mercado('LSE', 2020)
+    assert date(2024, 12, 24) in dp.feriados_mercado('XETRA', 2024)
+    assert date(2024, 1, 8) in dp.feriados_mercado('TSE', 2024)    # Mayoría de Edad
+
+
+def test_dias_habiles_excluyen_feriados():
+    dias = dp.dias_habiles('NYSE', datetime(2024, 7, 1), datetime(2024, 7, 8))
+    assert [str(d) for d in dias] == ['2024-07-01', '2024-07-02', '2024-07-03', '2024-07-05']
+
+
+def test_forex_sin_feriados_y_un_solo_bloque():
+    assert dp.feriados_mercado('FOREX', 2024) == set()
+    horas = dp.horas_forex_abiertas(datetime(2024, 12, 24), datetime(2024, 12, 27))
+    assert len(horas) == 72    # Navidad tiene ticks en Dukascopy
+    # Cuatro semanas con fines de semana y Año Nuevo: un solo bloque para duka
+    rangos = dp.planificar_rangos('forex', 'EURUSD', datetime(2024, 12, 16), datetime(2025, 1, 13))
+    assert rangos == [(datetime(2024, 12, 16), datetime(2025, 1, 13))]
+    assert dp.peticiones_forex(rangos) == 4 * 119    # domingo 22:00 a viernes 21:00 UTC
+
+
+def test_ejecutar_duka_revisa_el_codigo_de_salida(tmp_path, monkeypatch):
+    import subprocess
+    
+    llamadas = []
+    
+    def duka(cmd, **kwargs):
+        llamadas.append(cmd)
+        carpeta = cmd[cmd.index('--folder') + 1]
+        with open(f"{carpeta}/EURUSD-{cmd[3]}-{cmd[5]}.csv", 'w') as f:
+            f.write('time,ask,bid\n1,2,3\n')
+        return subprocess.CompletedProcess(cmd, 1 if len(llamadas) == 2 else 0, '', 'HTTP 503\n')
+    
+    monkeypatch.setattr(dp.subprocess, 'run', duka)
+    descargador = dp.DataDownloader()
+    descargador.ruta_guardado = str(tmp_path)
+    descargador.temporalidad = 'tick'
+    rangos = [(datetime(2024, 1, 1), datetime(2024, 1, 3)), (datetime(2024, 1, 8), datetime(2024, 1, 10))]
+    
+    assert descargador.ejecutar_duka('EURUSD', rangos) is False
+    assert len(llamadas) == 2
+    assert not [f for f in tmp_path.iterdir()]
+    assert descargador.ejecutar_duka('EURUSD', rangos[:1]) is True
+    assert [f.name for f in tmp_path.iterdir()] == ['EURUSD-2024-01-01-2024-01-02.csv']
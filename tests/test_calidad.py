@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import descargar_pro as dp
+
+
+def velas_diarias(simbolo, zona_local, anio=2023, quitar=()):
+    """Velas de un año completo fechadas como Yahoo: medianoche de la bolsa"""
+    mercado = dp.mercado_de(simbolo, 'indices')
+    dias = dp.dias_habiles(mercado, datetime(anio, 1, 1), datetime(anio + 1, 1, 1))
+    dias = [d for d in dias if str(d) not in quitar]
+    indice = pd.DatetimeIndex(pd.to_datetime(dias)).tz_localize(zona_local).tz_convert('UTC')
+    cierre = 100 + np.arange(len(indice), dtype='float64') * 0.01
+    return pd.DataFrame({'open': cierre, 'high': cierre + 1, 'low': cierre - 1, 'close': cierre},
+                        index=pd.DatetimeIndex(indice, name='timestamp'))
+
+
+MERCADOS = [('^GDAXI', 'Europe/Berlin'), ('^FTSE', 'Europe/London'),
+            ('^N225', 'Asia/Tokyo'), ('^GSPC', 'America/New_York')]
+
+
+@pytest.mark.parametrize('simbolo,zona_local', MERCADOS)
+def test_diarias_a_medianoche_local_sin_faltantes(simbolo, zona_local):
+    reporte = dp.validar_calidad(velas_diarias(simbolo, zona_local), '1d', 'indices', simbolo=simbolo)
+    assert reporte['barras_faltantes'] == 0
+    assert reporte['ok']
+
+
+@pytest.mark.parametrize('simbolo,zona_local', MERCADOS)
+def test_diarias_detectan_hueco_real(simbolo, zona_local):
+    df = velas_diarias(simbolo, zona_local, quitar=('2023-06-13', '2023-06-14'))
+    reporte = dp.validar_calidad(df, '1d', 'indices', simbolo=simbolo)
+    assert reporte['barras_faltantes'] == 2
+
+
+@pytest.mark.parametrize('zona', ['UTC', 'NY17'])
+@pytest.mark.parametrize('simbolo,zona_local', MERCADOS)
+def test_diarias_reetiquetadas_a_zona_canonica(simbolo, zona_local, zona):
+    # Como en la descarga: normalizar_zona recibe el índice en hora de la bolsa
+    df = velas_diarias(simbolo, zona_local)
+    df.index = df.index.tz_convert(zona_local)
+    df = dp.normalizar_zona(df, zona, '1d')
+    reporte = dp.validar_calidad(df, '1d', 'indices', simbolo=simbolo, zona=zona)
+    assert reporte['barras_faltantes'] == 0
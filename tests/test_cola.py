@@ -0,0 +1,179 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import descargar_pro as dp
+
+
+def _tareas(n):
+    return [{'tipo': 'indices', 'simbolo': f"S{i}", 'temporalidad': '1d', 'fecha_inicio': '2024-01-01',
+             'fecha_fin': '2024-02-01', 'ruta_guardado': 'datos'} for i in range(n)]
+
+
+def _reclamar_todo(ruta_cola, worker, salida):
+    cola = dp.ColaTrabajo(ruta_cola)
+    reclamadas = []
+    while True:
+        tarea = cola.reclamar(worker, lease_segundos=60)
+        if tarea is None:
+            break
+        reclamadas.append(tarea['id'])
+        cola.completar(tarea['id'], worker)
+    salida.put(reclamadas)
+
+
+def test_dos_procesos_no_reclaman_la_misma_tarea(tmp_path):
+    ruta = str(tmp_path / 'cola.db')
+    assert dp.ColaTrabajo(ruta).encolar(_tareas(60)) == 60
+    
+    contexto = multiprocessing.get_context('spawn')
+    salida = contexto.Queue()
+    procesos = [contexto.Process(target=_reclamar_todo, args=(ruta, f"w{i}", salida)) for i in range(2)]
+    for p in procesos:
+        p.start()
+    resultados = [salida.get(timeout=60) for _ in procesos]
+    for p in procesos:
+        p.join(timeout=60)
+    
+    reclamadas = resultados[0] + resultados[1]
+    assert sorted(reclamadas) == list(range(1, 61))
+    assert dp.ColaTrabajo(ruta).progreso()['completadas'] == 60
+
+
+def test_lease_vencido_vuelve_a_la_cola(tmp_path):
+    cola = dp.ColaTrabajo(str(tmp_path / 'cola.db'), max_intentos=2)
+    cola.encolar(_tareas(1))
+    
+    primera = cola.reclamar('w1', lease_segundos=0.2)
+    assert cola.reclamar('w2') is None
+    time.sleep(0.3)
+    segunda = cola.reclamar('w2', lease_segundos=0.2)
+    assert segunda['id'] == primera['id'] and segunda['intentos'] == 2
+    # El worker original perdió el lease
+    assert not cola.renovar(primera['id'], 'w1')
+    
+    time.sleep(0.3)
+    assert cola.reclamar('w3') is None
+    assert cola.progreso()['fallidas'] == 1
+
+
+def test_ventanas_forex_no_repiten_el_dia_final():
+    tareas = dp.ColaTrabajo.expandir_manifiesto({
+        'tipo': 'forex', 'instrumentos': ['EURUSD'], 'temporalidad': 'tick',
+        'fecha_inicio': '2024-01-01', 'fecha_fin': '2024-01-10', 'ventana_dias': 3,
+    })
+    ventanas = [(t['fecha_inicio'], t['fecha_fin']) for t in tareas]
+    assert ventanas == [('2024-01-01', '2024-01-03'), ('2024-01-04', '2024-01-06'),
+                        ('2024-01-07', '2024-01-09'), ('2024-01-10', '2024-01-10')]
+    
+    tareas = dp.ColaTrabajo.expandir_manifiesto({
+        'tipo': 'indices', 'instrumentos': ['SPY'], 'temporalidad': '1d',
+        'fecha_inicio': '2024-01-01', 'fecha_fin': '2024-01-07', 'ventana_dias': 3,
+    })
+    assert [(t['fecha_inicio'], t['fecha_fin']) for t in tareas] == [
+        ('2024-01-01', '2024-01-04'), ('2024-01-04', '2024-01-07')]
+
+
+def _sostener_lock(ruta, listo, segundos):
+    with dp._BloqueoArchivo(ruta):
+        listo.set()
+        time.sleep(segundos)
+
+
+def test_bloqueo_no_se_roba_a_un_proceso_vivo(tmp_path):
+    ruta = str(tmp_path / 'x.lock')
+    contexto = multiprocessing.get_context('spawn')
+    listo = contexto.Event()
+    proceso = contexto.Process(target=_sostener_lock, args=(ruta, listo, 1.5))
+    proceso.start()
+    assert listo.wait(30)
+    
+    inicio = time.time()
+    try:
+        with dp._BloqueoArchivo(ruta, espera_maxima=0.3):
+            raise AssertionError("lock tomado mientras otro proceso lo tiene")
+    except TimeoutError:
+        pass
+    with dp._BloqueoArchivo(ruta):
+        assert time.time() - inicio >= 1.0
+    proceso.join()
+    assert os.path.exists(ruta)
+
+
+def test_bloqueo_se_libera_si_el_proceso_muere(tmp_path):
+    ruta = str(tmp_path / 'x.lock')
+    contexto = multiprocessing.get_context('spawn')
+    listo = contexto.Event()
+    proceso = contexto.Process(target=_sostener_lock, args=(ruta, listo, 60))
+    proceso.start()
+    assert listo.wait(30)
+    proceso.kill()
+    proceso.join()
+    with dp._BloqueoArchivo(ruta, espera_maxima=5):
+        pass
+
+
+def test_worker_une_las_ventanas_de_cada_simbolo(tmp_path, monkeypatch):
+    import pandas as pd
+    
+    carpeta = str(tmp_path / 'datos')
+    os.makedirs(carpeta)
+    
+    def tarea_falsa(tarea, compartido=None):
+        # Cada ventana escribe su propio archivo y su entrada de catálogo, como descargar_indices
+        descargador = dp.DataDownloader()
+        descargador.ruta_guardado, descargador.temporalidad = tarea['ruta_guardado'], tarea['temporalidad']
+        indice = pd.date_range(tarea['fecha_inicio'], tarea['fecha_fin'], freq='D', tz='UTC',
+                               inclusive='left', name='timestamp')
+        df = pd.DataFrame({'close': range(len(indice))}, index=indice)
+        ruta = os.path.join(carpeta, f"{tarea['simbolo']}_1d_{tarea['fecha_inicio']}_to_{tarea['fecha_fin']}.csv")
+        df.to_csv(ruta)
+        descargador.registrar_serie(tarea['simbolo'], ruta, 'yahoo', df.index[0], df.index[-1], len(df),
+                                    ajuste='crudo')
+        return True, len(df), os.path.getsize(ruta), list(descargador.registradas.values())
+    
+    monkeypatch.setattr(dp, 'ejecutar_tarea', tarea_falsa)
+    ruta_cola = str(tmp_path / 'cola.db')
+    tareas = dp.ColaTrabajo.expandir_manifiesto({
+        'tipo': 'indices', 'instrumentos': ['SPY', 'QQQ'], 'temporalidad': '1d', 'lote': 2,
+        'fecha_inicio': '2024-01-01', 'fecha_fin': '2024-03-01', 'ventana_dias': 20, 'ruta_guardado': carpeta,
+    })
+    assert len(tareas) == 3
+    dp.ColaTrabajo(ruta_cola).encolar(tareas)
+    assert dp.ejecutar_worker(ruta_cola, worker='w1') == 3
+    
+    catalogo = dp.Catalogo(carpeta)
+    for simbolo in ('SPY', 'QQQ'):
+        entrada = catalogo.obtener(simbolo, '1d')
+        assert entrada['archivo'] == f"{simbolo}_1d_2024-01-01_to_2024-02-29.csv"
+        assert entrada['filas'] == 60 and entrada['ajuste'] == 'crudo'
+        assert entrada['inicio'].startswith('2024-01-01') and entrada['fin'].startswith('2024-02-29')
+        df = dp.leer_datos(entrada['ruta'])
+        assert len(df) == 60 and df.index.is_monotonic_increasing
+    # Los archivos de cada ventana ya no están
+    assert sorted(f for f in os.listdir(carpeta) if f.endswith('.csv')) == [
+        'QQQ_1d_2024-01-01_to_2024-02-29.csv', 'SPY_1d_2024-01-01_to_2024-02-29.csv']
+
+
+def test_ejecutar_tarea_reutiliza_la_sesion_y_la_cache_del_worker(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    
+    compartido = {'sesion': dp.SesionHTTP(), 'cache_crudo': dp.CacheCrudo(str(tmp_path / 'cache'))}
+    usadas = []
+    
+    def descargar_falso(self):
+        usadas.append((self.sesion, self.cache_crudo))
+        self.progreso = SimpleNamespace(filas=1, bytes=1)
+        return 1
+    
+    # Con la sesión y la caché del worker no se abre ninguna nueva por tarea
+    monkeypatch.setenv('DESCARGAR_CACHE_CRUDO_GB', '1')
+    monkeypatch.setattr(dp, 'SesionHTTP', lambda *a, **k: pytest.fail("sesión nueva por tarea"))
+    monkeypatch.setattr(dp, 'CacheCrudo', lambda *a, **k: pytest.fail("caché nueva por tarea"))
+    monkeypatch.setattr(dp.DataDownloader, 'descargar_indices', descargar_falso)
+    tarea = {'tipo': 'indices', 'simbolo': 'SPY,QQQ', 'temporalidad': '1d', 'fecha_inicio': '2024-01-01',
+             'fecha_fin': '2024-02-01', 'ruta_guardado': str(tmp_path / 'datos')}
+    assert dp.ejecutar_lote(tarea, compartido)[:4] == (True, 2, 2, [])
+    assert usadas == [(compartido['sesion'], compartido['cache_crudo'])] * 2
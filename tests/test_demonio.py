@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import descargar_pro as dp
+
+
+def diarias(n, inicio='2022-01-03'):
+    indice = pd.bdate_range(inicio, periods=n, tz='UTC', name='timestamp')
+    cierre = np.round(100 + np.cumsum(np.sin(np.arange(n))), 2)
+    return pd.DataFrame({'open': cierre, 'high': cierre + 1, 'low': cierre - 1, 'close': cierre,
+                         'volume': np.arange(n, dtype='float64') * 1000}, index=indice)
+
+
+def test_arrow_agrega_solo_la_ventana_anexada(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    carpeta = str(tmp_path / 'datos')
+    monkeypatch.setattr(dp, 'CacheCrudo', lambda **k: None)
+    demonio = dp.Demonio({'grupos': [{'instrumentos': ['SPY'], 'temporalidad': '1d', 'ruta_guardado': carpeta,
+                                      'fecha_inicio': '2022-01-01'}], 'arrow': str(tmp_path / 'arrow')})
+    grupo = demonio.grupos[0]
+    descargador = grupo['downloader']
+    descargador.fecha_fin = datetime(2022, 7, 1)
+    
+    # Serie sin ajustar con un dividendo: lo publicado debe quedar ajustado
+    df = diarias(100)
+    ruta = f"{carpeta}/SPY_1d.csv"
+    df.to_csv(ruta)
+    descargador.registrar_serie('SPY', ruta, 'yahoo', df.index[0], df.index[-1], len(df), ajuste='crudo')
+    dp.guardar_acciones(carpeta, 'SPY', pd.DataFrame({'dividendo': [0.5], 'split': [1.0]},
+                                                     index=pd.DatetimeIndex(df.index[[50]], name='timestamp')))
+    demonio.publicar_arrow(grupo)
+    
+    # Ciclo siguiente: una barra corregida por el proveedor y cinco nuevas
+    revisado = diarias(105).iloc[-10:]
+    revisado.iloc[2, 3] += 0.5
+    existente = {'ruta': ruta, 'particionado': False, 'ultimo': df.index[-1]}
+    descargador.anexadas.clear()
+    assert descargador.refrescar_serie(revisado, existente, 'SPY', {}) == 8
+    
+    def sin_lectura_completa(ruta):
+        raise AssertionError("se releyó la serie completa")
+    
+    with monkeypatch.context() as m:
+        m.setattr(dp, 'leer_datos', sin_lectura_completa)
+        demonio.publicar_arrow(grupo)
+    
+    publicada = dp.mapear_arrow(f"{tmp_path}/arrow/SPY_1d.arrow")
+    assert publicada.column(0).num_chunks == 2
+    esperada = dp.ClienteDatos([carpeta], sesion=demonio.sesion).obtener('SPY', '1d')
+    assert len(esperada) == 105
+    pd.testing.assert_frame_equal(publicada.to_pandas(), esperada, check_freq=False)
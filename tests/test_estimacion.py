@@ -0,0 +1,19 @@
+import descargar_pro as dp
+
+
+def test_limites_globales_no_se_pisan_en_encolar():
+    parser = dp.crear_parser()
+    args = parser.parse_args(['--max-gb', '5', '--max-horas', '2', 'encolar', 'm.json'])
+    assert (args.max_gb, args.max_horas) == (5.0, 2.0)
+    args = parser.parse_args(['--max-gb', '5', 'encolar', 'm.json', '--max-gb', '7'])
+    assert (args.max_gb, args.max_horas) == (7.0, None)
+
+
+def test_factor_de_formato_medido(tmp_path):
+    historial = dp.HistorialRendimiento(str(tmp_path / 'historial.json'))
+    assert historial.factor('dtk', 0.086) == 0.086
+    historial.registrar_factor('dtk', 0.1)
+    historial.registrar_factor('dtk', 0.2)
+    releido = dp.HistorialRendimiento(str(tmp_path / 'historial.json'))
+    assert abs(releido.factor('dtk', 0.086) - 0.13) < 1e-12
+    assert releido.obtener('forex', 'tick') == {}
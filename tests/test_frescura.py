@@ -0,0 +1,140 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import descargar_pro as dp
+
+
+def diarias(n=600, inicio='2022-01-03'):
+    indice = pd.bdate_range(inicio, periods=n, tz='UTC', name='timestamp')
+    cierre = np.round(100 + np.cumsum(np.sin(np.arange(n))), 2)
+    return pd.DataFrame({'open': cierre, 'high': cierre + 1, 'low': cierre - 1, 'close': cierre,
+                         'volume': np.arange(n, dtype='float64') * 1000}, index=indice)
+
+
+@pytest.mark.parametrize('compacto', [None, 'float32'])
+def test_leer_cola_csv(tmp_path, compacto):
+    df = diarias(20_000)
+    ruta = str(tmp_path / 'SPY.csv')
+    if compacto:
+        dp.guardar_compacto(df, ruta, 'SPY', precios=compacto)
+    else:
+        df.to_csv(ruta)
+    completo = dp.leer_datos(ruta)
+    for desde in (df.index[-3], df.index[-9_000], df.index[0]):
+        cola = dp.leer_cola_csv(ruta, desde)
+        pd.testing.assert_frame_equal(cola, completo[completo.index >= desde], check_freq=False)
+
+
+def test_barras_distintas():
+    guardado = diarias(50)
+    nuevo = guardado.copy()
+    nuevo.iloc[10, 3] += 0.25
+    nuevo = nuevo.drop(nuevo.index[20])
+    nuevo.loc[pd.Timestamp('2030-01-01', tz='UTC')] = nuevo.iloc[-1]
+    distintas = dp.barras_distintas(nuevo, guardado.drop(guardado.index[30]))
+    assert list(np.flatnonzero(distintas)) == [10, 29, len(nuevo) - 1]
+
+
+def test_refresco_detecta_correcciones_sin_huella(tmp_path):
+    df = diarias(100)
+    ruta = str(tmp_path / 'SPY_1d.csv')
+    df.to_csv(ruta)
+    descargador = dp.DataDownloader()
+    descargador.ruta_guardado = str(tmp_path)
+    descargador.temporalidad = '1d'
+    descargador.tipo_descarga = 'indices'
+    descargador.fecha_fin = datetime(2022, 5, 21)
+    existente = {'ruta': ruta, 'particionado': False, 'ultimo': df.index[-1]}
+    
+    # Sin huellas previas y sin cambios: no se reescribe nada
+    assert descargador.refrescar_serie(df.iloc[-5:], existente, 'SPY', {}) == 0
+    
+    revisado = df.iloc[-5:].copy()
+    revisado.iloc[1, 3] += 0.5
+    assert descargador.refrescar_serie(revisado, existente, 'SPY', {}) == 4
+    assert dp.leer_datos(ruta)['close'].iloc[-4] == revisado['close'].iloc[1]
+    assert len(dp.leer_datos(ruta)) == len(df)
+
+
+class SesionFalsa:
+    def __init__(self):
+        self.pedidas = []
+    
+    def obtener(self, url, cabeceras=None):
+        self.pedidas.append((url, dict(cabeceras or {})))
+        if (cabeceras or {}).get('If-None-Match') == '"v1"':
+            return 304, {}, b''
+        payload = {'chart': {'result': [{
+            'meta': {'exchangeTimezoneName': 'America/New_York', 'dataGranularity': '1d'},
+            'timestamp': [1704205800],
+            'indicators': {'quote': [{k: [1.0] for k in ('open', 'high', 'low', 'close', 'volume')}]},
+        }]}}
+        return 200, {'etag': '"v1"'}, json.dumps(payload).encode()
+
+
+def test_validadores_por_url_exacta():
+    sesion = SesionFalsa()
+    frescura = {}
+    assert dp.historial_yahoo('SPY', '2024-01-01', '2024-01-05', '1d', sesion=sesion, frescura=frescura) is not None
+    assert frescura['etag'] == '"v1"'
+    assert dp.historial_yahoo('SPY', '2024-01-01', '2024-01-05', '1d', sesion=sesion, frescura=frescura) is None
+    # Otra ventana: el ETag anterior no corresponde y no se envía
+    assert dp.historial_yahoo('SPY', '2024-01-01', '2024-01-06', '1d', sesion=sesion, frescura=frescura) is not None
+    assert [bool(c) for _, c in sesion.pedidas] == [False, True, False]
+
+
+def test_actualizar_solo_si_la_serie_cubre_el_inicio(tmp_path):
+    df = diarias(100)
+    df.to_csv(str(tmp_path / 'SPY_1d_2022-01-01_to_2022-05-21.csv'))
+    descargador = dp.DataDownloader()
+    descargador.ruta_guardado = str(tmp_path)
+    descargador.temporalidad = '1d'
+    descargador.fecha_fin = datetime(2022, 6, 1)
+    existente = descargador.buscar_serie_existente('SPY')
+    assert existente['primero'] == df.index[0]
+    
+    # 2022-01-01 es sábado: la primera sesión pedida es el lunes 3, donde empieza la serie
+    descargador.fecha_inicio = datetime(2022, 1, 1)
+    assert descargador.cubre_inicio(existente, 'SPY')
+    # Pedir desde 2010 no puede contentarse con completar la cola de 2022
+    descargador.fecha_inicio = datetime(2010, 1, 1)
+    assert not descargador.cubre_inicio(existente, 'SPY')
+
+
+def test_huellas_por_dia_y_una_escritura_por_ejecucion(tmp_path, monkeypatch):
+    indice = pd.DatetimeIndex([t for dia in ('2024-03-04', '2024-03-05', '2024-03-06')
+                               for t in pd.date_range(f'{dia} 14:30', periods=390, freq='min', tz='UTC')],
+                              name='timestamp')
+    df = pd.DataFrame({'close': np.arange(len(indice), dtype='float64')}, index=indice)
+    ruta = str(tmp_path / 'SPY_1m.csv')
+    df.iloc[:-10].to_csv(ruta)
+    descargador = dp.DataDownloader()
+    descargador.ruta_guardado, descargador.temporalidad = str(tmp_path), '1m'
+    descargador.tipo_descarga = 'indices'
+    descargador.fecha_fin = datetime(2024, 3, 8)
+    registro = dp.RegistroFrescura(str(tmp_path))
+    existente = {'ruta': ruta, 'particionado': False, 'ultimo': df.index[-11]}
+    
+    frescura = registro.obtener('SPY', '1m')
+    assert descargador.refrescar_serie(df, existente, 'SPY', frescura, registro) == 10
+    assert not (tmp_path / 'frescura.json').exists()
+    registro.guardar()
+    guardado = dp.RegistroFrescura(str(tmp_path)).obtener('SPY', '1m')
+    assert len(guardado['dias']) == 3 and 'huellas' not in guardado
+    
+    # Con las huellas de cada día ya no se lee el disco si nada cambió
+    lecturas = []
+    monkeypatch.setattr(dp, 'leer_cola_csv', lambda *a: lecturas.append(a) or dp.leer_datos(ruta))
+    existente['ultimo'] = df.index[-1]
+    registro = dp.RegistroFrescura(str(tmp_path))
+    assert descargador.refrescar_serie(df, existente, 'SPY', registro.obtener('SPY', '1m'), registro) == 0
+    assert lecturas == []
+    
+    corregido = df.copy()
+    corregido.iloc[500, 0] += 1
+    assert descargador.refrescar_serie(corregido, existente, 'SPY', registro.obtener('SPY', '1m'), registro) == 670
+    assert len(lecturas) == 1 and lecturas[0][1] == df.index[390]
@@ -0,0 +1,49 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import descargar_pro as dp
+
+
+class Manejador(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        cuerpo = b'x' * 100
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}/"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_contadores_de_la_sesion_entre_hilos(servidor):
+    sesion = dp.SesionHTTP()
+    with ThreadPoolExecutor(8) as hilos:
+        estados = list(hilos.map(lambda _: sesion.obtener(servidor)[0], range(400)))
+    sesion.cerrar()
+    assert estados == [200] * 400
+    assert sesion.peticiones == 400
+    assert sesion.bytes_recibidos == 400 * 100
+
+
+def test_cache_cruda_no_cambia_de_cliente(monkeypatch):
+    monkeypatch.setenv('DESCARGAR_CACHE_CRUDO_GB', '1')
+    monkeypatch.delenv('DESCARGAR_DIRECTO', raising=False)
+    assert not dp.DataDownloader().directo
+    monkeypatch.setenv('DESCARGAR_DIRECTO', '1')
+    assert dp.DataDownloader().directo
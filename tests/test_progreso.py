@@ -0,0 +1,58 @@
+import io
+import sys
+
+import pandas as pd
+import pytest
+
+import descargar_pro as dp
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_el_reporte_devuelve_stdout_aunque_falle_la_descarga(monkeypatch):
+    salida = Terminal()
+    monkeypatch.setattr(sys, 'stdout', salida)
+    with pytest.raises(RuntimeError):
+        with dp.ReporteProgreso(3, "Forex") as progreso:
+            assert sys.stdout is not salida
+            progreso.avanzar(10, 100)
+            raise RuntimeError("fallo a mitad de la descarga")
+    assert sys.stdout is salida
+    assert salida.getvalue().rstrip().endswith("0 workers activos")
+
+
+def test_en_workers_el_reporte_no_dibuja_en_el_terminal(monkeypatch):
+    monkeypatch.setattr(dp.ReporteProgreso, 'solo_lineas', True)
+    salida = Terminal()
+    monkeypatch.setattr(sys, 'stdout', salida)
+    with dp.ReporteProgreso(1, "Índices") as progreso:
+        assert not progreso.es_terminal
+        assert sys.stdout is salida
+    assert '\x1b[' not in salida.getvalue()
+
+
+def test_los_elementos_fallidos_cuentan_como_fallidas():
+    progreso = dp.ReporteProgreso(4, "Índices", salida=io.StringIO())
+    for idx, simbolo in progreso.recorrer(['SPY', 'XXXX', 'QQQ', 'YYYY']):
+        if simbolo in ('XXXX', 'YYYY'):
+            continue    # Como los `fallidos += 1; continue` de descargar_indices
+        progreso.marcar_exito()
+    assert (progreso.completadas, progreso.fallidas) == (2, 2)
+    assert progreso.activos == {}
+
+
+def test_descargar_indices_reporta_los_fallidos(tmp_path, monkeypatch):
+    # Yahoo sin datos para el símbolo
+    monkeypatch.setattr(dp, 'historial_yahoo', lambda *a, **k: pd.DataFrame())
+    descargador = dp.DataDownloader()
+    descargador.directo = True
+    descargador.tipo_descarga = 'indices'
+    descargador.instrumentos = ['SPY']
+    descargador.temporalidad = '1d'
+    descargador.ruta_guardado = str(tmp_path)
+    descargador.fecha_inicio, descargador.fecha_fin = dp.datetime(2024, 1, 2), dp.datetime(2024, 1, 10)
+    assert descargador.descargar_indices() == 0
+    assert (descargador.progreso.completadas, descargador.progreso.fallidas) == (0, 1)
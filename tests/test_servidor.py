@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import descargar_pro as dp
+
+
+@pytest.fixture
+def servidor(tmp_path):
+    rng = np.random.default_rng(0)
+    # Timestamps de segundo con muchos ticks repetidos en el mismo instante
+    tiempos = pd.Timestamp('2024-01-02', tz='UTC') + pd.to_timedelta(np.sort(rng.integers(0, 3_600, 20_000)), unit='s')
+    df = pd.DataFrame({'ask': rng.random(20_000) + 1, 'bid': rng.random(20_000)},
+                      index=pd.DatetimeIndex(tiempos, name='timestamp'))
+    carpeta = tmp_path / 'datos_forex'
+    carpeta.mkdir()
+    ruta = str(carpeta / 'EURUSD_tick.csv')
+    df.to_csv(ruta)
+    dp.Catalogo(str(carpeta)).registrar('EURUSD', 'tick', ruta, fin='2024-01-02T01:00:00', filas=len(df))
+    
+    servidor = dp.ServidorDatos(dp.ClienteDatos([str(carpeta)]), puerto=0).iniciar(bloquear=False)
+    yield servidor, dp.leer_datos(ruta)
+    servidor.detener()
+
+
+@pytest.mark.parametrize('limite', (1, 777, 100_000))
+def test_paginacion_sin_perder_ni_repetir_ticks(servidor, limite):
+    servidor, df = servidor
+    cliente = dp.ClienteRemoto(f"http://127.0.0.1:{servidor.puerto}", limite=limite)
+    fin = '2024-01-02T00:05:00' if limite == 1 else None
+    leido = cliente.obtener('EURUSD', 'tick', '2024-01-02T00:00:30', fin)
+    
+    esperado = df[df.index >= '2024-01-02T00:00:30']
+    if fin:
+        esperado = esperado[esperado.index < fin]
+    assert len(leido) == len(esperado)
+    np.testing.assert_allclose(leido[['ask', 'bid']].to_numpy(), esperado[['ask', 'bid']].to_numpy())
+    assert (leido.index == esperado.index).all()
+
+
+def test_errores_y_estadisticas(servidor):
+    servidor, _ = servidor
+    cliente = dp.ClienteRemoto(f"http://127.0.0.1:{servidor.puerto}")
+    with pytest.raises(ConnectionError, match='Formato'):
+        cliente._pedir('/series', {'simbolo': 'EURUSD', 'temporalidad': 'tick', 'formato': 'xml'})
+    cliente.obtener('EURUSD', 'tick', columnas=['bid'])
+    cliente.obtener('EURUSD', 'tick', '2024-01-02T00:10:00')
+    estadisticas = cliente.estadisticas()
+    assert estadisticas['entradas'] == 1 and estadisticas['aciertos'] >= 1
+    assert [s['simbolo'] for s in cliente.catalogo()] == ['EURUSD']
+
+
+def test_catalogo_en_cache_hasta_que_cambia(tmp_path, monkeypatch):
+    carpeta = str(tmp_path)
+    ruta = str(tmp_path / 'SPY_1d.csv')
+    open(ruta, 'w').close()
+    dp.Catalogo(carpeta).registrar('SPY', '1d', ruta)
+    lecturas = []
+    cargar = dp.Catalogo._cargar
+    monkeypatch.setattr(dp.Catalogo, '_cargar', lambda self: lecturas.append(1) or cargar(self))
+    cliente = dp.ClienteDatos([carpeta])
+    
+    for _ in range(5):
+        assert cliente.buscar('SPY', '1d')[1]['archivo'] == 'SPY_1d.csv'
+    assert len(lecturas) == 1
+    assert cliente.buscar('QQQ', '1d') == (None, None)
+    
+    dp.Catalogo(carpeta).registrar('QQQ', '1d', ruta, filas=10)
+    lecturas.clear()
+    assert cliente.buscar('QQQ', '1d')[1]['filas'] == 10
+    assert len(lecturas) == 1
+
+
+def test_los_locks_de_carga_no_se_acumulan(servidor):
+    servidor, _ = servidor
+    for ajuste in ('total', 'splits', 'ninguno'):
+        servidor.consultar('EURUSD', 'tick', ajuste=ajuste, limite=10)
+    assert servidor._cargando == {}
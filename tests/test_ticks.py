@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+import descargar_pro as dp
+
+
+def test_dtk_ida_y_vuelta(tmp_path, ticks):
+    df = ticks(50_000)
+    ruta = str(tmp_path / 'EURUSD.dtk')
+    bloques = dp.escribir_archivo_ticks(df, ruta, 'EURUSD', tamano_bloque=4096)
+    assert bloques == 13
+    
+    leido = dp.ArchivoTicks(ruta).leer()
+    assert leido.index.equals(df.index)
+    for columna in ('ask', 'bid'):
+        np.testing.assert_allclose(leido[columna], df[columna], rtol=0, atol=1e-9)
+    for columna in ('ask_volume', 'bid_volume'):
+        np.testing.assert_array_equal(leido[columna], df[columna])
+
+
+def test_dtk_volumenes_float32_exactos(tmp_path, ticks):
+    df = ticks(5_000)
+    df['ask_volume'] = np.arange(len(df)) / 4
+    ruta = str(tmp_path / 'EURUSD.dtk')
+    dp.escribir_archivo_ticks(df, ruta, 'EURUSD')
+    archivo = dp.ArchivoTicks(ruta)
+    assert archivo.meta['volumen'] == 'f8'
+    df['bid_volume'] = 1.5
+    dp.escribir_archivo_ticks(df, ruta, 'EURUSD')
+    archivo = dp.ArchivoTicks(ruta)
+    assert archivo.meta['volumen'] == 'f4'
+    np.testing.assert_array_equal(archivo.leer()['ask_volume'], df['ask_volume'])
+
+
+def test_dtk_hueco_mayor_que_int32(tmp_path, ticks):
+    # 40 días sin ticks: el delta en ms no entra en int32
+    df = pd.concat([ticks(1_000, inicio='2024-01-02'), ticks(1_000, semilla=1, inicio='2024-02-11')])
+    ruta = str(tmp_path / 'EURUSD.dtk')
+    dp.escribir_archivo_ticks(df, ruta, 'EURUSD')
+    leido = dp.ArchivoTicks(ruta).leer()
+    assert leido.index.equals(df.index)
+    assert list(dp.ArchivoTicks(ruta).iterar())[0].index.equals(df.index)
+
+
+def test_dtk_rango(tmp_path, ticks):
+    df = ticks(30_000)
+    ruta = str(tmp_path / 'EURUSD.dtk')
+    dp.escribir_archivo_ticks(df, ruta, 'EURUSD', tamano_bloque=1000)
+    inicio, fin = df.index[12_345], df.index[23_456]
+    leido = dp.ArchivoTicks(ruta).leer(inicio, fin)
+    esperado = df[(df.index >= inicio) & (df.index <= fin)]
+    assert leido.index.equals(esperado.index)
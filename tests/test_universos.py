@@ -0,0 +1,11 @@
+import descargar_pro as dp
+
+
+def test_universos_solo_con_arroba(tmp_path, monkeypatch):
+    (tmp_path / 'universos').mkdir()
+    (tmp_path / 'universos' / 'tech.txt').write_text('AAPL\nMSFT, BRK.B\n# comentario\n')
+    monkeypatch.chdir(tmp_path)
+    
+    assert dp.resolver_instrumentos(['@tech', '^VIX', 'AAPL']) == ['AAPL', 'MSFT', 'BRK-B', '^VIX']
+    # Sin '@' es el ticker TECH, no el universo
+    assert dp.resolver_instrumentos(['TECH', 'tech']) == ['TECH']
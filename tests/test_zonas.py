@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+import descargar_pro as dp
+
+
+def velas(indice):
+    cierre = 1.1 + np.arange(len(indice)) * 1e-4
+    return pd.DataFrame({'open': cierre, 'high': cierre + 1e-3, 'low': cierre - 1e-3, 'close': cierre,
+                         'volume': 0.0}, index=pd.DatetimeIndex(indice, name='timestamp'))
+
+
+def ida_y_vuelta(df, ruta):
+    """Guarda y relee como lo hace la descarga: leer_datos devuelve UTC"""
+    df.to_csv(ruta)
+    return dp.leer_datos(str(ruta))
+
+
+def test_respaldo_ny17_no_duplica_velas_diarias(tmp_path):
+    fechas = pd.bdate_range('2024-03-01', '2024-04-30')
+    # duka a medianoche UTC (con un hueco) y Yahoo a medianoche de Londres
+    primario = velas(fechas.delete(slice(10, 15)).tz_localize('UTC'))
+    respaldo = velas(fechas.tz_localize('Europe/London'))
+    primario = ida_y_vuelta(dp.normalizar_zona(primario, 'NY17', 'D1'), tmp_path / 'duka.csv')
+    respaldo = ida_y_vuelta(dp.normalizar_zona(respaldo, 'NY17', 'D1'), tmp_path / 'yahoo.csv')
+    
+    df = dp.fusionar_con_respaldo(primario, respaldo, 'D1', 'NY17')
+    assert len(df) == len(fechas)
+    assert not df.index.duplicated().any()
+    assert (df['fuente'] == 'yahoo').sum() == 5
+    assert str(df.index.tz) == 'America/New_York'
+    assert (df.index == df.index.normalize()).all()
+    assert list(df.index.tz_localize(None)) == list(fechas)
+
+
+def test_respaldo_utc_conserva_fechas():
+    fechas = pd.bdate_range('2024-03-01', '2024-04-30')
+    primario = velas(fechas.delete([3, 4]).tz_localize('UTC'))
+    respaldo = dp.normalizar_datos(velas(fechas.tz_localize('Europe/London')))
+    df = dp.fusionar_con_respaldo(primario, respaldo, 'D1')
+    assert list(df.index.tz_convert(None)) == list(fechas)
+    assert (df['fuente'] == 'yahoo').sum() == 2
+
+
+def test_cliente_devuelve_la_zona_del_catalogo(tmp_path):
+    fechas = pd.bdate_range('2024-03-01', '2024-03-29')
+    df = dp.normalizar_zona(velas(fechas.tz_localize('UTC')), 'NY17', 'D1')
+    ruta = str(tmp_path / 'EURUSD_D1.csv')
+    df.to_csv(ruta)
+    dp.Catalogo(str(tmp_path)).registrar('EURUSD', 'D1', ruta, fuente='dukascopy', zona='NY17')
+    
+    leido = dp.ClienteDatos([str(tmp_path)]).obtener('EURUSD', 'D1', ajuste='ninguno')
+    assert str(leido.index.tz) == 'America/New_York'
+    assert leido.index.equals(df.index)